@@ -67,33 +67,36 @@ from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
 import matplotlib.pyplot as plt
 get_ipython().run_line_magic('matplotlib', 'inline')
 
-vaers_data_2021 = pd.read_csv('/Users/tenzin/Downloads/2021VAERSData_1/2021VAERSDATA.csv', encoding='latin1')
-vaers_symptoms_2021 = pd.read_csv('/Users/tenzin/Downloads/2021VAERSData_1/2021VAERSSYMPTOMS.csv', encoding='latin1')
-vaers_vaccine_2021 = pd.read_csv('/Users/tenzin/Downloads/2021VAERSData_1/2021VAERSVAX.csv', encoding='latin1')
+# Only a small part of VAERS is about the COVID vaccines, so rather than loading
+# every table in full the loader streams the VAX files, keeps the COVID19 rows
+# and then only pulls the DATA / SYMPTOMS rows for those VAERS_IDs
+# (vaers/stream.py). Files that are already in the Parquet cache are read from it.
+# Every year's files are found under the folder (vaers/registry.py) and each year
+# is loaded on its own core.
 
-vaers_data_2020 = pd.read_csv('/Users/tenzin/Downloads/2020VAERSData/2020VAERSDATA.csv', encoding='latin1')
-vaers_symptoms_2020 = pd.read_csv('/Users/tenzin/Downloads/2020VAERSData/2020VAERSSYMPTOMS.csv', encoding='latin1')
-vaers_vaccine_2020 = pd.read_csv('/Users/tenzin/Downloads/2020VAERSData/2020VAERSVAX.csv', encoding='latin1')
+from vaers.registry import load_covid
+
+covid_tables = load_covid('/Users/tenzin/Downloads', years=[2020, 2021])
 
 
 # In[2]:
 
 
-# We're going to combine the 2020 & 2021 datasets together by the COVID ID
+# We're going to combine the 2020 & 2021 datasets together by the COVID ID (the loader already concatenated the years)
 
 
-combined_vaccine = pd.concat([vaers_vaccine_2020, vaers_vaccine_2021], axis=0)
+combined_vaccine = covid_tables['VAX']
 
-combined_symptoms = pd.concat([vaers_symptoms_2020, vaers_symptoms_2021])
+combined_symptoms = covid_tables['SYMPTOMS']
 
-combined_data = pd.concat([vaers_data_2020, vaers_data_2021])
+combined_data = covid_tables['DATA']
 
 
 # In[3]:
 
 
-# Only people that have recived the COVID vaccine, eliminating the others 
-combined_vaccine = combined_vaccine[combined_vaccine['VAX_TYPE'] == 'COVID19']
+# Only people that have recived the COVID vaccine, eliminating the others (done while loading)
+assert (combined_vaccine['VAX_TYPE'] == 'COVID19').all()
 
 
 # ### Combining Data sets, investigating duplicates, and removing superflous columns 
@@ -116,22 +119,40 @@ master_df = combined_vaccine.merge(combined_data,on='VAERS_ID')
 
 len(master_df)
 
+# The columns are loaded with compact types (vaers/schema.py): DIED, HOSPITAL etc. are True/False
+# instead of 'Y'/NaN, codes like SEX and VAX_MANU are categories and the dates are real dates.
+# The report below shows how much memory that saves on the 2021 DATA file compared to reading it as text
+
+from vaers.cache import read_source
+from vaers.registry import discover
+from vaers.schema import memory_report
+
+data_2021 = discover('/Users/tenzin/Downloads', years=[2021])[2021].paths['DATA']
+memory_report(read_source(data_2021, apply_schema=False))
+
+# Symptom index for the coded symptoms (see below)
+
+from vaers.symptoms import SymptomIndex, melt
+
+symptom_index_long = melt(combined_symptoms)
+symptom_index = SymptomIndex.from_long(symptom_index_long)
+
 
 # Upon investigation of the VAERS Symptoms data I decided to remove it as it created over 3000 duplicates when joined with the total dataframe. If we need to investigate into symptoms further we can always add the DF's together at 'VAERS_ID'. 
+# 
+# Instead of joining it, the coded symptoms are kept in a long table (one row per report & symptom) with an index from each symptom to the VAERS_IDs that reported it (vaers/symptoms.py). That way we can ask e.g. "which hospitalized reports mention Myocarditis" without blowing up master_df.
+
 
 # In[5]:
 
 
-# Create a Boolean series, then loop through and find the index of the duplicates
+# Create a Boolean series and count the duplicates (one extra row per additional vaccine on the report)
+
+from vaers.dedup import dedupe
 
 boolean = master_df.duplicated(subset=['VAERS_ID'])
 
-index_of_duplicates = []
-for index,b in enumerate(boolean):
-    if b == True: 
-        index_of_duplicates.append(index)
-    
-len(index_of_duplicates)    
+boolean.sum()
 
 
 # In[6]:
@@ -154,7 +175,14 @@ master_df[master_df['VAERS_ID'] == 906428]
 # In[7]:
 
 
-master_df = master_df.drop(index_of_duplicates)
+# drop() works on index labels, and those repeat after the concat, so dedupe by position instead
+master_df, dedupe_report = dedupe(master_df, policy='first')
+print(dedupe_report)
+
+# count the reports per vaccine lot and week before VAX_LOT is dropped (see vaers/lots.py)
+from vaers.lots import LotCounts, lot_signals
+
+lot_counts = LotCounts.from_frame(master_df)
 master_df = master_df.drop(columns=['VAX_TYPE', 'VAX_LOT', 'VAX_NAME'], axis=1)
 
 
@@ -164,7 +192,7 @@ master_df = master_df.drop(columns=['VAX_TYPE', 'VAX_LOT', 'VAX_NAME'], axis=1)
 #Re-ordering the columns
 master_df.columns
 
-new_column_order = ['VAX_MANU', 'AGE_YRS', 'CAGE_YR', 'CAGE_MO', 'SEX', 'RPT_DATE',
+new_column_order = ['VAERS_ID', 'VAX_MANU', 'AGE_YRS', 'CAGE_YR', 'CAGE_MO', 'SEX', 'RPT_DATE',
        'SYMPTOM_TEXT', 'DIED', 'DATEDIED', 'L_THREAT', 'ER_VISIT', 'HOSPITAL',
        'HOSPDAYS', 'X_STAY', 'DISABLE', 'RECOVD', 'VAX_DATE', 'ONSET_DATE',
        'NUMDAYS', 'LAB_DATA', 'V_ADMINBY', 'V_FUNDBY', 'OTHER_MEDS', 'CUR_ILL',
@@ -186,23 +214,19 @@ master_df = master_df.reindex(columns=new_column_order)
 # In[9]:
 
 
-master_df[(master_df['HOSPITAL'] == 'Y') & (master_df['AGE_YRS'] < 40)]
+master_df[master_df['HOSPITAL'] & (master_df['AGE_YRS'] < 40)]
 
 
 # In[10]:
 
 
-# Other Meds column, lower case + replace
+# Other Meds, Lab Data, History, Cur Ill & Symptom Text columns, lower case + replace.
+# The synonyms ('htn' -> 'hypertension' etc.) live in vaers/data/normalize_rules.json,
+# and each column is cleaned in one pass over its distinct values.
 
-master_df['OTHER_MEDS'] = master_df['OTHER_MEDS'].str.lower().replace('no', 'none').replace(r'[,-/]', ' ', regex=True).replace(np.nan, '', regex=True)
+from vaers.normalize import normalize
 
-master_df['LAB_DATA'] = master_df['LAB_DATA'].str.lower().replace(['no', 'none.', 'na', 'n/a', 'none yet', 'none at this time'], 'none').replace(',', '')
-
-master_df['HISTORY'] = master_df['HISTORY'].str.lower().replace(['no', 'none reported', 'none.', 'na', 'n/a', 'none known', 'comments: list of non-encoded patient relevant history: patient other relevant history 1: none, comment: patient history: no'], 'none').replace('medical history/concurrent conditions: covid-19', 'covid19').replace(['medical history/concurrent conditions: hypertension', 'htn', 'high blood pressure'], 'hypertension').replace('medical history/concurrent conditions: penicillin allergy', 'penicillin allergy').replace(['medical history/concurrent conditions: asthma', 'exercise induced asthma'], 'asthma').replace('hypothyroid', 'hypothyroidism').replace(',', '').replace(r'[,-/]', ' ', regex=True).replace(np.NaN, 'unknown')
-
-master_df['CUR_ILL'] = master_df['CUR_ILL'].str.lower().replace(['no', 'n/a', 'none.', 'none reported', 'none known', 'nothing'], 'none')
-
-master_df['SYMPTOM_TEXT'] = master_df['SYMPTOM_TEXT'].str.lower().astype(str)
+master_df = normalize(master_df, columns=['OTHER_MEDS', 'LAB_DATA', 'HISTORY', 'CUR_ILL', 'SYMPTOM_TEXT'])
 
 
 # In[11]:
@@ -222,28 +246,17 @@ master_df['HISTORY'].head()
 # In[12]:
 
 
-import itertools
-
-def oneDArray(x):
-    return list(itertools.chain(*x))
+# Tokenize the symptom text once into a sparse report x word matrix (vaers/tokens.py),
+# any subset of reports (hospitalized, died, ...) is then counted from the same matrix
 
-words = master_df['SYMPTOM_TEXT'].str.findall("\w+")
-words = list(itertools.chain(words))
-words = oneDArray(words)
+from vaers.tokens import TokenMatrix
 
-frequency_symptom = {}
+symptom_tokens = TokenMatrix.from_series(master_df['SYMPTOM_TEXT'])
 
-for w in words:
-    if w in frequency_symptom:
-        frequency_symptom[w] += 1
-    else:
-        frequency_symptom[w] = 1
-        
-freq_symptom_series = pd.Series(data=frequency_symptom)
-freq_symptom_series_sorted = freq_symptom_series.sort_values(ascending=False)
+freq_symptom_series_sorted = symptom_tokens.counts()
 
 list_of_words = []   
-for index, items in freq_symptom_series_sorted.iteritems():
+for index, items in freq_symptom_series_sorted.items():
     list_of_words.append(index)
     if index == 'joint':
         break    
@@ -255,26 +268,17 @@ for index, items in freq_symptom_series_sorted.iteritems():
 # In[13]:
 
 
-# Creating a list of words to create a Word Cloud
+# Creating the Word Clouds. The stopword list is shared (vaers/data/stopwords.json, with the few extra words
+# each cloud dropped above kept per cloud) and the
+# clouds are drawn from the word counts above rather than from one giant joined string.
+# All three clouds (symptoms for everyone, history for hospitalized & died) are rendered
+# in one go and saved as PNGs in figures/
 
-text = " ".join(review for review in master_df['SYMPTOM_TEXT'])
-print ("There are {} words in the combination of all review.".format(len(text)))
+from vaers.wordclouds import render_clouds
 
-#Create list of Stopwords 
-stopwords = set(STOPWORDS)
-stopwords.update(['admitted', 'emergency', 'discharged','concomitant','female','the', 'and', 'of', 'to', 'was', 'patient', 'a', 'on', 'for', 'covid', 'she', 'vaccine', 'in', 'at', '19', 'not', 'i', 'with', 'is', 'this', 'as', 'had', 'dose', 'after', 'no', 'her', 'that', 'received', 'reported', 'pfizer', 'it', 'an', 'from', 'arm', 'events', 'bnt162b2', 'report', 'my', 'vaccination', 'left', 's', 'injection', 'were', '12', 'he', 'unspecified', 'symptoms', 'lot', 'history', 'felt', 'medical', 'has', 'be', 'up', 'hours', 'first', 'any', 'but', 'day', 'number', 'unknown', 'minutes', 'or', 'outcome', '1', 'medications', 'other', 'about', 'positive', 'body','started', 'information', 'spontaneous', 'single', 'contactable', 'have', 'biontech', 'site', '2', 'administration', 'feeling', 'right', 'did', 'tested', 'included', 'been', 'like', 'date', 'event', 'via', 'experienced', 'then', 'days', 'if', 'prior', 'immunization','30', 'year', 'within', 'all', 'by', 'route', 'went', '10', 'back', 'got', 'took', '4', 'time', '20', 'given', 'batch', '5', 'benadryl', '3', 'tingling', '15', 't', 'also', 'side', 'still', 'hospital', 'treatment', '00', 'will', 'safety', 'around', 'stated', '2020', 'part', 'test', 'pt', 'nurse', 'developed', 'review', 'his', 'am', 'appropriate', 'well', 'weeks', 'receiving', 'adverse', 'when', 'resolved', 'there', 'home', 'second', 'blood', 'er', 'muscle', 'face', 'they', 'since', 'which', 'morning', 'requested', 'comments', 'work', 'sender', 'neck', 'very', 'are', 'night', 'some', 'post', 'normal', 'breath', 'later', 'ed', 'bp', 'out', 'next', 'get', 'down', 'cannot', 'response', 'taken', 'consumer', 'product', 'over', 'so', '21', 'having', 'feel', 'diagnosed', 'same', 'rate', 'including', 'better', 'evaluation', 'possible', 'non', 'age', 'soreness', 'just', 'began', '100', 'mg', 'administered', 'receive', '24', 'woke', '6', 'hives', 'cough', 'procedures', 'approximately', 'room', 'tongue', 'physician', 'tylenol', '18dec2020', 'pm', 'notified', 'allergies', 'follow', 'medication', 'today', 'evaluated', 'vaccines', 'shot', 'action', 'shortness', 'joint'
-"vaccination", "pfizer", "biontech", "dose", "report", "covid", "event","patient","vaccine","single", "medical", "day","unknown","mg","daily","none","i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "her", "hers", "herself", "it", "its", "itself", "they", "them", "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that", "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against", "between", "into", "through", "during", "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once", "here", "there", "when", "where", "why", "how", "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "should", "now"])
+wordcloud_paths = render_clouds(master_df, 'figures', matrices={'SYMPTOM_TEXT': symptom_tokens})
 
-
-# Generate a word cloud image
-wordcloud = WordCloud(stopwords=stopwords, background_color="white",width=1200,height=1000).generate(text)
-
-# Display the generated image:
-# the matplotlib way:
-plt.figure(figsize=(15,10))
-plt.imshow(wordcloud, interpolation='bilinear')
-plt.axis("off")
-plt.show()
+Image.open(wordcloud_paths['all_symptoms'])
 
 
 # We're now going to investigate some of the more common symptoms of people that had a severe reaction (defined as: hospitalization) and those that eventually died. 
@@ -282,25 +286,12 @@ plt.show()
 # In[14]:
 
 
-hospitalized = master_df[master_df['HOSPITAL'] == 'Y'] 
-
-words_hospital = hospitalized['SYMPTOM_TEXT'].str.findall("\w+")
-words_hospital = list(itertools.chain(words_hospital))
-words_hospital = oneDArray(words_hospital)
-
-frequency_hospital = {}
+hospitalized = master_df[master_df['HOSPITAL']] 
 
-for w in words_hospital:
-    if w in frequency_hospital:
-        frequency_hospital[w] += 1
-    else:
-        frequency_hospital[w] = 1
-        
-freq_hospital_series = pd.Series(data=frequency_hospital)
-freq_hospital_series_sorted = freq_hospital_series.sort_values(ascending=False)
+freq_hospital_series_sorted = symptom_tokens.counts(master_df['HOSPITAL'])
 
 list_of_words_1 = []   
-for index, items in freq_hospital_series_sorted.iteritems():
+for index, items in freq_hospital_series_sorted.items():
     if index not in list_of_words:
         list_of_words_1.append(index)
     elif index == 'just':
@@ -310,28 +301,9 @@ for index, items in freq_hospital_series_sorted.iteritems():
 # In[15]:
 
 
-# Creating a list of words to create a Word Cloud
-
-get_ipython().run_line_magic('matplotlib', 'inline')
-
-text_4 = " ".join(review for review in hospitalized['HISTORY'])
-
+# Word Cloud of the history of hospitalized patients (rendered with the others in In[13])
 
-#Create list of Stopwords 
-stopwords = set(STOPWORDS)
-stopwords.update(['conditions','concurrent','disease',' unkown', 'chronic','unknown', 'emergency', 'discharged','concomitant','female','the', 'and', 'of', 'to', 'was', 'patient', 'a', 'on', 'for', 'covid', 'she', 'vaccine', 'in', 'at', '19', 'not', 'i', 'with', 'is', 'this', 'as', 'had', 'dose', 'after', 'no', 'her', 'that', 'received', 'reported', 'pfizer', 'it', 'an', 'from', 'arm', 'events', 'bnt162b2', 'report', 'my', 'vaccination', 'left', 's', 'injection', 'were', '12', 'he', 'unspecified', 'symptoms', 'lot', 'history', 'felt', 'medical', 'has', 'be', 'up', 'hours', 'first', 'any', 'but', 'day', 'number', 'unknown', 'minutes', 'or', 'outcome', '1', 'medications', 'other', 'about', 'positive', 'body','started', 'information', 'spontaneous', 'single', 'contactable', 'have', 'biontech', 'site', '2', 'administration', 'feeling', 'right', 'did', 'tested', 'included', 'been', 'like', 'date', 'event', 'via', 'experienced', 'then', 'days', 'if', 'prior', 'immunization','30', 'year', 'within', 'all', 'by', 'route', 'went', '10', 'back', 'got', 'took', '4', 'time', '20', 'given', 'batch', '5', 'benadryl', '3', 'tingling', '15', 't', 'also', 'side', 'still', 'hospital', 'treatment', '00', 'will', 'safety', 'around', 'stated', '2020', 'part', 'test', 'pt', 'nurse', 'developed', 'review', 'his', 'am', 'appropriate', 'well', 'weeks', 'receiving', 'adverse', 'when', 'resolved', 'there', 'home', 'second', 'blood', 'er', 'muscle', 'face', 'they', 'since', 'which', 'morning', 'requested', 'comments', 'work', 'sender', 'neck', 'very', 'are', 'night', 'some', 'post', 'normal', 'breath', 'later', 'ed', 'bp', 'out', 'next', 'get', 'down', 'cannot', 'response', 'taken', 'consumer', 'product', 'over', 'so', '21', 'having', 'feel', 'diagnosed', 'same', 'rate', 'including', 'better', 'evaluation', 'possible', 'non', 'age', 'soreness', 'just', 'began', '100', 'mg', 'administered', 'receive', '24', 'woke', '6', 'hives', 'cough', 'procedures', 'approximately', 'room', 'tongue', 'physician', 'tylenol', '18dec2020', 'pm', 'notified', 'allergies', 'follow', 'medication', 'today', 'evaluated', 'vaccines', 'shot', 'action', 'shortness', 'joint'
-"vaccination", "pfizer", "biontech", "dose", "report", "covid", "event","patient","vaccine","single", "medical", "day","unknown","mg","daily","none","i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "her", "hers", "herself", "it", "its", "itself", "they", "them", "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that", "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against", "between", "into", "through", "during", "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once", "here", "there", "when", "where", "why", "how", "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "should", "now"])
-
-
-# Generate a word cloud image
-wordcloud_1 = WordCloud(stopwords=stopwords, background_color="white",width=1200,height=1000).generate(text_4)
-
-# Display the generated image:
-# the matplotlib way:
-plt.figure(figsize=(15,10))
-plt.imshow(wordcloud_1, interpolation='bilinear')
-plt.axis("off")
-plt.show()
+Image.open(wordcloud_paths['hospitalized_history'])
 
 
 # And now investigating the words that are most prominent when the patient died of the Vaccine. 
@@ -339,47 +311,17 @@ plt.show()
 # In[16]:
 
 
-died = master_df[master_df['DIED'] == 'Y'] 
-
-words_died = died['SYMPTOM_TEXT'].str.findall("\w+")
-words_died = list(itertools.chain(words_died))
-words_died = oneDArray(words_died)
+died = master_df[master_df['DIED']] 
 
-frequency_died = {}
-
-for w in frequency_died:
-    if w in frequency_died:
-        frequency_died[w] += 1
-    else:
-        frequency_died[w] = 1
-        
-freq_died_series = pd.Series(data=frequency_died)
-freq_died_series_sorted = freq_died_series.sort_values(ascending=False)
+freq_died_series_sorted = symptom_tokens.counts(master_df['DIED'])
 
 
 # In[17]:
 
 
-# Creating a list of words to create a Word Cloud
-
-text_2 = " ".join(review for review in died['HISTORY'])
-
+# Word Cloud of the history of patients that died (rendered with the others in In[13])
 
-#Create list of Stopwords 
-stopwords = set(STOPWORDS)
-stopwords.update([' unkown', 'chronic','unknown', 'emergency', 'discharged','concomitant','female','the', 'and', 'of', 'to', 'was', 'patient', 'a', 'on', 'for', 'covid', 'she', 'vaccine', 'in', 'at', '19', 'not', 'i', 'with', 'is', 'this', 'as', 'had', 'dose', 'after', 'no', 'her', 'that', 'received', 'reported', 'pfizer', 'it', 'an', 'from', 'arm', 'events', 'bnt162b2', 'report', 'my', 'vaccination', 'left', 's', 'injection', 'were', '12', 'he', 'unspecified', 'symptoms', 'lot', 'history', 'felt', 'medical', 'has', 'be', 'up', 'hours', 'first', 'any', 'but', 'day', 'number', 'unknown', 'minutes', 'or', 'outcome', '1', 'medications', 'other', 'about', 'positive', 'body','started', 'information', 'spontaneous', 'single', 'contactable', 'have', 'biontech', 'site', '2', 'administration', 'feeling', 'right', 'did', 'tested', 'included', 'been', 'like', 'date', 'event', 'via', 'experienced', 'then', 'days', 'if', 'prior', 'immunization','30', 'year', 'within', 'all', 'by', 'route', 'went', '10', 'back', 'got', 'took', '4', 'time', '20', 'given', 'batch', '5', 'benadryl', '3', 'tingling', '15', 't', 'also', 'side', 'still', 'hospital', 'treatment', '00', 'will', 'safety', 'around', 'stated', '2020', 'part', 'test', 'pt', 'nurse', 'developed', 'review', 'his', 'am', 'appropriate', 'well', 'weeks', 'receiving', 'adverse', 'when', 'resolved', 'there', 'home', 'second', 'blood', 'er', 'muscle', 'face', 'they', 'since', 'which', 'morning', 'requested', 'comments', 'work', 'sender', 'neck', 'very', 'are', 'night', 'some', 'post', 'normal', 'breath', 'later', 'ed', 'bp', 'out', 'next', 'get', 'down', 'cannot', 'response', 'taken', 'consumer', 'product', 'over', 'so', '21', 'having', 'feel', 'diagnosed', 'same', 'rate', 'including', 'better', 'evaluation', 'possible', 'non', 'age', 'soreness', 'just', 'began', '100', 'mg', 'administered', 'receive', '24', 'woke', '6', 'hives', 'cough', 'procedures', 'approximately', 'room', 'tongue', 'physician', 'tylenol', '18dec2020', 'pm', 'notified', 'allergies', 'follow', 'medication', 'today', 'evaluated', 'vaccines', 'shot', 'action', 'shortness', 'joint'
-"vaccination", "pfizer", "biontech", "dose", "report", "covid", "event","patient","vaccine","single", "medical", "day","unknown","mg","daily","none","i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "her", "hers", "herself", "it", "its", "itself", "they", "them", "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that", "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against", "between", "into", "through", "during", "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once", "here", "there", "when", "where", "why", "how", "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "should", "now"])
-
-
-# Generate a word cloud image
-wordcloud_2 = WordCloud(stopwords=stopwords, background_color="white",width=1200,height=1000).generate(text_2)
-
-# Display the generated image:
-# the matplotlib way:
-plt.figure(figsize=(15,10))
-plt.imshow(wordcloud_2, interpolation='bilinear')
-plt.axis("off")
-plt.show()
+Image.open(wordcloud_paths['died_history'])
 
 
 # Taking a look at the word cloud above we can see that the word 'heart' is mentioned quite frequently. We're going to dig through the 'deaths' dataframe to see if there is a prominent amount of patients that had heart problems
@@ -397,13 +339,31 @@ died[died['HISTORY'].str.contains('heart', case=False, regex=False, na=False)].h
 # In[19]:
 
 
-searchfor = ['heart', 'htn', 'hypertension'] 
-heart_deaths = len(died[died['HISTORY'].str.contains('|'.join(searchfor))])
+# The keywords for each condition (heart, htn, hypertension, afib, ... for 'cardiac') live in
+# vaers/data/conditions.json. All of them are looked for in one pass over HISTORY instead of
+# one str.contains per condition, and the match ignores case so 'HTN' counts too.
+# The heart percentage keeps the original three search terms so it stays the same number as before;
+# the wider 'cardiac' group (afib, chf, coronary, ...) is printed next to it
+
+from vaers.conditions import flag_conditions
+
+searchfor = ['heart', 'htn', 'hypertension']
+condition_flags = flag_conditions(died, ['HISTORY'])
+heart_deaths = flag_conditions(died, ['HISTORY'], {'heart': {'keywords': searchfor}})['heart'].sum()
 
 print(len(died))
-len(master_df[master_df['DIED'] == 'Y'])
+master_df['DIED'].sum()
 
 print("History of heart complications was present in {}% of the patients.".format(round((heart_deaths / len(died))*100,2)))
+print("Any cardiac condition (the wider 'cardiac' group): {}%".format(round((condition_flags['cardiac'].sum() / len(died))*100,2)))
+
+# The coded symptoms (MedDRA terms) that were reported most often for the patients that died
+
+symptom_index.counts(within=died['VAERS_ID']).head(20)
+
+# Share of the patients that died with each pre-existing condition in their history
+
+(condition_flags.mean() * 100).round(2).sort_values(ascending=False)
 
 
 # From here we can see that quite a few of the people that have died have pre-existing health conditions & are generally older. We're going to dig into age of people of that have had severe reactions to the vaccine. 
@@ -416,31 +376,25 @@ print("History of heart complications was present in {}% of the patients.".forma
 # In[20]:
 
 
-# Going to create an age bracket function to sort based on age 
-
-def age_bracket_funct(number):
-    
-    if number < 17.0:
-        return '<17'
-    elif number >= 18.0 and number <= 29.0:
-        return '18-29'
-    elif number >= 30.0 and number <= 39.0:
-        return '30-39'
-    elif number >= 40.0 and number <= 49.0:
-        return '40-49'
-    elif number >= 50.0 and number <= 64.0:
-        return '50-64'
-    elif number >= 65.0 and number <= 74.0:
-        return '65-74'
-    elif number >= 75.0 and number <= 84.0:
-        return '75-84'
-    elif number > 85.0:
-        return '85+'
-    else: return 'not known'
-    
-master_df['AGE_BRACKET'] = master_df['AGE_YRS'].apply(age_bracket_funct)
-died['AGE_BRACKET'] = died['AGE_YRS'].apply(age_bracket_funct)
-hospitalized['AGE_BRACKET'] = hospitalized['AGE_YRS'].apply(age_bracket_funct)
+# Going to sort based on age brackets. The brackets are assigned once on master_df as an
+# ordered category (vaers/brackets.py), the hospitalized / died subsets are then taken from
+# master_df again so they carry the column along
+
+from vaers import brackets
+
+brackets.assign(master_df, 'notebook')
+
+hospitalized = master_df[master_df['HOSPITAL']]
+died = master_df[master_df['DIED']]
+
+# All the charts below count reports & outcomes (died, hospitalized, ...) by manufacturer, age bracket,
+# sex, state or dose. Those counts are computed once here into a cube (vaers/cube.py); the charts then
+# just add up the parts of the cube they need instead of going back over every report
+
+from vaers.cube import OutcomeCube
+
+outcome_cube = OutcomeCube.from_frame(master_df)
+age_bracket_outcomes = outcome_cube.rollup('AGE_BRACKET')
 
 
 # Creating a bar chart for age in general then those with severe symptoms & death. 
@@ -456,13 +410,13 @@ get_ipython().run_line_magic('matplotlib', 'inline')
 fig, axes = plt.subplots(1, 3, figsize=(25, 5), sharey=False)
 fig.suptitle('Frequency based on condition')
 
-sns.countplot(x='AGE_BRACKET', data=master_df, order=['<17', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+', 'not known'], ax=axes[0])
+sns.barplot(x=age_bracket_outcomes.index, y=age_bracket_outcomes['REPORTS'], order=brackets.labels('notebook'), ax=axes[0])
 axes[0].set_title('Total Population')
 
-sns.countplot(x='AGE_BRACKET', data=hospitalized, order=['<17', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+', 'not known'], ax=axes[1])
+sns.barplot(x=age_bracket_outcomes.index, y=age_bracket_outcomes['HOSPITAL'], order=brackets.labels('notebook'), ax=axes[1])
 axes[1].set_title('Hospitalization response')
 
-sns.countplot(x='AGE_BRACKET', data=died, order=['<17', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+', 'not known'], ax=axes[2])
+sns.barplot(x=age_bracket_outcomes.index, y=age_bracket_outcomes['DIED'], order=brackets.labels('notebook'), ax=axes[2])
 axes[2].set_title('Death response')
 
 
@@ -488,10 +442,16 @@ axes[2].set_title('Death response')
 
 
 # Parsing out from the CDC dataset relevant data around COVID & 'Our World in Data' - need to make sure the dates line up
-owid = pd.read_csv('https://covid.ourworldindata.org/data/owid-covid-data.csv')
-owid_us = owid.iloc[72034]
+# The OWID / CDC files are kept as local snapshots (vaers/reference.py) and only re-downloaded
+# once a day if they changed upstream. Looking the US row up by date instead of by row number
+# (it was owid.iloc[72034]) keeps working as the file grows. 14 May 2021 matches the CDC tables.
+from vaers.reference import ReferenceStore
 
-cdc_deaths = pd.read_csv('Provisional_COVID-19_Death_Counts_by_Sex__Age__and_State.csv')
+reference = ReferenceStore()
+
+owid_us = reference.owid_row('United States', date='2021-05-14')
+
+cdc_deaths = reference.load('cdc_deaths')
 all_ages_deaths = cdc_deaths.head(17)
 
 all_ages_deaths
@@ -515,7 +475,7 @@ print((fraction_of_pop_covid*fraction_of_covid_died)*100)
 
 new_ad['percentage_death'] = new_ad['COVID-19 Deaths'] / owid_us['total_cases']
 
-test = (died['AGE_BRACKET'].value_counts()/len(master_df))*100
+test = (age_bracket_outcomes['DIED']/len(master_df))*100
 
 new_ad['percentage_death']
 
@@ -528,7 +488,7 @@ get_ipython().run_line_magic('matplotlib', 'inline')
 fig, axes = plt.subplots(1, 2, figsize=(50, 10), sharey=False, dpi=100)
 
 
-sns.countplot(x='AGE_BRACKET', data=died, order=['<17', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+', 'not known'], ax=axes[0])
+sns.barplot(x=age_bracket_outcomes.index, y=age_bracket_outcomes['DIED'], order=brackets.labels('notebook'), ax=axes[0])
 axes[0].set_title('Vaccine deaths')
 
 sns.barplot(x='Age Group', y='COVID-19 Deaths', data=new_ad, ax=axes[1])
@@ -546,17 +506,9 @@ axes[1].set_title('COVID deaths')
 
 # We're going to compile a table with relative risks laid out so people can compare and get a better sense 
 
-import requests
-
-header = {
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36" ,
-    'referer':'https://www.google.com/'
-}
-
-response = requests.get('https://injuryfacts.nsc.org/all-injuries/preventable-death-overview/odds-of-dying/', headers=header)
-content = response.content
+# Scraped once into the reference snapshots rather than on every run
 
-odds_dying = pd.read_html(content)[0]
+odds_dying = reference.load('nsc_odds')
 list_of_indexes = [0,1,3,4,6,8,13,15,17,18,20,22,23]
 
 odds_dying = odds_dying.iloc[list_of_indexes, :].reset_index(drop=True)
@@ -581,70 +533,37 @@ covid_risk_df
 # In[27]:
 
 
-cases_age_group = pd.read_csv('/Users/tenzin/Downloads/cases_by_age_group.csv', header=2)
-deaths_age_group = pd.read_csv('/Users/tenzin/Downloads/deaths_by_age_group.csv', header=2)
-age_groups_vaccine_admin = pd.read_csv('/Users/tenzin/Downloads/age_groups_of_people_with_at_least_one_dose_administered.csv', header=2)
+# The CDC tables (people with at least one dose, COVID cases & COVID deaths by age group) are read and lined up
+# on the age groups of the dose table in one go (vaers/rates.py). The finer groups of the case / death tables
+# (0-4 & 5-17, 75-84 & 85+) are added together instead of being patched by hand
 
-#cases_age_group['Percentage of death'] = (deaths_age_group['Count of deaths'] / cases_age_group['Count of cases'])*100
+from vaers.rates import cdc_age_denominators
 
-deaths_age_group
+cdc_age_groups = cdc_age_denominators('/Users/tenzin/Downloads')
+cdc_age_groups
 
 
 # In[28]:
 
 
-deaths_age_group.iloc[1] = ['<18', 0.1, 494, 19.3]
-deaths_age_group.iloc[7] = ['75+', 58.9, 272345, 6.9]
-deaths_age_group = deaths_age_group.drop([0,8]).reset_index()
+# Vaccine deaths counted with the CDC's age groups (75+ rather than 75-84 & 85+), so no labels need fixing up
 
-cases_age_group.iloc[1] = ['<18', 12.3, 3198300, 16.3]
-cases_age_group.iloc[7] = ['75+', 6.2, 1594434, 6.9]
-cases_age_group = cases_age_group.drop([0,8]).reset_index()
+brackets.assign(master_df, 'cdc', out='AGE_GROUP_CDC')
 
-deaths_age_group = deaths_age_group.drop('index', 1)
-
-deaths_age_group
+died_by_cdc_group = OutcomeCube.from_frame(master_df, ['AGE_GROUP_CDC']).rollup('AGE_GROUP_CDC')
+died_by_cdc_group
 
 
 # In[29]:
 
 
-cases_age_group['Count of deaths'] = deaths_age_group['Count of deaths']
-cases_age_group['Percentage of deaths to cases'] = (cases_age_group['Count of deaths'] / cases_age_group['Count of cases'])*100
-
-
-cases_age_group
-
-
-# In[30]:
-
-
-age_groups_vaccine_admin = age_groups_vaccine_admin.reindex(index=[6,5,4,3,2,1,0]).reset_index()
-
-age_groups_vaccine_died = died['AGE_BRACKET'].value_counts()
-
-age_groups_vaccine_died = age_groups_vaccine_died.reindex(index=['<17', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+', 'not known'])
-
-age_groups_vaccine_died['75-84'] = 1814
-age_groups_vaccine_died = age_groups_vaccine_died.drop(labels='85+').rename(index={'75-84': '75+'})
-
-#age_groups_vaccine_admin['Percentage deaths'] = (age_groups_vaccine_admin['# Persons at least One Dose'] / age_groups_vaccine_died)*100
-age_groups_vaccine_died
+# Deaths per 100,000 people for every age group at once, with exact 95% confidence intervals:
+# vaccine deaths per 100k people with at least one dose & COVID deaths per 100k COVID cases
 
+from vaers.rates import age_group_death_rates
 
-# In[31]:
-
-
-#for p in age_groups_vaccine_admin:
-
-age_groups_vaccine_admin['Cases_died'] = 0
-
-counter = 0
-for p in range(0,7):
-    age_groups_vaccine_admin['Cases_died'][p] = age_groups_vaccine_died[p]
-    
-age_groups_vaccine_admin['Percentage Died from Vaccine'] = (age_groups_vaccine_admin['Cases_died']/age_groups_vaccine_admin['# Persons at least One Dose'])*100
-age_groups_vaccine_admin['Percentage Died from COVID'] = cases_age_group['Percentage of deaths to cases']
+age_groups_vaccine_admin = age_group_death_rates(died_by_cdc_group, cdc_age_groups)
+age_groups_vaccine_admin
 
 
 # In[32]:
@@ -653,13 +572,15 @@ age_groups_vaccine_admin['Percentage Died from COVID'] = cases_age_group['Percen
 import matplotlib
 from matplotlib import pyplot as plt
 
+ax = age_groups_vaccine_admin.plot.line(x='AGE_GROUP_CDC', y=['DIED_RATE', 'COVID_DEATHS_RATE'], figsize=(7,5), logy=True)
 
+# shaded: 95% confidence interval
+for measure in ['DIED', 'COVID_DEATHS']:
+    ax.fill_between(range(len(age_groups_vaccine_admin)), age_groups_vaccine_admin[measure + '_LOWER'], age_groups_vaccine_admin[measure + '_UPPER'], alpha=0.2)
 
-
-ax = age_groups_vaccine_admin.plot.line(x='Age Group', y=['Percentage Died from Vaccine', 'Percentage Died from COVID'], figsize=(7,5),logy=True, ylim=(0.0001, 100))
-#ax.set_yticks([0.0001, 0.001, 0.01, 0.1, 0])
+ax.set_ylabel('per 100,000')
 ax.get_yaxis().set_major_formatter(matplotlib.ticker.ScalarFormatter())
-#ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y,pos: ('{{:.{:1d}f}}'.format(int(np.maximum(-np.log10(y),0)))).format(y)))
+
 age_groups_vaccine_admin
 
 
@@ -677,32 +598,132 @@ age_groups_vaccine_admin
 # Moderna: 117,131,627
 # J&J: 9,654,031
 
-master_df['DIED'] = master_df['DIED'].replace('Y', 1).fillna(0)
-master_df['HOSPITAL'] = master_df['HOSPITAL'].replace('Y', 1).fillna(0)
+# The doses per manufacturer are kept in vaers/data/denominators.json, the two-dose vaccines count half of
+# their doses as people vaccinated. Deaths & hospitalizations from the outcome cube are joined on VAX_MANU,
+# so the order of the rows no longer matters. Rates are per 100,000 people vaccinated, with 95% intervals
+
+from vaers.rates import manufacturer_rates
 
 print(master_df['VAX_MANU'].value_counts())
 
-total_vaccines_added = [9654031, 117131627, 146558344]
+vax_groupby_sum = manufacturer_rates(outcome_cube.rollup('VAX_MANU')).set_index('VAX_MANU')
+vax_groupby_sum
 
-vax_groupby_sum = master_df.groupby('VAX_MANU').sum().drop(['UNKNOWN MANUFACTURER'])
-vax_groupby_avg = master_df.groupby('VAX_MANU').mean().drop(['UNKNOWN MANUFACTURER'])
 
-vax_groupby_sum['VACCINES DELIVERED'] = 0
+# In[34]:
 
-for r in range(0,3):
-    vax_groupby_sum['VACCINES DELIVERED'][r] = (total_vaccines_added[r]*0.5)
 
-vax_groupby_sum['VACCINES DELIVERED'][0] = 9654031
-    
-# These are not very 
-vax_groupby_sum['% OF DEATH OVER DELIVERED'] = (vax_groupby_sum['DIED']/vax_groupby_sum['VACCINES DELIVERED'])*100
-vax_groupby_sum['% OF HOSPITALIZATION OVER DELIVERED'] = (vax_groupby_sum['HOSPITAL']/vax_groupby_sum['VACCINES DELIVERED'])*100
+vax_groupby_sum.plot(kind='bar', use_index=True, y=['DIED_RATE', 'HOSPITAL_RATE'])
 
-vax_groupby_sum
 
+# Beyond crude rates: for every manufacturer & coded symptom pair we compute the proportional reporting ratio (PRR) and reporting odds ratio (ROR) against the other manufacturers, with 95% confidence intervals and a chi-square test (vaers/signals.py). Pairs flagged as a signal have at least 3 reports, PRR >= 2 and chi-square >= 4.
+
+# In[35]:
+
+
+from vaers.signals import disproportionality
+
+manufacturer_signals = disproportionality(combined_vaccine, symptom_index_long, by='VAX_MANU')
+
+manufacturer_signals[manufacturer_signals['SIGNAL']].head(20)
+
+
+# How sure can we be about the rate comparisons of In[29]-In[34]? We resample the reports 10,000 times (bootstrap) and see how much the
+# rates & ratios move. Resampling doesn't copy master_df: every resample is just a new set of counts for the cells of
+# the outcome cube, drawn in batches over all cores (vaers/bootstrap.py). The COVID deaths from the CDC are varied
+# as Poisson counts. The seed makes the bands come out the same on every run
+
+# In[36]:
+
+
+from vaers.bootstrap import age_group_risk_bands, manufacturer_risk_bands
+
+age_group_bands = age_group_risk_bands(OutcomeCube.from_frame(master_df, ['AGE_GROUP_CDC']), cdc_age_groups, n=10000, seed=0)
+manufacturer_bands = manufacturer_risk_bands(outcome_cube, n=10000, seed=0)
+
+# RISK_RATIO: how many times higher the COVID death rate (per case) is than the vaccine death rate (per person vaccinated)
+age_group_bands[['AGE_GROUP_CDC', 'DIED_RATE', 'DIED_RATE_BOOT_LOWER', 'DIED_RATE_BOOT_UPPER', 'RISK_RATIO', 'RISK_RATIO_BOOT_LOWER', 'RISK_RATIO_BOOT_UPPER']]
+
+
+# In[37]:
+
+
+# DIED_RATIO / HOSPITAL_RATIO: each manufacturer's rate compared with all manufacturers together
+
+manufacturer_bands.set_index('VAX_MANU')[['DIED_RATE', 'DIED_RATE_BOOT_LOWER', 'DIED_RATE_BOOT_UPPER', 'DIED_RATIO', 'DIED_RATIO_BOOT_LOWER', 'DIED_RATIO_BOOT_UPPER']]
+
+
+# When were the reports sent in, and how long after the shot did the symptoms start? The dates are turned into
+# whole days (int32) once, then a daily series is just a count per day and a 7 / 28 day window is a running sum
+# (vaers/timeseries.py). DailyCounts.add() lets us tack on next week's reports without recounting everything
+
+# In[38]:
+
+
+from vaers.timeseries import DailyCounts, day_offsets, histogram_quantiles, latency_histogram
+
+date_offsets = day_offsets(master_df)
+daily_reports = DailyCounts.from_frame(master_df, 'RECVDATE', offsets=date_offsets['RECVDATE']).to_frame()
+
+daily_reports[['REPORTS_7D', 'DIED_7D']].div(7).plot(title='Reports per day (7 day average)')
+
+
+# In[39]:
+
+
+# Days from vaccination (VAX_DATE) to first symptoms (ONSET_DATE) for each manufacturer & dose.
+# P50 = by this day half of the reports had started, 120 stands for 120 days or more
+
+onset_latency = latency_histogram(master_df, ['VAX_MANU', 'VAX_DOSE_SERIES'], 'VAX_DATE', 'ONSET_DATE', offsets=date_offsets)
+histogram_quantiles(onset_latency)
+
+
+# In[40]:
+
+
+# And how long it took from the first symptoms until the report reached VAERS (RECVDATE)
+
+reporting_lag = latency_histogram(master_df, 'VAX_MANU', 'ONSET_DATE', 'RECVDATE', offsets=date_offsets)
+histogram_quantiles(reporting_lag)
+
+
+# Some events are reported more than once (the manufacturer & the clinic, or a follow-up repeating the first write up).
+# vaers/neardup.py finds reports with nearly the same SYMPTOM_TEXT (MinHash, without comparing every pair) for the same
+# age, sex, state & vaccination date and gives them the same CLUSTER_ID
+
+# In[41]:
+
+
+from vaers import neardup
+
+neardup.assign(master_df)
+near_duplicates = neardup.summary(master_df)
+print(len(near_duplicates), 'reports in', near_duplicates['CLUSTER_ID'].nunique(), 'clusters of near duplicates')
+
+# To count every event once, keep one report per cluster right after In[10], before any of the counts above
+# (DIED / HOSPITAL etc. are set if any report in the cluster had it):
+# master_df = neardup.collapse(master_df)
+
+
+# Back to the word counts of In[12]-In[16]: single words split up symptoms like 'shortness of breath' or 'chest pain' (and 'shortness' & 'breath' are stopwords).
+# vaers/phrases.py counts 2 & 3 word phrases per cohort instead. The counts are kept in a small fixed size sketch,
+# so they can be slightly too high: the real count is between LOWER and COUNT
+
+# In[42]:
+
+
+from vaers.phrases import mine_frame
+
+phrase_table = mine_frame(master_df).table(20)
+phrase_table[phrase_table['COHORT'] == 'died']
+
+
+# In[43]:
 
-# In[34]:
 
+# Back to the lots counted in In[7]: lots whose deaths, hospitalizations or life-threatening reports over 4 weeks are well above
+# what the rest of the manufacturer's lots would give for the same number of reports
 
-vax_groupby_sum.plot(kind='bar', use_index=True, y=['% OF DEATH OVER DELIVERED', '% OF HOSPITALIZATION OVER DELIVERED'])
+print(lot_counts.totals().head(10))
+lot_signals(lot_counts).head(20)
 
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from vaers.bootstrap import manufacturer_risk_bands, resample_counts
+from vaers.cube import OutcomeCube
+
+
+def _cube(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'VAX_MANU': rng.choice(['MODERNA', 'PFIZER\\BIONTECH', 'JANSSEN'], n),
+        'DIED': rng.choice(['Y', None], n, p=[0.05, 0.95]),
+        'HOSPITAL': rng.choice(['Y', None], n, p=[0.2, 0.8]),
+    })
+    return OutcomeCube.from_frame(df, ['VAX_MANU'], ['DIED', 'HOSPITAL'])
+
+
+def test_same_seed_gives_identical_intervals():
+    cube = _cube()
+    first = manufacturer_risk_bands(cube, n=500, seed=7, batch=100, workers=1)
+    again = manufacturer_risk_bands(cube, n=500, seed=7, batch=100, workers=2)
+    pd.testing.assert_frame_equal(first, again)
+    other = manufacturer_risk_bands(cube, n=500, seed=8, batch=100, workers=1)
+    assert not np.allclose(first['DIED_RATE_BOOT_LOWER'], other['DIED_RATE_BOOT_LOWER'])
+    assert (first['DIED_RATE_BOOT_LOWER'] <= first['DIED_RATE']).all()
+    assert (first['DIED_RATE'] <= first['DIED_RATE_BOOT_UPPER']).all()
+
+
+def test_resamples_keep_the_total():
+    draws = resample_counts([5, 20, 75], n=250, seed=1, batch=100, workers=1)
+    assert draws.shape == (250, 3)
+    assert (draws.sum(axis=1) == 100).all()
+    assert np.array_equal(draws, resample_counts([5, 20, 75], n=250, seed=1, batch=100, workers=1))
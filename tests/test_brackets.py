@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+
+from vaers import brackets
+
+
+def test_ages_between_the_old_integer_edges_have_a_bracket():
+    ages = [17.5, 18, 29.5, 64.9, 65, 84.5, 85, 0, np.nan, -1]
+    assert brackets.bracket(ages).tolist() == [
+        '<18', '18-29', '18-29', '50-64', '65-74', '75-84', '85+', '<18', 'not known', 'not known']
+
+
+def test_nullable_ages_and_cdc_scheme():
+    ages = pd.Series([17.5, 18, 64.9, 65, None], dtype='Float32')
+    assert brackets.bracket(ages, 'cdc').tolist() == ['<18', '18-29', '50-64', '65-74', 'not known']
+    assert brackets.bracket(ages).cat.categories.tolist() == brackets.labels('notebook')
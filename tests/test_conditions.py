@@ -0,0 +1,37 @@
+import json
+
+import pandas as pd
+
+from vaers.conditions import DEFAULT_GROUPS, flag_conditions
+from vaers.normalize import normalize
+
+
+def test_keywords_survive_history_normalization():
+    with open(DEFAULT_GROUPS) as f:
+        groups = json.load(f)
+    patterns = [p for spec in groups.values() for p in spec.get('keywords', []) + spec.get('words', [])]
+    texts = ['history of {} noted'.format(p) for p in patterns]
+    cleaned = normalize(pd.DataFrame({'HISTORY': texts}), ['HISTORY'])['HISTORY']
+    assert cleaned.tolist() == texts
+
+
+def test_hyphenated_history_is_flagged_after_normalize():
+    raw = pd.DataFrame({'HISTORY': ['A-fib, on warfarin', 'SARS-CoV-2 infection in 2020', 'carries an Epi-Pen', 'none']})
+    flags = flag_conditions(normalize(raw, ['HISTORY']))
+    assert flags['cardiac'].tolist() == [True, False, False, False]
+    assert flags['covid'].tolist() == [False, True, False, False]
+    assert flags['anaphylaxis'].tolist() == [False, False, True, False]
+
+
+def test_notebook_heart_count_is_unchanged():
+    raw = pd.DataFrame({'HISTORY': ['HTN', 'heart failure', 'hypertension, dm2', 'afib', 'chf, cad',
+                                    'coronary artery disease', 'asthma', None, 'none', 'Heart murmur']})
+    history = normalize(raw, ['HISTORY'])
+    searchfor = ['heart', 'htn', 'hypertension']
+    # the notebook's original count, before the table-driven matcher
+    old = history['HISTORY'].str.contains('|'.join(searchfor)).sum()
+    heart = flag_conditions(history, ['HISTORY'], {'heart': {'keywords': searchfor}})['heart']
+    cardiac = flag_conditions(history, ['HISTORY'])['cardiac']
+    assert heart.sum() == old == 4
+    # the wider group adds afib, chf/cad and coronary on top of those
+    assert cardiac.sum() == 7 and (cardiac | heart).equals(cardiac)
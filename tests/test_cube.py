@@ -0,0 +1,35 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from vaers.cube import REPORTS, OutcomeCube
+
+DIMENSIONS = ('VAX_MANU', 'SEX', 'STATE')
+
+
+def _frame(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'VAX_MANU': rng.choice(['MODERNA', 'PFIZER\\BIONTECH', 'JANSSEN'], n),
+        'SEX': rng.choice(['F', 'M', 'U', None], n),
+        'STATE': rng.choice(['CA', 'TX', 'NY', None], n),
+        'DIED': rng.choice(['Y', None], n, p=[0.1, 0.9]),
+        'HOSPITAL': rng.choice(['Y', None], n, p=[0.2, 0.8]),
+    })
+
+
+def test_rollup_totals_do_not_depend_on_the_axis_order():
+    df = _frame()
+    cube = OutcomeCube.from_frame(df, DIMENSIONS, ('DIED', 'HOSPITAL'))
+    assert cube.rollup().to_dict() == {REPORTS: 500, 'DIED': (df['DIED'] == 'Y').sum(),
+                                       'HOSPITAL': (df['HOSPITAL'] == 'Y').sum()}
+    for order in itertools.permutations(DIMENSIONS, 2):
+        table = cube.rollup(*order)
+        flipped = cube.rollup(*order[::-1]).reorder_levels([1, 0]).reindex(table.index)
+        assert table.equals(flipped)
+        assert table.sum().equals(cube.rollup())
+
+    by_sex = cube.rollup('SEX')
+    expected = df['SEX'].fillna('not known').value_counts()
+    assert by_sex[REPORTS].to_dict() == expected.reindex(by_sex.index, fill_value=0).to_dict()
@@ -0,0 +1,81 @@
+import collections
+import os
+
+import pytest
+
+from vaers.dag import ArtifactStore, Pipeline
+
+CALLS = collections.Counter()
+
+
+def load(path=None):
+    CALLS['load'] += 1
+    with open(path) as f:
+        return f.read().split()
+
+
+def count(words, minimum=1):
+    CALLS['count'] += 1
+    counts = collections.Counter(words)
+    return {word: n for word, n in counts.items() if n >= minimum}
+
+
+def write(counts):
+    CALLS['write'] += 1
+    return {'counts.txt': '\n'.join('{} {}'.format(w, n) for w, n in sorted(counts.items())).encode()}
+
+
+@pytest.fixture
+def words(tmp_path):
+    CALLS.clear()
+    path = tmp_path / 'words.txt'
+    path.write_text('fever rash fever chills fever rash')
+    return path
+
+
+def _graph(store, words, minimum=1, helper=None):
+    graph = Pipeline(store)
+    graph.add('load', load, options={'path': str(words)}, files=[str(words)])
+    graph.add('count', count, ['load'], params={'minimum': minimum}, code=[helper] if helper else ())
+    graph.add('write', write, ['count'], outputs=True)
+    return graph
+
+
+def test_second_run_is_all_cached_and_still_writes_outputs(tmp_path, words):
+    store = ArtifactStore(str(tmp_path / 'cache'))
+    assert set(_graph(store, words).run(out_dir=str(tmp_path / 'out')).values()) == {'ran'}
+    os.remove(tmp_path / 'out' / 'counts.txt')
+
+    status = _graph(store, words).run(out_dir=str(tmp_path / 'out'))
+    assert status == {'load': 'skipped', 'count': 'skipped', 'write': 'cached'}
+    assert CALLS == {'load': 1, 'count': 1, 'write': 1}
+    assert (tmp_path / 'out' / 'counts.txt').read_text() == 'chills 1\nfever 3\nrash 2'
+
+
+def test_a_changed_parameter_reruns_only_that_stage_and_below(tmp_path, words):
+    store = ArtifactStore(str(tmp_path / 'cache'))
+    _graph(store, words).run()
+    status = _graph(store, words, minimum=2).run()
+    assert status == {'load': 'cached', 'count': 'ran', 'write': 'ran'}
+
+
+def test_a_changed_data_file_or_code_file_invalidates(tmp_path, words):
+    store = ArtifactStore(str(tmp_path / 'cache'))
+    helper = tmp_path / 'helper.py'
+    helper.write_text('STOP = []\n')
+    _graph(store, words, helper=str(helper)).run()
+
+    helper.write_text('STOP = ["rash"]\n')
+    assert _graph(store, words, helper=str(helper)).run() == {'load': 'cached', 'count': 'ran', 'write': 'ran'}
+
+    words.write_text('fever fever')
+    os.utime(words, ns=(1, 1))
+    assert set(_graph(store, words, helper=str(helper)).run().values()) == {'ran'}
+
+
+def test_eviction_never_removes_what_the_run_still_reads(tmp_path, words):
+    store = ArtifactStore(str(tmp_path / 'cache'), max_bytes=1)
+    _graph(store, words).run()
+    _graph(store, words, minimum=2).run()
+    assert len(store.entries()) <= 1
+    assert _graph(store, words, minimum=3).run(out_dir=str(tmp_path / 'out'))['write'] == 'ran'
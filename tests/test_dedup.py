@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from vaers.dedup import dedupe
+
+
+@pytest.fixture
+def merged():
+    # two yearly frames concatenated, so the index labels repeat
+    frame = pd.DataFrame({
+        'VAERS_ID': [7, 7, 3, 9, 3, 7],
+        'VAX_MANU': ['PFIZER', 'MODERNA', 'JANSSEN', 'PFIZER', 'PFIZER', 'UNKNOWN'],
+        'DIED': ['Y', 'Y', None, None, None, 'Y'],
+    })
+    return frame.set_axis([0, 1, 2, 0, 1, 2])
+
+
+def test_first_keeps_the_first_row_of_each_report_in_order(merged):
+    out, report = dedupe(merged, policy='first')
+    assert out['VAERS_ID'].tolist() == [7, 3, 9]
+    assert out['VAX_MANU'].tolist() == ['PFIZER', 'JANSSEN', 'PFIZER']
+    assert out.index.tolist() == [0, 1, 2]
+    assert report == ('first', 6, 3, 3)
+
+
+def test_list_and_count_keep_every_vax_row(merged):
+    listed, _ = dedupe(merged, policy='list')
+    assert listed['VAX_MANU'].tolist() == [['PFIZER', 'MODERNA', 'UNKNOWN'], ['JANSSEN', 'PFIZER'], ['PFIZER']]
+    counted, _ = dedupe(merged, policy='count')
+    assert counted['VAX_COUNT'].tolist() == [3, 2, 1]
+
+
+def test_unknown_policy_is_rejected(merged):
+    with pytest.raises(ValueError):
+        dedupe(merged, policy='last')
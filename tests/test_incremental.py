@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from vaers import incremental
+from vaers.synthetic import generate
+
+
+def _write_drop(root, tables):
+    folder = root / '2021VAERSData'
+    folder.mkdir(exist_ok=True)
+    for name, frame in tables.items():
+        frame.to_csv(folder / '2021VAERS{}.csv'.format(name), index=False, encoding='latin1')
+
+
+def _refresh(root, state):
+    return incremental.refresh(str(root), str(state), workers=1, log=None)
+
+
+def test_refresh_matches_a_full_rebuild(tmp_path):
+    tables = next(generate(400, year=2021, seed=3))
+    _write_drop(tmp_path, tables)
+    master, _, delta = _refresh(tmp_path, tmp_path / 'state')
+    assert len(delta.added) == len(master) > 0
+
+    # next week's drop: one report edited, one withdrawn, one new
+    ids = master['VAERS_ID'].to_numpy()
+    changed, removed = ids[0], ids[1]
+    data = tables['DATA']
+    data.loc[data['VAERS_ID'] == changed, ['SYMPTOM_TEXT', 'DIED']] = ['patient died of heart failure', 'Y']
+    new = data[data['VAERS_ID'] == ids[2]].assign(VAERS_ID=ids.max() + 1)
+    tables['DATA'] = pd.concat([data[data['VAERS_ID'] != removed], new], ignore_index=True)
+    for name in ('VAX', 'SYMPTOMS'):
+        frame = tables[name]
+        extra = frame[frame['VAERS_ID'] == ids[2]].assign(VAERS_ID=ids.max() + 1)
+        tables[name] = pd.concat([frame[frame['VAERS_ID'] != removed], extra], ignore_index=True)
+    _write_drop(tmp_path, tables)
+
+    master, totals, delta = _refresh(tmp_path, tmp_path / 'state')
+    assert (delta.added.tolist(), delta.changed.tolist(), delta.removed.tolist()) == \
+        ([ids.max() + 1], [changed], [removed])
+
+    rebuilt, rebuilt_totals, _ = _refresh(tmp_path, tmp_path / 'rebuilt')
+    assert totals.equals(rebuilt_totals)
+    assert master['VAERS_ID'].tolist() == rebuilt['VAERS_ID'].tolist()
+
+    lots = incremental.IncrementalState(str(tmp_path / 'state')).load_lots()
+    rebuilt_lots = incremental.IncrementalState(str(tmp_path / 'rebuilt')).load_lots()
+    assert np.array_equal(lots.keys, rebuilt_lots.keys)
+    assert np.array_equal(lots.counts, rebuilt_lots.counts)
+
+
+def test_update_drops_counts_that_reach_zero():
+    index = pd.MultiIndex.from_tuples([('words', 'all', 'fever'), ('words', 'all', 'rash')],
+                                      names=incremental.AGGREGATE_KEYS)
+    totals = pd.Series([2, 1], index=index, name='COUNT')
+    removed = pd.Series([1], index=index[1:], name='COUNT')
+    assert incremental.update(totals, removed=removed).to_dict() == {('words', 'all', 'fever'): 2}
+
+
+def test_tables_are_written_without_any_deaths(tmp_path):
+    tables = next(generate(300, year=2021, seed=4))
+    tables['DATA']['DIED'] = None
+    _write_drop(tmp_path, tables)
+    _, totals, _ = _refresh(tmp_path, tmp_path / 'state')
+    incremental.write_tables(totals, str(tmp_path / 'out'))
+
+    words = pd.read_csv(tmp_path / 'out' / 'symptom_frequency.csv')
+    assert words['died_word'].isna().all() and words['all_word'].notna().any()
+    manufacturers = pd.read_csv(tmp_path / 'out' / 'manufacturers.csv')
+    assert (manufacturers['DIED'] == 0).all() and manufacturers['HOSPITAL'].sum() > 0
+    ages = pd.read_csv(tmp_path / 'out' / 'age_brackets.csv')
+    assert (ages['died'] == 0).all()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from vaers import lots
+
+
+def _frame(lot, manufacturer, received, died=None):
+    return pd.DataFrame({
+        'VAX_LOT': lot,
+        'VAX_MANU': manufacturer,
+        'RECVDATE': pd.to_datetime(received),
+        'DIED': died if died is not None else [None] * len(lot),
+        'HOSPITAL': [None] * len(lot),
+        'L_THREAT': [None] * len(lot),
+    })
+
+
+def test_canonical_spellings():
+    values = ['EK5730', 'ek5730', 'EK 5730', 'Lot# EK5730', 'EKS730', 'unknown', 'N/A', None, 'lot', '039K20A']
+    assert lots.canonical(values).tolist() == ['EK5730'] * 5 + [None] * 4 + ['039K20A']
+
+
+def test_missing_manufacturer_still_gets_a_key():
+    keys = lots.lot_keys(['EK5730', 'EK5730', 'EL0140', None], ['PFIZER\\BIONTECH', None, None, None])
+    assert keys[3] == lots.MISSING_KEY
+    assert len(set(keys[:3].tolist())) == 3 and lots.MISSING_KEY not in keys[:3]
+
+    counts = lots.LotCounts.from_frame(_frame(['EK5730'], [None], ['2021-01-04']))
+    assert counts.counts.tolist() == [[1, 0, 0, 0]]
+
+
+def test_add_and_subtract_match_a_recount():
+    df = _frame(['EK5730', 'ek 5730', 'EL0140', 'EL0140', 'unknown'],
+                ['PFIZER\\BIONTECH'] * 5,
+                ['2021-01-04', '2021-01-06', '2021-01-11', '2021-02-01', '2021-01-04'],
+                died=['Y', None, None, 'Y', 'Y'])
+    whole = lots.LotCounts.from_frame(df)
+    parts = lots.LotCounts.from_frame(df.iloc[:2]).add(lots.LotCounts.from_frame(df.iloc[2:]))
+    assert np.array_equal(parts.keys, whole.keys) and np.array_equal(parts.counts, whole.counts)
+    assert whole.totals()[['REPORTS', 'DIED']].to_numpy().tolist() == [[2, 1], [2, 1]]
+
+    back = whole.subtract(lots.LotCounts.from_frame(df.iloc[2:]))
+    assert back.totals()['VAX_LOT'].tolist() == ['EK5730']
+
+
+def test_window_sums_trailing_weeks_within_a_lot():
+    df = _frame(['EK5730'] * 3 + ['EL0140'], ['PFIZER\\BIONTECH'] * 4,
+                ['2021-01-04', '2021-01-18', '2021-03-01', '2021-01-11'])
+    counts = lots.LotCounts.from_frame(df)
+    frame = counts.to_frame().assign(WINDOW=counts.window(4)[:, 0])
+    by_lot = frame.set_index(['LOT_KEY', 'WEEK'])['WINDOW']
+    assert sorted(by_lot.tolist()) == [1, 1, 1, 2]
+
+
+def test_signals_and_save_keep_a_missing_manufacturer_apart(tmp_path):
+    df = _frame(['EK5730', 'EL0140', 'EK5730'], ['PFIZER\\BIONTECH', 'PFIZER\\BIONTECH', None],
+                ['2021-01-04'] * 3, died=['Y', None, 'Y'])
+    counts = lots.LotCounts.from_frame(df)
+    table = lots.lot_signals(counts, flagged_only=False)
+    assert set(table['VAX_MANU'].isna()) == {True, False}
+
+    counts.save(tmp_path / 'lots.npz')
+    loaded = lots.LotCounts.load(tmp_path / 'lots.npz')
+    assert loaded.labels.equals(counts.labels)
+    assert np.array_equal(loaded.counts, counts.counts)
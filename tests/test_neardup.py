@@ -0,0 +1,30 @@
+import pandas as pd
+
+from vaers import neardup
+
+TEXT = 'patient developed a headache and fever the day after the second dose and recovered'
+
+
+def test_identical_reports_join_across_an_incompatible_one():
+    df = pd.DataFrame({
+        'VAERS_ID': [1, 2, 3],
+        'SYMPTOM_TEXT': [TEXT] * 3,
+        'STATE': ['CA', 'TX', 'CA'],
+    })
+    assert neardup.clusters(df).tolist() == [1, 2, 1]
+
+
+def test_lookback_pairs_every_row_of_a_small_bucket():
+    df = pd.DataFrame({'VAERS_ID': range(1, 6), 'SYMPTOM_TEXT': [TEXT] * 5})
+    left, right = neardup.candidate_pairs(neardup.signatures(df['SYMPTOM_TEXT']))
+    assert sorted(zip(left.tolist(), right.tolist())) == [(a, b) for a in range(5) for b in range(a + 1, 5)]
+
+
+def test_different_texts_stay_apart():
+    df = pd.DataFrame({
+        'VAERS_ID': [10, 11, 12],
+        'SYMPTOM_TEXT': [TEXT, TEXT + ' fully', 'sore arm at the injection site only, no other symptoms reported'],
+    })
+    labels = neardup.clusters(df).tolist()
+    assert labels[0] == labels[1] == 10
+    assert labels[2] == 12
@@ -0,0 +1,60 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+from vaers.phrases import PhraseMiner, PhraseSketch, mine_frame
+
+WORDS = ['chest', 'pain', 'heart', 'rate', 'shortness', 'breath', 'fever', 'chills', 'rash', 'nausea']
+
+
+def _texts(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    return [' '.join(rng.choice(WORDS, rng.integers(1, 12))) for _ in range(n)]
+
+
+def _true_counts(texts, sizes=(2, 3)):
+    counts = collections.Counter()
+    for text in texts:
+        words = text.split()
+        for size in sizes:
+            counts.update(' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return counts
+
+
+def test_sketch_never_undercounts():
+    rng = np.random.default_rng(1)
+    keys = np.unique(rng.integers(0, 2 ** 63, 5000, dtype='int64').astype('uint64'))
+    counts = rng.integers(1, 50, len(keys))
+    # 64 counters per row for 5000 keys: most of them collide
+    sketch = PhraseSketch(64, capacity=10)
+    for part in np.array_split(np.arange(len(keys)), 7):
+        sketch.add(keys[part], counts[part], lambda positions: [''] * len(positions),
+                   np.full(len(part), 2, dtype='int8'))
+    estimates = sketch.estimate(keys)
+    assert (estimates >= counts).all() and (estimates > counts).any()
+    assert sketch.total == counts.sum()
+
+
+def test_lower_and_error_bound_the_true_count():
+    texts = _texts()
+    truth = _true_counts(texts)
+    # a tiny budget so the sketch has to overcount
+    miner = PhraseMiner({'all': None}, memory_mb=0.0005, capacity=30).update(texts, {'all': None})
+    table = miner.table(20)
+    true = table['PHRASE'].map(truth).to_numpy()
+    assert len(table) == 20
+    assert (table['COUNT'].to_numpy() >= true).all()
+    assert (table['LOWER'].to_numpy() <= true).all()
+    assert (table['COUNT'].to_numpy() - table['ERROR'].to_numpy() <= true).all()
+
+
+def test_mine_frame_table_per_cohort():
+    texts = _texts(60)
+    df = pd.DataFrame({'SYMPTOM_TEXT': texts, 'DIED': [i % 3 == 0 for i in range(60)],
+                       'HOSPITAL': [i % 2 == 0 for i in range(60)]})
+    table = mine_frame(df).table(5)
+    died = table[table['COHORT'] == 'died']
+    truth = _true_counts(texts[::3])
+    assert len(died) == 5
+    assert (died['COUNT'].to_numpy() == died['PHRASE'].map(truth).to_numpy()).all()
@@ -0,0 +1,27 @@
+import multiprocessing
+import sys
+
+import pytest
+
+from vaers.profiling import StageTimer
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs /proc and getrusage')
+
+
+def _allocate(megabytes):
+    block = bytearray(megabytes * 2 ** 20)
+    block[::4096] = b'x' * len(block[::4096])
+
+
+def test_worker_peak_only_on_stages_that_start_workers():
+    timer = StageTimer()
+    with timer.stage('workers'):
+        process = multiprocessing.get_context('spawn').Process(target=_allocate, args=(200,))
+        process.start()
+        process.join()
+    with timer.stage('in process'):
+        sum(range(1000))
+    with_workers, without = timer.results
+    assert with_workers.worker_peak_rss_mb >= 200
+    assert without.worker_peak_rss_mb != without.worker_peak_rss_mb
+    assert without.peak_rss_mb < with_workers.worker_peak_rss_mb
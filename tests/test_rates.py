@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from vaers.rates import poisson_interval, rate_table
+
+
+def test_exact_interval_known_values():
+    lower, upper = poisson_interval([0, 1, 10])
+    np.testing.assert_allclose(lower, [0.0, 0.0253, 4.7954], atol=1e-4)
+    np.testing.assert_allclose(upper, [3.6889, 5.5716, 18.3904], atol=1e-4)
+
+
+@pytest.mark.parametrize('mean', [0.5, 3.0, 12.0])
+def test_exact_interval_covers_at_least_the_nominal_level(mean):
+    counts = np.arange(200)
+    lower, upper = poisson_interval(counts)
+    covered = (lower <= mean) & (mean <= upper)
+    assert stats.poisson.pmf(counts[covered], mean).sum() >= 0.95
+
+
+def test_rate_table_takes_its_strata_from_the_denominator():
+    numerators = pd.DataFrame({'VAX_MANU': ['PFIZER', 'PFIZER', 'UNKNOWN'], 'DIED': [2, 3, 7]})
+    denominators = pd.DataFrame({'VAX_MANU': ['PFIZER', 'MODERNA'], 'POPULATION': [1000000, 500000]})
+    table = rate_table(numerators, denominators, on='VAX_MANU', measures=['DIED'])
+    assert table['VAX_MANU'].tolist() == ['PFIZER', 'MODERNA']
+    assert table['DIED'].tolist() == [5, 0]
+    assert table['DIED_RATE'].tolist() == [0.5, 0.0]
+    assert table['DIED_UPPER'].iloc[1] == pytest.approx(3.6889 / 5, abs=1e-4)
+
+
+def test_repeated_denominator_stratum_fails():
+    denominators = pd.DataFrame({'VAX_MANU': ['PFIZER', 'PFIZER'], 'POPULATION': [1, 2]})
+    with pytest.raises(pd.errors.MergeError):
+        rate_table(pd.DataFrame({'VAX_MANU': ['PFIZER'], 'DIED': [1]}), denominators, 'VAX_MANU', ['DIED'])
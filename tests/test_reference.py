@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+import pytest
+
+from vaers.reference import ReferenceStore, SnapshotMissing
+
+OWID = '''iso_code,location,date,total_deaths
+USA,United States,2021-01-01,350000
+USA,United States,2021-01-02,352000
+CAN,Canada,2021-01-01,15600
+'''
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'owid.csv'
+    path.write_text(OWID)
+    return path
+
+
+def _store(tmp_path, source, **kwargs):
+    sources = {'owid': {'url': 'file://{}'.format(source), 'format': 'csv'}}
+    return ReferenceStore(str(tmp_path / 'snapshots'), sources=sources, **kwargs)
+
+
+def test_snapshot_is_taken_once_and_reused(tmp_path, source):
+    store = _store(tmp_path, source, max_age=0)
+    first = store.refresh('owid')
+    assert store.refresh('owid')['version'] == first['version']
+    assert store.load('owid')['total_deaths'].tolist() == [350000, 352000, 15600]
+    assert store.owid_row('CAN')['total_deaths'] == 15600
+    assert store.owid_row('United States', '2021-01-01')['total_deaths'] == 350000
+
+
+def test_changed_source_gives_a_new_version_and_old_ones_are_pruned(tmp_path, source):
+    store = _store(tmp_path, source, max_age=0, keep=2)
+    versions = [store.refresh('owid')['version']]
+    for deaths in (16000, 16500):
+        source.write_text(OWID.replace('15600', str(deaths)))
+        os.utime(source, ns=(1, len(versions)))
+        versions.append(store.refresh('owid')['version'])
+    assert len(set(versions)) == 3
+    assert store.versions('owid') == versions[1:]
+    assert store.load('owid')['total_deaths'].iloc[-1] == 16500
+
+
+def test_offline_mode_never_reads_the_source(tmp_path, source):
+    with pytest.raises(SnapshotMissing):
+        _store(tmp_path, source, offline=True).refresh('owid')
+
+    version = _store(tmp_path, source).refresh('owid')['version']
+    source.unlink()
+    offline = _store(tmp_path, source, offline=True, max_age=0)
+    assert offline.refresh('owid')['version'] == version
+    assert isinstance(offline.load('owid'), pd.DataFrame)
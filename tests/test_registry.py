@@ -0,0 +1,16 @@
+from vaers.registry import load_covid
+from vaers.synthetic import generate
+
+
+def test_load_covid_keeps_only_covid_categories(tmp_path):
+    tables = next(generate(400, year=2021, seed=3))
+    folder = tmp_path / '2021VAERSData'
+    folder.mkdir()
+    for name, frame in tables.items():
+        frame.to_csv(folder / '2021VAERS{}.csv'.format(name), index=False, encoding='latin1')
+
+    vax = load_covid(str(tmp_path), workers=1)['VAX']
+    covid = tables['VAX'][tables['VAX']['VAX_TYPE'] == 'COVID19']
+    assert sorted(vax['VAX_MANU'].cat.categories) == sorted(covid['VAX_MANU'].unique())
+    assert (vax['VAX_MANU'].value_counts() > 0).all()
+    assert vax['VAX_TYPE'].cat.categories.tolist() == ['COVID19']
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from vaers.cohorts import flag_mask
+from vaers.schema import apply, harmonize
+
+
+def test_flag_missing_in_one_year_stays_bool():
+    old = apply(pd.DataFrame({'VAERS_ID': [1, 2], 'DIED': ['Y', None]}))
+    new = apply(pd.DataFrame({'VAERS_ID': [3, 4], 'DIED': [None, 'Y'], 'ER_ED_VISIT': ['Y', None]}))
+    frames = harmonize([old, new])
+    combined = pd.concat(frames, ignore_index=True)
+    assert all(f['ER_ED_VISIT'].dtype == bool for f in frames)
+    assert flag_mask(combined['ER_ED_VISIT']).tolist() == [False, False, True, False]
+    assert flag_mask(combined['DIED']).tolist() == [True, False, False, True]
+
+
+def test_categories_are_unioned_across_years():
+    old = apply(pd.DataFrame({'VAX_MANU': ['MERCK & CO. INC.']}))
+    new = apply(pd.DataFrame({'VAX_MANU': ['MODERNA', 'PFIZER\\BIONTECH']}))
+    combined = pd.concat(harmonize([old, new]), ignore_index=True)
+    assert isinstance(combined['VAX_MANU'].dtype, pd.CategoricalDtype)
+    assert combined['VAX_MANU'].tolist() == ['MERCK & CO. INC.', 'MODERNA', 'PFIZER\\BIONTECH']
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from vaers.signals import disproportionality
+
+
+def _reports():
+    # 100 reports for X, 900 for Y; FEVER in 20 X and 30 Y reports, RASH in 5 X reports only
+    vax = pd.DataFrame({'VAERS_ID': np.arange(1000), 'VAX_TYPE': ['X'] * 100 + ['Y'] * 900})
+    ids = list(range(20)) + list(range(100, 130)) + list(range(5))
+    symptoms = pd.DataFrame({'VAERS_ID': ids, 'SYMPTOM': ['FEVER'] * 50 + ['RASH'] * 5})
+    return vax, symptoms
+
+
+def _row(table, product, symptom):
+    return table[(table['VAX_TYPE'] == product) & (table['SYMPTOM'] == symptom)].iloc[0]
+
+
+def test_two_by_two_by_hand():
+    row = _row(disproportionality(*_reports()), 'X', 'FEVER')
+    assert (row['a'], row['b'], row['c'], row['d']) == (20, 80, 30, 870)
+
+    z = 1.959964
+    # PRR = (20 / 100) / (30 / 900), se = sqrt(1/20 - 1/100 + 1/30 - 1/900)
+    assert row['PRR'] == pytest.approx(6.0)
+    assert row['PRR_LOWER'] == pytest.approx(6.0 * np.exp(-z * 0.2687419), rel=1e-5)
+    assert row['PRR_UPPER'] == pytest.approx(6.0 * np.exp(z * 0.2687419), rel=1e-5)
+    # ROR = 20 * 870 / (80 * 30), se = sqrt(1/20 + 1/80 + 1/30 + 1/870)
+    assert row['ROR'] == pytest.approx(7.25)
+    assert row['ROR_LOWER'] == pytest.approx(7.25 * np.exp(-z * 0.3114206), rel=1e-5)
+    assert row['ROR_UPPER'] == pytest.approx(7.25 * np.exp(z * 0.3114206), rel=1e-5)
+    # Yates: 1000 * (|20 * 870 - 80 * 30| - 500) ** 2 / (100 * 900 * 50 * 950)
+    assert row['CHI2'] == pytest.approx(49.181287, rel=1e-6)
+    assert row['SIGNAL']
+
+
+def test_empty_cell_gets_the_haldane_anscombe_correction():
+    row = _row(disproportionality(*_reports()), 'X', 'RASH')
+    assert (row['a'], row['b'], row['c'], row['d']) == (5, 95, 0, 900)
+    # 0.5 added to every cell: (5.5 / 101) / (0.5 / 901)
+    assert row['PRR'] == pytest.approx(5.5 / 101 / (0.5 / 901))
+    assert row['ROR'] == pytest.approx(5.5 * 900.5 / (95.5 * 0.5))
+    values = row[['PRR', 'PRR_LOWER', 'PRR_UPPER', 'ROR', 'ROR_LOWER', 'ROR_UPPER']].astype(float)
+    assert np.isfinite(values).all()
+    assert row['PRR_LOWER'] < row['PRR'] < row['PRR_UPPER']
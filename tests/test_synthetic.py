@@ -0,0 +1,12 @@
+from vaers import synthetic
+from vaers.dedup import dedupe
+from vaers.registry import load_years
+
+
+def test_years_written_by_the_cli_do_not_share_ids(tmp_path):
+    synthetic.main(['--out', str(tmp_path), '--reports', '300', '--years', '2020', '2021'])
+    data = load_years(str(tmp_path), tables=('DATA',), columns=None, workers=1)['DATA']
+    assert len(data) == 600
+    assert data['VAERS_ID'].is_unique
+    _, report = dedupe(data)
+    assert report.rows_in == report.rows_out == 600
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from vaers.cohorts import cohort_masks
+from vaers.report import frequency_table
+from vaers.tokens import TokenMatrix
+
+
+def _master():
+    return pd.DataFrame({
+        'SYMPTOM_TEXT': ['cardiac arrest cardiac', 'fever chills', None, 'cardiac arrest', 'fever'],
+        'DIED': ['Y', None, 'Y', 'Y', None],
+        'HOSPITAL': ['Y', 'Y', None, None, None],
+    })
+
+
+def test_died_counts_match_a_hand_count():
+    master = _master()
+    tokens = TokenMatrix.from_series(master['SYMPTOM_TEXT'])
+    died = tokens.counts(cohort_masks(master)['died'])
+    # rows 0, 2 (no text) and 3
+    assert died.to_dict() == {'cardiac': 3, 'arrest': 2}
+    reports = tokens.document_counts(cohort_masks(master)['died'])
+    assert reports[reports > 0].to_dict() == {'cardiac': 2, 'arrest': 2}
+
+
+def test_frequency_table_cohorts_side_by_side():
+    master = _master()
+    table = frequency_table(TokenMatrix.from_series(master['SYMPTOM_TEXT']), cohort_masks(master))
+    assert table['died_word'].dropna().tolist() == ['cardiac', 'arrest']
+    assert table['died_count'].dropna().tolist() == [3, 2]
+    hospitalized = dict(zip(table['hospitalized_word'].dropna(), table['hospitalized_count'].dropna()))
+    assert hospitalized == {'cardiac': 2, 'arrest': 1, 'fever': 1, 'chills': 1}
+    assert table['all_count'].sum() == 8
@@ -0,0 +1,10 @@
+from vaers.wordclouds import stopwords
+
+
+def test_history_extras_follow_the_notebook_per_cloud():
+    hospitalized = stopwords('HISTORY', 'hospitalized_history')
+    died = stopwords('HISTORY', 'died_history')
+    assert {'conditions', 'concurrent', 'disease', 'chronic'} <= hospitalized
+    assert 'chronic' in died
+    assert not {'conditions', 'concurrent', 'disease'} & died
+    assert 'admitted' in stopwords('SYMPTOM_TEXT', 'all_symptoms') and 'admitted' not in died
@@ -0,0 +1,15 @@
+"""Helpers for the COVID vaccine investigation.
+
+The notebook export (``COVID Vaccine Investigation -Copy2.py``) walks through
+the analysis cell by cell; the modules in this package hold the pieces that
+are worth reusing between runs.
+"""
+
+from .cache import ingest, load_table, load_year
+from .dedup import dedupe
+from .normalize import normalize
+from .registry import discover, load_covid, load_years
+from .tokens import TokenMatrix
+
+__all__ = ['TokenMatrix', 'dedupe', 'discover', 'ingest', 'load_covid', 'load_table',
+           'load_year', 'load_years', 'normalize']
@@ -0,0 +1,186 @@
+"""Scaling benchmark of the pipeline stages on synthetic drops.
+
+For each size a synthetic drop is written once (:mod:`vaers.synthetic`) and
+kept under ``.vaers_cache/synthetic/<reports>``. The load, merge, dedupe,
+clean, tokenize, bracket and aggregate stages then run on it in a fresh
+process, so every size starts from the same memory. Wall time and peak RSS
+per stage are appended to a history file together with the git commit:
+
+    python -m vaers.benchmark --sizes 100000 1000000 5000000
+
+Each run is compared with the median of the last few runs of the same size
+and worker count. A stage that got slower (or bigger) than ``--tolerance``
+times that is reported as a regression; ``--fail-on-regression`` turns that
+into a non-zero exit status for CI.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from . import brackets, synthetic
+from .cache import file_hash
+from .cohorts import cohort_masks
+from .cube import OutcomeCube
+from .dedup import dedupe
+from .normalize import normalize
+from .profiling import StageTimer
+from .registry import load_covid
+from .report import REPO_ROOT
+from .tokens import TokenMatrix
+
+DEFAULT_DATA = os.path.join(REPO_ROOT, '.vaers_cache', 'synthetic')
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, '.vaers_cache', 'benchmarks.csv')
+
+SIZES = (100000, 1000000)
+TOLERANCE = 1.2
+# differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.1
+MIN_MB = 32
+BASELINE_RUNS = 5
+KEYS = ['reports', 'workers', 'stage']
+
+
+def dataset(reports, data_dir=DEFAULT_DATA, seed=0, profile=synthetic.DEFAULT_PROFILE, log=None):
+    """Root folder of a synthetic drop of ``reports`` reports, written if not there yet."""
+    root = os.path.join(data_dir, str(reports))
+    marker = os.path.join(root, 'synthetic.json')
+    spec = {'reports': reports, 'seed': seed, 'profile': file_hash(profile)}
+    try:
+        with open(marker) as f:
+            if json.load(f) == spec:
+                return root
+    except (OSError, ValueError):
+        pass
+    if log is not None:
+        log('writing {:,} synthetic reports to {}'.format(reports, root))
+    synthetic.write(root, reports, profile=synthetic.load_profile(profile), seed=seed)
+    # the marker goes last, so a half-written drop is redone
+    with open(marker, 'w') as f:
+        json.dump(spec, f)
+    return root
+
+
+def pipeline(root, timer, workers=None):
+    """The notebook's per-report stages, each timed by ``timer``."""
+    with timer.stage('load'):
+        tables = load_covid(root, workers=workers)
+    with timer.stage('merge'):
+        master = tables['VAX'].merge(tables['DATA'], on='VAERS_ID')
+        del tables
+    with timer.stage('dedupe'):
+        master, _ = dedupe(master, policy='first')
+    with timer.stage('clean'):
+        master = normalize(master)
+    with timer.stage('tokenize'):
+        tokens = TokenMatrix.from_series(master['SYMPTOM_TEXT'])
+        for mask in cohort_masks(master).values():
+            tokens.counts(mask)
+    with timer.stage('bracket'):
+        brackets.assign(master, 'notebook')
+    with timer.stage('aggregate'):
+        OutcomeCube.from_frame(master).cohort_counts('AGE_BRACKET')
+    return timer
+
+
+def _measure(root, workers):
+    return pipeline(root, StageTimer(), workers).to_frame()
+
+
+def commit():
+    """Short hash of the checked out commit (``-dirty`` with local changes), or ''."""
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return out.stdout.strip()
+
+
+def run(sizes=SIZES, data_dir=DEFAULT_DATA, workers=None, seed=0, log=print):
+    """Benchmark every size; returns one row per size and stage."""
+    frames = []
+    for reports in sizes:
+        root = dataset(reports, data_dir, seed, log=log)
+        # a fresh process per size, so peak memory isn't inherited from the previous one
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            frame = pool.submit(_measure, root, workers).result()
+        frame.insert(0, 'reports', reports)
+        frames.append(frame)
+        if log is not None:
+            log('{:,} reports: {:.1f}s'.format(reports, frame['seconds'].sum()))
+    results = pd.concat(frames, ignore_index=True)
+    results.insert(0, 'workers', workers or os.cpu_count())
+    results.insert(0, 'commit', commit())
+    results.insert(0, 'run_at', datetime.datetime.now().isoformat(timespec='seconds'))
+    return results
+
+
+def read_history(path=DEFAULT_HISTORY):
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, keep_default_na=False, na_values=[''])
+
+
+def append_history(results, path=DEFAULT_HISTORY):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    results.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+    return path
+
+
+def compare(results, history, tolerance=TOLERANCE, runs=BASELINE_RUNS):
+    """``results`` next to the median of the last ``runs`` runs in ``history``.
+
+    Adds ``base_seconds``, ``base_peak_rss_mb``, the ``slowdown`` ratio and a
+    ``regression`` flag. Sizes and stages without history get no baseline.
+    """
+    table = results[KEYS + ['seconds', 'peak_rss_mb']].copy()
+    if history is None or not len(history):
+        table['base_seconds'] = table['base_peak_rss_mb'] = float('nan')
+    else:
+        recent = history.groupby(KEYS, sort=False).tail(runs)
+        base = recent.groupby(KEYS)[['seconds', 'peak_rss_mb']].median().add_prefix('base_')
+        table = table.merge(base.reset_index(), on=KEYS, how='left')
+    table['slowdown'] = table['seconds'] / table['base_seconds']
+    slower = (table['seconds'] > tolerance * table['base_seconds']) & (
+        table['seconds'] - table['base_seconds'] > MIN_SECONDS)
+    bigger = (table['peak_rss_mb'] > tolerance * table['base_peak_rss_mb']) & (
+        table['peak_rss_mb'] - table['base_peak_rss_mb'] > MIN_MB)
+    table['regression'] = slower | bigger
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time each pipeline stage on synthetic VAERS drops.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help='numbers of reports to benchmark (default: %(default)s)')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='where the synthetic drops are kept')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='CSV the results are appended to')
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='slowdown ratio reported as a regression (default: %(default)s)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.data, args.workers, args.seed)
+    table = compare(results, read_history(args.history), args.tolerance)
+    append_history(results, args.history)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(table.to_string(index=False, float_format='{:.2f}'.format))
+    if table['regression'].any():
+        print('regressions:', ', '.join('{reports}/{stage}'.format(**row)
+                                         for row in table[table['regression']].to_dict('records')))
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
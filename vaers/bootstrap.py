@@ -0,0 +1,148 @@
+"""Bootstrap and Monte Carlo intervals for the risk comparisons.
+
+Resampling master_df row by row 10,000 times copies the frame 10,000
+times. But resampling reports with replacement only changes how many
+reports fall into each cell of the outcome cube. For the rate of an outcome
+per stratum, the cells are "stratum, with the outcome" and "stratum,
+without it". So one resample is a single draw from
+``Multinomial(N, cell counts / N)``: a vector of counts, not a frame.
+
+The COVID deaths in the CDC tables are not a sample of reports. They are
+varied as Poisson counts (Monte Carlo) when a ratio against them is needed.
+
+Resamples are drawn in fixed-size batches. Each batch gets its own child of
+one ``SeedSequence``, and the batches are spread over a process pool. The
+result depends on ``seed`` only, not on how many workers ran it.
+"""
+
+import numpy as np
+
+from .cube import REPORTS
+from .rates import PER, age_group_death_rates, manufacturer_denominators, manufacturer_rates
+from .registry import run_pool
+
+RESAMPLES = 10000
+BATCH = 1000
+
+
+def _seed_sequence(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def _multinomial_batch(counts, size, seed):
+    total = int(counts.sum())
+    draws = np.random.default_rng(seed).multinomial(total, counts / total, size=size)
+    return draws.astype('int32')
+
+
+def _poisson_batch(means, size, seed):
+    return np.random.default_rng(seed).poisson(means, size=(size, len(means))).astype('int32')
+
+
+def _draw(func, params, n, seed, batch, workers):
+    sizes = [batch] * (n // batch) + ([n % batch] if n % batch else [])
+    seeds = _seed_sequence(seed).spawn(len(sizes))
+    jobs = [(params, size, child) for size, child in zip(sizes, seeds)]
+    return np.concatenate(run_pool(func, jobs, workers))
+
+
+def resample_counts(counts, n=RESAMPLES, seed=0, batch=BATCH, workers=None):
+    """``n`` bootstrap resamples of category counts, as an ``(n, len(counts))`` int32 array."""
+    counts = np.asarray(counts, dtype='float64')
+    return _draw(_multinomial_batch, counts, n, seed, batch, workers)
+
+
+def poisson_counts(means, n=RESAMPLES, seed=0, batch=BATCH, workers=None):
+    """``n`` Monte Carlo draws of independent Poisson counts, ``(n, len(means))``."""
+    means = np.asarray(means, dtype='float64')
+    return _draw(_poisson_batch, means, n, seed, batch, workers)
+
+
+def outcome_resamples(cube, dimensions, measure, n=RESAMPLES, seed=0, batch=BATCH, workers=None):
+    """Resampled ``(reports, events)`` per stratum of ``dimensions``.
+
+    Returns ``(index, reports, events)``, the two arrays being ``(n, strata)``.
+    Only strata with at least one report are kept (the others never get any).
+    """
+    dimensions = [dimensions] if isinstance(dimensions, str) else list(dimensions)
+    table = cube.rollup(*dimensions)
+    table = table[table[REPORTS] > 0]
+    events = table[measure].to_numpy()
+    others = table[REPORTS].to_numpy() - events
+    draws = resample_counts(np.concatenate([events, others]), n, seed, batch, workers)
+    strata = len(events)
+    return table.index, draws[:, :strata] + draws[:, strata:], draws[:, :strata]
+
+
+def interval(samples, alpha=0.05):
+    """Percentile interval over the resamples (axis 0)."""
+    with np.errstate(invalid='ignore'):
+        return np.nanquantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+
+
+def _aligned(index, samples, keys):
+    """Columns of ``samples`` in the order of ``keys``; zeros for unseen keys."""
+    positions = index.get_indexer(keys)
+    aligned = samples[:, positions]
+    aligned[:, positions < 0] = 0
+    return aligned
+
+
+def _add_bands(table, name, samples, alpha):
+    lower, upper = interval(samples, alpha)
+    table[name + '_BOOT_LOWER'] = lower
+    table[name + '_BOOT_UPPER'] = upper
+
+
+def age_group_risk_bands(cube, denominators, n=RESAMPLES, alpha=0.05, seed=0,
+                         batch=BATCH, workers=None):
+    """Vaccine vs COVID death rates per CDC age group with resampled bands (In[32]).
+
+    ``cube`` needs an AGE_GROUP_CDC dimension. RISK_RATIO is COVID deaths
+    per 100k cases over vaccine deaths per 100k vaccinated.
+    """
+    table = age_group_death_rates(cube.rollup('AGE_GROUP_CDC'), denominators)
+    keys = table['AGE_GROUP_CDC'].to_numpy()
+    boot_seed, mc_seed = _seed_sequence(seed).spawn(2)
+
+    index, _, died = outcome_resamples(cube, 'AGE_GROUP_CDC', 'DIED', n, boot_seed, batch, workers)
+    vaccine = _aligned(index, died, keys) / table['POPULATION'].to_numpy() * PER
+    covid = poisson_counts(table['COVID_DEATHS'], n, mc_seed, batch, workers)
+    covid = covid / table['COVID_CASES'].to_numpy() * PER
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['RISK_RATIO'] = table['COVID_DEATHS_RATE'] / table['DIED_RATE']
+        ratio = covid / vaccine
+    _add_bands(table, 'DIED_RATE', vaccine, alpha)
+    _add_bands(table, 'COVID_DEATHS_RATE', covid, alpha)
+    _add_bands(table, 'RISK_RATIO', ratio, alpha)
+    return table
+
+
+def manufacturer_risk_bands(cube, denominators=None, measures=('DIED', 'HOSPITAL'),
+                            n=RESAMPLES, alpha=0.05, seed=0, batch=BATCH, workers=None):
+    """Rates per 100k vaccinated per manufacturer with bootstrap bands (In[33]).
+
+    ``<measure>_RATIO`` compares each manufacturer with all of them together,
+    and is computed within each resample so both sides move together.
+    """
+    if denominators is None:
+        denominators = manufacturer_denominators()
+    table = manufacturer_rates(cube.rollup('VAX_MANU'), denominators)
+    keys = table['VAX_MANU'].to_numpy()
+    population = table['POPULATION'].to_numpy()
+
+    for measure, child in zip(measures, _seed_sequence(seed).spawn(len(measures))):
+        index, _, events = outcome_resamples(cube, 'VAX_MANU', measure, n, child, batch, workers)
+        events = _aligned(index, events, keys)
+        rate = events / population * PER
+        overall = events.sum(axis=1, keepdims=True) / population.sum() * PER
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table[measure + '_RATIO'] = table[measure + '_RATE'] / (
+                table[measure].sum() / population.sum() * PER)
+            ratio = rate / overall
+        _add_bands(table, measure + '_RATE', rate, alpha)
+        _add_bands(table, measure + '_RATIO', ratio, alpha)
+    return table
@@ -0,0 +1,56 @@
+"""Age brackets as an ordered categorical column.
+
+Each scheme is a list of bin edges and labels. Bins include their lower edge
+and exclude their upper one, so every age falls into exactly one bracket.
+(The notebook's ``age_bracket_funct`` let 17.x and 84-85 slip through to
+'not known'.) Missing ages get the trailing 'not known' category.
+
+The brackets are assigned once on master_df. Cohorts taken from it after
+that carry the column along, so nothing has to be recomputed per subset.
+"""
+
+import numpy as np
+import pandas as pd
+
+NOT_KNOWN = 'not known'
+
+SCHEMES = {
+    # The brackets used throughout the notebook, with the gaps closed
+    'notebook': {
+        'edges': [0, 18, 30, 40, 50, 65, 75, 85, np.inf],
+        'labels': ['<18', '18-29', '30-39', '40-49', '50-64', '65-74', '75-84', '85+'],
+    },
+    # The groups in the CDC vaccination tables
+    'cdc': {
+        'edges': [0, 18, 30, 40, 50, 65, 75, np.inf],
+        'labels': ['<18', '18-29', '30-39', '40-49', '50-64', '65-74', '75+'],
+    },
+    'decade': {
+        'edges': [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, np.inf],
+        'labels': ['0-9', '10-19', '20-29', '30-39', '40-49', '50-59', '60-69',
+                   '70-79', '80-89', '90+'],
+    },
+}
+
+
+def labels(scheme='notebook'):
+    """Bracket labels for ``scheme`` in order, ending with 'not known'."""
+    return SCHEMES[scheme]['labels'] + [NOT_KNOWN]
+
+
+def bracket(ages, scheme='notebook'):
+    """Bin ``ages`` into an ordered categorical Series."""
+    spec = SCHEMES[scheme]
+    ages = pd.Series(ages)
+    codes = np.searchsorted(spec['edges'], ages.to_numpy(dtype='float64', na_value=np.nan), side='right') - 1
+    # below the first edge, NaN (searchsorted puts it past the end) -> not known
+    not_known = len(spec['labels'])
+    codes[(codes < 0) | (codes >= not_known) | ages.isna().to_numpy()] = not_known
+    dtype = pd.CategoricalDtype(labels(scheme), ordered=True)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=ages.index, name=ages.name)
+
+
+def assign(df, scheme='notebook', column='AGE_YRS', out='AGE_BRACKET'):
+    """Add the ``out`` bracket column to ``df`` in place and return ``df``."""
+    df[out] = bracket(df[column], scheme).values
+    return df
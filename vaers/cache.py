@@ -0,0 +1,215 @@
+"""Columnar cache for the VAERS CSV drops.
+
+Parsing the raw VAERS CSVs is slow: the DATA file carries the free-text
+SYMPTOM_TEXT column and everything has to be decoded from latin1. The first
+time a file is loaded it is converted into a compressed Parquet file next to
+a small JSON manifest recording the source size, mtime and hash. Later loads
+read the Parquet file instead, and only the columns that were asked for.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from . import schema
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - the cache is skipped without pyarrow
+    pq = None
+
+
+TABLES = ('DATA', 'SYMPTOMS', 'VAX')
+
+# Columns the analysis actually reads from each table.
+ANALYSIS_COLUMNS = {
+    'DATA': ['VAERS_ID', 'RECVDATE', 'STATE', 'AGE_YRS', 'CAGE_YR', 'CAGE_MO',
+             'SEX', 'RPT_DATE', 'SYMPTOM_TEXT', 'DIED', 'DATEDIED', 'L_THREAT',
+             'ER_VISIT', 'HOSPITAL', 'HOSPDAYS', 'X_STAY', 'DISABLE', 'RECOVD',
+             'VAX_DATE', 'ONSET_DATE', 'NUMDAYS', 'LAB_DATA', 'V_ADMINBY',
+             'V_FUNDBY', 'OTHER_MEDS', 'CUR_ILL', 'HISTORY', 'PRIOR_VAX',
+             'SPLTTYPE', 'FORM_VERS', 'TODAYS_DATE', 'BIRTH_DEFECT',
+             'OFC_VISIT', 'ER_ED_VISIT', 'ALLERGIES'],
+    'SYMPTOMS': ['VAERS_ID', 'SYMPTOM1', 'SYMPTOMVERSION1', 'SYMPTOM2',
+                 'SYMPTOMVERSION2', 'SYMPTOM3', 'SYMPTOMVERSION3', 'SYMPTOM4',
+                 'SYMPTOMVERSION4', 'SYMPTOM5', 'SYMPTOMVERSION5'],
+    'VAX': ['VAERS_ID', 'VAX_TYPE', 'VAX_MANU', 'VAX_LOT', 'VAX_DOSE_SERIES',
+            'VAX_ROUTE', 'VAX_SITE', 'VAX_NAME'],
+}
+
+# pandas guesses differently from year to year (and from chunk to chunk) for
+# columns that are mostly empty, so pin the types down up front.
+NUMERIC_COLUMNS = ['AGE_YRS', 'CAGE_YR', 'CAGE_MO', 'HOSPDAYS', 'NUMDAYS',
+                   'FORM_VERS', 'SYMPTOMVERSION1', 'SYMPTOMVERSION2',
+                   'SYMPTOMVERSION3', 'SYMPTOMVERSION4', 'SYMPTOMVERSION5']
+
+
+def csv_dtypes(columns):
+    """Return the read_csv dtype mapping for the given CSV header."""
+    dtypes = {}
+    for column in columns:
+        if column == 'VAERS_ID':
+            dtypes[column] = 'int64'
+        elif column in NUMERIC_COLUMNS:
+            dtypes[column] = 'float64'
+        else:
+            dtypes[column] = 'object'
+    return dtypes
+
+
+def read_source(path, columns=None, apply_schema=True, **kwargs):
+    """Read a raw VAERS CSV with the dtypes used by the rest of the package.
+
+    With ``apply_schema`` the columns are converted to the compact types of
+    :data:`vaers.schema.SCHEMA`. Passing ``chunksize`` returns an iterator of
+    frames, as with read_csv.
+    """
+    header = pd.read_csv(path, encoding='latin1', nrows=0).columns
+    if columns is not None:
+        header = [c for c in header if c in columns]
+    result = pd.read_csv(path, encoding='latin1', usecols=list(header),
+                         dtype=csv_dtypes(header), **kwargs)
+    if not apply_schema:
+        return result
+    if kwargs.get('chunksize'):
+        return (schema.apply(chunk) for chunk in result)
+    return schema.apply(result)
+
+
+def source_path(root, year, table):
+    """Find ``{year}VAERS{table}.csv`` anywhere under ``root``."""
+    pattern = os.path.join(root, '**', '{}VAERS{}.csv'.format(year, table))
+    matches = sorted(glob.glob(pattern, recursive=True))
+    if not matches:
+        raise FileNotFoundError('No {}VAERS{}.csv under {}'.format(year, table, root))
+    return matches[0]
+
+
+def file_hash(path, block_size=1 << 23):
+    """Hash a file in blocks so multi-GB drops don't have to fit in memory."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_paths(path, cache_dir=None):
+    """Return the (parquet, manifest) paths used to cache ``path``."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.vaers_cache')
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(cache_dir, name + '.parquet'),
+            os.path.join(cache_dir, name + '.json'))
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp = manifest_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def is_fresh(path, cache_dir=None):
+    """True if the cached copy of ``path`` matches the file on disk.
+
+    Size and mtime are checked first. If only the mtime moved (the weekly
+    drop re-extracted an unchanged file) the hash decides, and the manifest
+    is updated so the next check is cheap again.
+    """
+    parquet_path, manifest_path = cache_paths(path, cache_dir)
+    manifest = _read_manifest(manifest_path)
+    if manifest is None or not os.path.exists(parquet_path):
+        return False
+    if manifest.get('schema') != schema.SCHEMA_VERSION:
+        return False
+    stat = os.stat(path)
+    if manifest['size'] != stat.st_size:
+        return False
+    if manifest['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if manifest['hash'] != file_hash(path):
+        return False
+    manifest['mtime_ns'] = stat.st_mtime_ns
+    _write_manifest(manifest_path, manifest)
+    return True
+
+
+def build_cache(path, cache_dir=None):
+    """Convert one raw CSV into its Parquet cache and return the frame."""
+    parquet_path, manifest_path = cache_paths(path, cache_dir)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    stat = os.stat(path)
+    df = read_source(path)
+
+    tmp = parquet_path + '.tmp'
+    df.to_parquet(tmp, engine='pyarrow', compression='zstd', index=False)
+    os.replace(tmp, parquet_path)
+    _write_manifest(manifest_path, {
+        'source': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': file_hash(path),
+        'rows': len(df),
+        'columns': list(df.columns),
+        'schema': schema.SCHEMA_VERSION,
+    })
+    return df
+
+
+def load_table(path, columns=None, cache_dir=None, refresh=False):
+    """Load a VAERS CSV through the Parquet cache.
+
+    ``columns`` limits what is read back; columns missing from an older year
+    are skipped rather than raising. Without pyarrow the CSV is read directly.
+    """
+    if pq is None:
+        return read_source(path, columns=columns)
+
+    parquet_path, _ = cache_paths(path, cache_dir)
+    if refresh or not is_fresh(path, cache_dir):
+        df = build_cache(path, cache_dir)
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+    if columns is not None:
+        available = pq.read_schema(parquet_path).names
+        columns = [c for c in available if c in columns]
+    return pd.read_parquet(parquet_path, columns=columns)
+
+
+def load_year(root, year, tables=TABLES, columns=ANALYSIS_COLUMNS, cache_dir=None):
+    """Load the DATA/SYMPTOMS/VAX tables for one year as a dict of frames."""
+    return {table: load_table(source_path(root, year, table),
+                              columns=columns.get(table) if columns else None,
+                              cache_dir=cache_dir)
+            for table in tables}
+
+
+def ingest(root, cache_dir=None, refresh=False):
+    """Bring the cache up to date for every VAERS CSV under ``root``.
+
+    Returns a list of ``(path, rebuilt)`` pairs so a weekly refresh can log
+    which files actually changed.
+    """
+    pattern = os.path.join(root, '**', '*VAERS*.csv')
+    done = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        stale = refresh or not is_fresh(path, cache_dir)
+        if stale:
+            build_cache(path, cache_dir)
+        done.append((path, stale))
+    return done
@@ -0,0 +1,37 @@
+"""The report subsets the analysis keeps coming back to.
+
+The notebook looks at everyone, the hospitalized (``HOSPITAL == 'Y'``) and
+those who died (``DIED == 'Y'``). Cohorts are boolean masks over master_df
+rather than filtered copies, so derived columns only need computing once.
+"""
+
+import numpy as np
+import pandas as pd
+
+# name -> outcome flag (None means every report)
+COHORTS = {
+    'all': None,
+    'hospitalized': 'HOSPITAL',
+    'died': 'DIED',
+}
+
+
+def flag_mask(series):
+    """Boolean array for a VAERS 'Y'/blank flag column (raw or already bool)."""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.fillna(False).to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.fillna(0).to_numpy() > 0
+    return (series == 'Y').fillna(False).to_numpy(dtype=bool)
+
+
+def cohort_mask(df, cohort, cohorts=COHORTS):
+    """Mask for a cohort name from ``cohorts``."""
+    flag = cohorts[cohort]
+    if flag is None:
+        return np.ones(len(df), dtype=bool)
+    return flag_mask(df[flag])
+
+
+def cohort_masks(df, cohorts=COHORTS):
+    return {name: cohort_mask(df, name, cohorts) for name in cohorts}
@@ -0,0 +1,169 @@
+"""Flag pre-existing conditions in HISTORY (or any text column) in one pass.
+
+The notebook answers "did the patient have heart problems" with
+``str.contains('heart|htn|hypertension')``, i.e. a separate regex scan of
+the column for every question. Here every keyword of every condition group
+in ``data/conditions.json`` is compiled into one Aho-Corasick automaton, and
+each distinct text is walked once. The cost of that walk doesn't depend on
+how many groups or keywords there are.
+
+Each group lists ``keywords``, matched anywhere in the lower-cased text like
+``str.contains`` does, and optionally ``words``: short abbreviations
+('cad', 'tia', 'mi') that only count when they stand alone. HISTORY is
+matched after :func:`vaers.normalize.normalize`, which turns ``,-./`` into
+spaces, so keywords are written that way too ('a fib', not 'a-fib').
+
+The C implementation from ``pyahocorasick`` is used when it's installed,
+otherwise a pure Python automaton with the same results.
+"""
+
+import collections
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional speed-up
+    ahocorasick = None
+
+DEFAULT_GROUPS = os.path.join(os.path.dirname(__file__), 'data', 'conditions.json')
+
+
+class Automaton(object):
+    """A plain Python Aho-Corasick automaton over lower-case strings."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._link()
+
+    def _add(self, pattern, index):
+        state = 0
+        for char in pattern:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append(index)
+
+    def _link(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter(self, text):
+        """Yield ``(end_index, pattern_index)`` for every match in ``text``."""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                yield position, index
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class ConditionMatcher(object):
+    """All condition groups compiled into one automaton."""
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        # pattern -> [(group index, whole word only)]
+        targets = collections.defaultdict(list)
+        for g, name in enumerate(self.groups):
+            spec = groups[name]
+            for keyword in spec.get('keywords', []):
+                targets[keyword.lower()].append((g, False))
+            for word in spec.get('words', []):
+                targets[word.lower()].append((g, True))
+        self.patterns = list(targets)
+        self.targets = [targets[p] for p in self.patterns]
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for index, pattern in enumerate(self.patterns):
+                self._automaton.add_word(pattern, index)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = Automaton(self.patterns)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_GROUPS):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _matches(self, text):
+        if not self.patterns:
+            return ()
+        return self._automaton.iter(text)
+
+    def match(self, text):
+        """Boolean flag per group for a single string."""
+        flags = np.zeros(len(self.groups), dtype=bool)
+        if not isinstance(text, str):
+            return flags
+        text = text.lower()
+        for end, index in self._matches(text):
+            for group, whole_word in self.targets[index]:
+                if flags[group]:
+                    continue
+                if whole_word:
+                    start = end - len(self.patterns[index]) + 1
+                    if start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if end + 1 < len(text) and _is_word_char(text[end + 1]):
+                        continue
+                flags[group] = True
+        return flags
+
+    def flags(self, series):
+        """Report x group boolean DataFrame for a text column.
+
+        Each distinct value is scanned once and the result mapped back onto
+        the rows, so repeated HISTORY entries ('none', 'htn', ...) are free.
+        """
+        codes, uniques = pd.factorize(series)
+        table = np.zeros((len(uniques) + 1, len(self.groups)), dtype=bool)
+        for i, text in enumerate(uniques):
+            table[i] = self.match(text)
+        # the trailing all-False row is picked up by missing values (code -1)
+        return pd.DataFrame(table[codes], index=series.index, columns=self.groups)
+
+
+def flag_conditions(df, columns=('HISTORY',), groups=DEFAULT_GROUPS):
+    """Condition flags for each report, OR-ed across ``columns``.
+
+    ``groups`` is a path to a JSON file like ``data/conditions.json`` or an
+    already-loaded dict.
+    """
+    if isinstance(groups, dict):
+        matcher = ConditionMatcher(groups)
+    else:
+        matcher = ConditionMatcher.from_file(groups)
+    result = None
+    for column in columns:
+        flags = matcher.flags(df[column])
+        result = flags if result is None else result | flags
+    return result
@@ -0,0 +1,137 @@
+"""Outcome counts over the main dimensions, computed once.
+
+Every chart in the notebook runs its own groupby or value_counts over
+master_df (or over the ``died`` / ``hospitalized`` copies of it).
+:class:`OutcomeCube` counts the reports and each outcome flag once, for
+every combination of VAX_MANU x AGE_BRACKET x SEX x STATE x
+VAX_DOSE_SERIES, in a dense numpy array. After that a chart only needs:
+
+    cube.rollup('AGE_BRACKET')                    # sum out the other dimensions
+    cube.slice(VAX_MANU='MODERNA').rollup('SEX')  # fix some dimensions first
+
+Both operate on the small array, not on the reports. Missing values are
+counted under ``'not known'``.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from .brackets import NOT_KNOWN
+from .cohorts import COHORTS, flag_mask
+
+DIMENSIONS = ('VAX_MANU', 'AGE_BRACKET', 'SEX', 'STATE', 'VAX_DOSE_SERIES')
+MEASURES = ('DIED', 'HOSPITAL', 'L_THREAT', 'ER_VISIT', 'DISABLE')
+REPORTS = 'REPORTS'
+
+
+def _codes(series):
+    """Integer codes and labels for one dimension, missing values -> NOT_KNOWN."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy().astype('int64')
+        labels = list(series.cat.categories)
+    else:
+        codes, labels = pd.factorize(series, sort=True)
+        labels = list(labels)
+    if NOT_KNOWN not in labels:
+        labels.append(NOT_KNOWN)
+    codes[codes < 0] = labels.index(NOT_KNOWN)
+    return codes, pd.Index(labels, name=series.name)
+
+
+class OutcomeCube(object):
+    """Report and outcome counts for every combination of ``dimensions``.
+
+    ``counts`` has one axis per dimension plus a last axis for the
+    measures, the first of which is always ``REPORTS``.
+    """
+
+    def __init__(self, counts, labels, measures):
+        self.counts = counts
+        self.labels = labels  # list of pd.Index, one per dimension
+        self.measures = list(measures)
+
+    @classmethod
+    def from_frame(cls, df, dimensions=DIMENSIONS, measures=MEASURES):
+        codes, labels = zip(*[_codes(df[d]) for d in dimensions])
+        shape = tuple(len(l) for l in labels)
+        size = int(np.prod(shape))
+        cells = np.ravel_multi_index(codes, shape)
+
+        counts = np.empty((size, len(measures) + 1), dtype='int64')
+        counts[:, 0] = np.bincount(cells, minlength=size)
+        for j, measure in enumerate(measures, 1):
+            counts[:, j] = np.bincount(cells[flag_mask(df[measure])], minlength=size)
+        return cls(counts.reshape(shape + (len(measures) + 1,)), list(labels),
+                   [REPORTS] + list(measures))
+
+    @property
+    def dimensions(self):
+        return [l.name for l in self.labels]
+
+    def _axis(self, dimension):
+        try:
+            return self.dimensions.index(dimension)
+        except ValueError:
+            raise KeyError('{!r} is not a dimension of the cube'.format(dimension))
+
+    def rollup(self, *dimensions):
+        """Counts by ``dimensions`` with every other dimension summed out.
+
+        Returns a DataFrame with one column per measure, or a Series of
+        totals when no dimension is given.
+        """
+        axes = [self._axis(d) for d in dimensions]
+        others = tuple(a for a in range(len(self.labels)) if a not in axes)
+        counts = self.counts.sum(axis=others)
+        if not dimensions:
+            return pd.Series(counts, index=self.measures)
+        # sum keeps the cube's axis order; put the axes in the order asked for
+        kept = sorted(axes)
+        counts = np.moveaxis(counts, [kept.index(a) for a in axes], range(len(axes)))
+        if len(axes) == 1:
+            index = self.labels[axes[0]]
+        else:
+            index = pd.MultiIndex.from_product([self.labels[a] for a in axes])
+        return pd.DataFrame(counts.reshape(len(index), -1), index=index, columns=self.measures)
+
+    def slice(self, **criteria):
+        """Sub-cube keeping only the given value (or list of values) per dimension."""
+        counts, labels = self.counts, list(self.labels)
+        for dimension, values in criteria.items():
+            axis = self._axis(dimension)
+            if np.ndim(values) == 0:
+                values = [values]
+            positions = labels[axis].get_indexer(values)
+            if (positions < 0).any():
+                missing = [v for v, p in zip(values, positions) if p < 0]
+                raise KeyError('{} not in {}'.format(missing, dimension))
+            counts = counts.take(positions, axis=axis)
+            labels[axis] = labels[axis][positions]
+        return OutcomeCube(counts, labels, self.measures)
+
+    def cohort_counts(self, dimension, cohorts=COHORTS):
+        """Reports per value of ``dimension`` for each cohort (all, hospitalized, died)."""
+        table = self.rollup(dimension)
+        columns = {name: table[REPORTS if flag is None else flag] for name, flag in cohorts.items()}
+        return pd.DataFrame(columns)
+
+    def to_frame(self):
+        """Long table of the non-empty cells."""
+        index = pd.MultiIndex.from_product(self.labels)
+        frame = pd.DataFrame(self.counts.reshape(len(index), -1), index=index, columns=self.measures)
+        return frame[frame[REPORTS] > 0]
+
+    def save(self, path):
+        meta = {'dimensions': self.dimensions, 'measures': self.measures,
+                'labels': [[str(v) for v in l] for l in self.labels]}
+        np.savez_compressed(path, counts=self.counts, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            counts = data['counts']
+        labels = [pd.Index(l, name=d) for l, d in zip(meta['labels'], meta['dimensions'])]
+        return cls(counts, labels, meta['measures'])
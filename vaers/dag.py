@@ -0,0 +1,290 @@
+"""The analysis as a graph of named stages, each cached on disk by content.
+
+The notebook is one long chain (load, merge, dedupe, clean, tokenize,
+aggregate, plot), so a new stopword or a tweak to a chart meant running
+everything again. Here every stage names the stages it reads from, and its
+result is stored under a key hashed from:
+
+- the stage name and its parameters,
+- the source of its function and of the modules or helper functions it
+  depends on (``code``),
+- the data files it reads (``files``: VAERS drops, CDC tables, the JSON
+  lists in ``vaers/data``),
+- the keys of its inputs, so a change upstream changes every key below it,
+- the Python, numpy and pandas versions the result was pickled with.
+
+A stage whose key is already in the :class:`ArtifactStore` is not run, and
+its result is only read back if a stage that has to run needs it. Editing
+the stopword list reruns the word clouds and phrases from the cached clean
+table, not the load and merge before them.
+
+The store is a folder of pickles. A hit touches the file, so the file mtimes
+are the least-recently-used order, and the oldest artifacts are removed
+when the folder grows past ``max_bytes``.
+"""
+
+import collections
+import contextlib
+import hashlib
+import inspect
+import io
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .cache import file_hash
+
+MAX_BYTES = 4 * 2 ** 30
+SUFFIX = '.pkl'
+FILES_INDEX = 'files.json'
+
+Stage = collections.namedtuple('Stage', ['name', 'func', 'inputs', 'params', 'options', 'code', 'files',
+                                         'outputs'])
+
+
+def _digest(value):
+    text = json.dumps(value, sort_keys=True, default=repr)
+    return hashlib.blake2b(text.encode('utf8'), digest_size=20).hexdigest()
+
+
+def csv_bytes(frame, **kwargs):
+    """A table as the bytes of its CSV file, for a stage's ``outputs``."""
+    return frame.to_csv(**kwargs).encode('utf8')
+
+
+def figure_bytes(draw, *args, **kwargs):
+    """PNG bytes of a :mod:`vaers.plots` figure (``draw`` gets a buffer as its path)."""
+    buffer = io.BytesIO()
+    draw(*args, path=buffer, **kwargs)
+    return buffer.getvalue()
+
+
+class ArtifactStore(object):
+    """Pickled stage results keyed by content hash, with LRU eviction at ``max_bytes``."""
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            value = pickle.load(f)
+        self.touch(key)
+        return value
+
+    def touch(self, key):
+        os.utime(self._path(key))
+
+    def put(self, key, value, keep=()):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict(keep={key}.union(keep))
+
+    def entries(self):
+        """``(key, bytes, last used)`` of every artifact, least recently used first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((name[:-len(SUFFIX)], stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=()):
+        """Remove least-recently-used artifacts until the store fits ``max_bytes``.
+
+        Keys in ``keep`` stay even if that leaves the store over the limit.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            os.remove(self._path(key))
+            total -= size
+            removed.append(key)
+        return removed
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            os.remove(self._path(key))
+
+    def file_digest(self, path):
+        """Hash of a file, only re-read when its size or mtime changed since last time."""
+        if self._files is None:
+            try:
+                with open(os.path.join(self.directory, FILES_INDEX)) as f:
+                    self._files = json.load(f)
+            except (OSError, ValueError):
+                self._files = {}
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self._files.get(path)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = file_hash(path)
+        self._files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = os.path.join(self.directory, FILES_INDEX + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self._files, f)
+        os.replace(tmp, os.path.join(self.directory, FILES_INDEX))
+        return digest
+
+
+def _source_digest(code):
+    """Hash of a module's file, a path, or one function's source."""
+    if isinstance(code, str):
+        return file_hash(code)
+    if inspect.ismodule(code):
+        return file_hash(code.__file__)
+    return hashlib.blake2b(inspect.getsource(code).encode('utf8'), digest_size=20).hexdigest()
+
+
+class Pipeline(object):
+    """Named stages and the order they can run in.
+
+    ``add`` registers ``func``, called as ``func(*input results, **params,
+    **options)``. ``code`` lists the modules and functions it calls whose
+    edits should rerun it (its own source always counts). ``params`` are
+    part of the cache key, ``options`` (worker counts and the like) are
+    not, so they must not change the result.
+    A stage with ``outputs=True`` returns ``{file name: bytes}``, written to
+    the output folder on every run whether it came from the cache or not.
+    """
+
+    def __init__(self, store=None, versions=None):
+        self.store = store
+        self.stages = collections.OrderedDict()
+        self.versions = versions or {'python': sys.version.split()[0], 'numpy': np.__version__,
+                                     'pandas': pd.__version__}
+        self._code = {}
+
+    def add(self, name, func, inputs=(), params=None, options=None, code=(), files=(), outputs=False):
+        if name in self.stages:
+            raise ValueError('stage {!r} added twice'.format(name))
+        for upstream in inputs:
+            if upstream not in self.stages:
+                raise ValueError('stage {!r} reads {!r}, which has not been added'.format(name, upstream))
+        self.stages[name] = Stage(name, func, tuple(inputs), dict(params or {}), dict(options or {}),
+                                  (func,) + tuple(code), tuple(files), outputs)
+        return self
+
+    def _file_digest(self, path):
+        if self.store is not None:
+            return self.store.file_digest(path)
+        return file_hash(path)
+
+    def _code_digest(self, code):
+        if code not in self._code:
+            self._code[code] = _source_digest(code)
+        return self._code[code]
+
+    def keys(self):
+        """The cache key of every stage, in the order they were added."""
+        keys = {}
+        for name, stage in self.stages.items():
+            keys[name] = _digest({
+                'stage': name,
+                'params': stage.params,
+                'code': sorted(set(self._code_digest(c) for c in stage.code)),
+                'files': [self._file_digest(p) for p in stage.files],
+                'inputs': [keys[i] for i in stage.inputs],
+                'versions': self.versions,
+            })
+        return keys
+
+    def needed(self, targets=None):
+        """The targets and every stage they read from, in run order."""
+        wanted = set()
+        pending = list(targets or self.stages)
+        while pending:
+            name = pending.pop()
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self.stages[name].inputs)
+        return [name for name in self.stages if name in wanted]
+
+    def run(self, targets=None, out_dir=None, force=(), timer=None, log=None):
+        """Bring ``targets`` (default: every stage) up to date; returns ``{stage: 'cached'|'ran'|'skipped'}``.
+
+        Stages named in ``force`` run even if cached. Results of stages that
+        don't have to run are not read back unless a running stage needs
+        them, and every result is dropped from memory once its last reader
+        has run.
+        """
+        order = self.needed(targets)
+        force = set(force)
+        keys = self.keys() if self.store is not None else {}
+        # a stage runs if it is forced or missing; otherwise it is read back only when needed
+        runs = {name: name in force or self.store is None or keys[name] not in self.store for name in order}
+        readers = collections.Counter(i for name in order if runs[name] for i in self.stages[name].inputs)
+        if out_dir is not None:
+            readers.update(name for name in order if self.stages[name].outputs)
+        # what this run reads back is in use, so its own puts must not evict it
+        reads = {keys[name] for name in order if not runs[name] and readers[name]}
+        for key in reads:
+            self.store.touch(key)
+
+        values, status = {}, {}
+        for name in order:
+            stage = self.stages[name]
+            if not runs[name] and not readers[name]:
+                status[name] = 'skipped'
+                continue
+            with timer.stage(name) if timer is not None else contextlib.nullcontext():
+                if runs[name]:
+                    value = stage.func(*[values[i] for i in stage.inputs], **dict(stage.params, **stage.options))
+                    if self.store is not None:
+                        self.store.put(keys[name], value, keep=reads)
+                    status[name] = 'ran'
+                else:
+                    value = self.store.get(keys[name])
+                    status[name] = 'cached'
+                if runs[name]:
+                    for upstream in stage.inputs:
+                        readers[upstream] -= 1
+                        if not readers[upstream]:
+                            values.pop(upstream, None)
+                if stage.outputs and out_dir is not None:
+                    _write_outputs(value, out_dir)
+                    readers[name] -= 1
+                if readers[name]:
+                    values[name] = value
+        if log is not None:
+            cached = [name for name in order if status[name] != 'ran']
+            log('cached: {}'.format(', '.join(cached) if cached else 'nothing'))
+        return status
+
+
+def _write_outputs(files, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, content in files.items():
+        path = os.path.join(out_dir, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
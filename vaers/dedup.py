@@ -0,0 +1,56 @@
+"""Collapse the merged VAX/DATA frame to one row per VAERS_ID.
+
+A report lists every vaccine the patient got, so after merging VAX onto
+DATA a VAERS_ID can appear several times (one row per dose or product).
+Everything here works on positions rather than index labels, since the
+labels repeat once the yearly frames have been concatenated.
+
+Policies:
+
+- ``'first'``: keep the first row for each VAERS_ID.
+- ``'list'``: keep the first row, and turn the VAX columns into lists
+  holding the value from every row of the report.
+- ``'count'``: keep the first row and add a ``VAX_COUNT`` column with the
+  number of VAX rows the report had.
+"""
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+POLICIES = ('first', 'list', 'count')
+
+VAX_COLUMNS = ['VAX_TYPE', 'VAX_MANU', 'VAX_LOT', 'VAX_DOSE_SERIES',
+               'VAX_ROUTE', 'VAX_SITE', 'VAX_NAME']
+
+DedupeReport = collections.namedtuple('DedupeReport', ['policy', 'rows_in', 'rows_out', 'collapsed'])
+
+
+def dedupe(df, policy='first', key='VAERS_ID', vax_columns=VAX_COLUMNS):
+    """Return ``(frame, report)`` with one row per ``key``.
+
+    The returned frame has a fresh RangeIndex and keeps the order in which
+    each key first appeared. ``report.collapsed`` is the number of rows that
+    were folded into another row.
+    """
+    if policy not in POLICIES:
+        raise ValueError('Unknown dedupe policy {!r}, expected one of {}'.format(policy, POLICIES))
+
+    codes, uniques = pd.factorize(df[key], sort=False)
+    # factorize numbers the keys in order of first appearance, so the first
+    # row of group i is the i-th non-duplicated row.
+    first = np.flatnonzero(~pd.Series(codes).duplicated().to_numpy())
+    out = df.iloc[first].reset_index(drop=True)
+
+    if policy == 'count':
+        out['VAX_COUNT'] = np.bincount(codes, minlength=len(uniques)).astype('int32')
+    elif policy == 'list':
+        columns = [c for c in vax_columns if c in df.columns]
+        if columns:
+            lists = df[columns].reset_index(drop=True).groupby(codes, sort=True).agg(list)
+            for column in columns:
+                out[column] = lists[column].to_numpy()
+
+    report = DedupeReport(policy, len(df), len(out), len(df) - len(out))
+    return out, report
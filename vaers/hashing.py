@@ -0,0 +1,21 @@
+"""Vectorized 64 bit hashing for the sketches in :mod:`vaers.neardup` and :mod:`vaers.phrases`.
+
+Both work on arrays of uint64 hashes (of words, shingles or phrases) and
+need more hashes of the same values, one per seed, with every bit usable
+for picking a bin or a counter. :func:`mix64` is the splitmix64 finalizer
+with the seed added first; numpy's uint64 arithmetic wraps, as the
+finalizer expects.
+"""
+
+import numpy as np
+
+# 2**64 / golden ratio: an odd constant with well spread bits, used as a multiplier
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix64(hashes, seed=0):
+    """Seeded 64 bit finalizer (splitmix64) of a uint64 array."""
+    h = hashes + np.uint64(seed * int(GOLDEN) & 0xFFFFFFFFFFFFFFFF)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
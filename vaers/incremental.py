@@ -0,0 +1,268 @@
+"""Weekly refresh that only reprocesses the reports that changed.
+
+VAERS publishes cumulative files, so each new drop repeats every report
+seen so far. Instead of re-running the whole notebook, the processed master
+table and the aggregate counts are kept in a state directory:
+
+    <state dir>/master.parquet      cleaned, bracketed rows + ROW_HASH
+    <state dir>/aggregates.parquet  (AGGREGATE, COHORT, KEY) -> COUNT
+    <state dir>/lots.npz            reports and outcomes per lot and week
+    <state dir>/state.json          summary of the last refresh
+
+On refresh the new drop is merged and deduped as usual, and each row is
+hashed. Comparing the hashes by VAERS_ID splits the reports into new,
+changed and removed ones. Only new and changed rows are cleaned and
+tokenized. The counts of removed and changed rows (taken from the stored
+processed rows) are subtracted from the aggregates, and the counts of the
+freshly cleaned rows are added. The per-lot weekly counts
+(:class:`vaers.lots.LotCounts`) are updated the same way.
+
+    python -m vaers.incremental --root /path/to/vaers --state .vaers_cache/incremental --out report/
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import brackets
+from .cohorts import COHORTS, cohort_masks
+from .cube import REPORTS
+from .lots import LotCounts, lot_signals
+from .normalize import normalize
+from .registry import combine, load_covid
+from .rates import manufacturer_rates
+from .report import FREQUENCY_TOP, REPO_ROOT, build_master
+from .timeseries import MISSING, DailyCounts, dates, days
+from .tokens import TokenMatrix
+
+DEFAULT_STATE = os.path.join(REPO_ROOT, '.vaers_cache', 'incremental')
+
+AGGREGATE_KEYS = ['AGGREGATE', 'COHORT', 'KEY']
+
+# bump when contributions() or the stored files change so older states are rebuilt from scratch
+STATE_VERSION = 3
+
+Delta = collections.namedtuple('Delta', 'added changed removed')
+
+
+def row_hashes(master):
+    """64 bit hash of every raw row, used to notice reports that were edited."""
+    return pd.util.hash_pandas_object(master, index=False).to_numpy()
+
+
+def diff(old_ids, old_hashes, new_ids, new_hashes):
+    """Split VAERS_IDs into added, changed and removed ones (ids must be unique)."""
+    common, old_pos, new_pos = np.intersect1d(old_ids, new_ids, assume_unique=True,
+                                              return_indices=True)
+    return Delta(
+        added=np.setdiff1d(new_ids, old_ids, assume_unique=True),
+        changed=common[old_hashes[old_pos] != new_hashes[new_pos]],
+        removed=np.setdiff1d(old_ids, new_ids, assume_unique=True),
+    )
+
+
+def process(raw):
+    """The per-row work of the notebook: clean the text and bracket the ages."""
+    master = normalize(raw.reset_index(drop=True))
+    return brackets.assign(master, 'notebook')
+
+
+def contributions(master, cohorts=COHORTS):
+    """What the rows of ``master`` add to each aggregate, as a counts Series."""
+    masks = cohort_masks(master, cohorts)
+    tokens = TokenMatrix.from_series(master['SYMPTOM_TEXT'])
+    received = days(master['RECVDATE'])
+    parts = []
+    for cohort, mask in masks.items():
+        offsets, per_day = np.unique(received[mask & (received != MISSING)], return_counts=True)
+        counts = {
+            'words': tokens.counts(mask),
+            'age_brackets': master.loc[mask, 'AGE_BRACKET'].value_counts(sort=False),
+            'manufacturers': master.loc[mask, 'VAX_MANU'].value_counts(sort=False),
+            'received': pd.Series(per_day, index=dates(offsets).strftime('%Y-%m-%d')),
+        }
+        for name, series in counts.items():
+            parts.append(pd.DataFrame({
+                'AGGREGATE': name,
+                'COHORT': cohort,
+                'KEY': series.index.astype(str),
+                'COUNT': series.to_numpy(dtype='int64'),
+            }))
+    frame = pd.concat(parts, ignore_index=True)
+    return frame.set_index(AGGREGATE_KEYS)['COUNT']
+
+
+def update(totals, added=None, removed=None):
+    """Apply added and removed contributions to the running totals."""
+    if added is not None:
+        totals = totals.add(added, fill_value=0)
+    if removed is not None:
+        totals = totals.sub(removed, fill_value=0)
+    return totals[totals > 0].astype('int64').sort_index().rename('COUNT')
+
+
+class IncrementalState(object):
+    """The processed master table and aggregates kept between refreshes."""
+
+    def __init__(self, directory=DEFAULT_STATE):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        if not os.path.exists(self._path('state.json')):
+            return False
+        return self.summary().get('version') == STATE_VERSION
+
+    def load(self):
+        """Return ``(master, aggregates)``; both empty before the first refresh."""
+        if not self.exists():
+            empty = pd.Series([], dtype='int64', name='COUNT',
+                              index=pd.MultiIndex.from_arrays([[], [], []], names=AGGREGATE_KEYS))
+            return None, empty
+        master = pd.read_parquet(self._path('master.parquet'))
+        aggregates = pd.read_parquet(self._path('aggregates.parquet'))
+        return master, aggregates.set_index(AGGREGATE_KEYS)['COUNT']
+
+    def load_lots(self):
+        """The stored :class:`LotCounts`; empty before the first refresh."""
+        if not self.exists():
+            return LotCounts.empty()
+        return LotCounts.load(self._path('lots.npz'))
+
+    def save(self, master, aggregates, summary, lots=None):
+        os.makedirs(self.directory, exist_ok=True)
+        # state.json is written last, so an interrupted save is simply not picked up
+        if os.path.exists(self._path('state.json')):
+            os.remove(self._path('state.json'))
+        master.to_parquet(self._path('master.parquet'), index=False, compression='zstd')
+        aggregates.reset_index().to_parquet(self._path('aggregates.parquet'), index=False)
+        if lots is not None:
+            lots.save(self._path('lots.npz'))
+        with open(self._path('state.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    def summary(self):
+        with open(self._path('state.json')) as f:
+            return json.load(f)
+
+
+def refresh(root, state_dir=DEFAULT_STATE, years=None, workers=None, log=print):
+    """Bring the stored master table and aggregates up to date with ``root``.
+
+    Returns ``(master, aggregates, delta)``.
+    """
+    state = IncrementalState(state_dir)
+    old_master, totals = state.load()
+    lots = state.load_lots()
+
+    raw, _ = build_master(load_covid(root, years, workers=workers))
+    hashes = row_hashes(raw)
+    raw_ids = raw['VAERS_ID'].to_numpy()
+    if old_master is None:
+        old_ids, old_hashes = np.empty(0, 'int64'), np.empty(0, 'uint64')
+    else:
+        old_ids, old_hashes = old_master['VAERS_ID'].to_numpy(), old_master['ROW_HASH'].to_numpy()
+    delta = diff(old_ids, old_hashes, raw_ids, hashes)
+    if log is not None:
+        log('refresh: {} new, {} changed, {} removed reports'.format(
+            len(delta.added), len(delta.changed), len(delta.removed)))
+
+    stale = np.isin(old_ids, np.concatenate([delta.changed, delta.removed]))
+    fresh = np.isin(raw_ids, np.concatenate([delta.added, delta.changed]))
+    fresh_rows = process(raw[fresh].assign(ROW_HASH=hashes[fresh]))
+
+    if stale.any():
+        totals = update(totals, removed=contributions(old_master[stale]))
+        lots = lots.subtract(LotCounts.from_frame(old_master[stale]))
+    if len(fresh_rows):
+        totals = update(totals, added=contributions(fresh_rows))
+        lots = lots.add(LotCounts.from_frame(fresh_rows))
+
+    if old_master is None:
+        master = fresh_rows
+    elif stale.any() or len(fresh_rows):
+        master = combine([old_master[~stale], fresh_rows])
+    else:
+        master = old_master
+    master = master.sort_values('VAERS_ID', ignore_index=True)
+    # the categorical loses its order when old and new rows are combined
+    brackets.assign(master, 'notebook')
+
+    state.save(master, totals, {
+        'version': STATE_VERSION,
+        'refreshed_at': time.time(),
+        'root': os.path.abspath(root),
+        'reports': len(master),
+        'added': len(delta.added),
+        'changed': len(delta.changed),
+        'removed': len(delta.removed),
+    }, lots=lots)
+    return master, totals, delta
+
+
+def aggregate(totals, name):
+    """cohort x key counts of one aggregate, with a column for every cohort.
+
+    A cohort without any report in the drop (no deaths yet, say) gets a
+    column of zeros rather than going missing.
+    """
+    table = totals.xs(name, level='AGGREGATE').unstack('COHORT', fill_value=0)
+    return table.reindex(columns=list(COHORTS), fill_value=0)
+
+
+def write_tables(totals, out_dir, top=FREQUENCY_TOP, lots=None):
+    """Write the aggregate tables (and the lot tables, given ``lots``) in the same layout as :mod:`vaers.report`."""
+    os.makedirs(out_dir, exist_ok=True)
+
+    words = aggregate(totals, 'words')
+    columns = {}
+    for cohort in words.columns:
+        counts = words[cohort][words[cohort] > 0].sort_values(ascending=False, kind='stable').head(top)
+        columns[cohort + '_word'] = counts.index.to_numpy()
+        columns[cohort + '_count'] = counts.to_numpy()
+    pd.DataFrame({k: pd.Series(v) for k, v in columns.items()}).to_csv(
+        os.path.join(out_dir, 'symptom_frequency.csv'), index=False)
+
+    ages = aggregate(totals, 'age_brackets').reindex(brackets.labels('notebook'), fill_value=0)
+    ages.rename_axis('AGE_BRACKET').to_csv(os.path.join(out_dir, 'age_brackets.csv'))
+
+    manufacturers = aggregate(totals, 'manufacturers')
+    manufacturers = pd.DataFrame({'DIED': manufacturers['died'], 'HOSPITAL': manufacturers['hospitalized']})
+    manufacturer_rates(manufacturers.rename_axis('VAX_MANU')).to_csv(
+        os.path.join(out_dir, 'manufacturers.csv'), index=False)
+
+    # new weeks just add rows to the per-day counts
+    received = aggregate(totals, 'received')
+    received.columns = [REPORTS if COHORTS[c] is None else COHORTS[c] for c in received.columns]
+    DailyCounts.from_table(received).to_frame().to_csv(os.path.join(out_dir, 'daily_reports.csv'))
+
+    if lots is not None:
+        lots.totals().to_csv(os.path.join(out_dir, 'lots.csv'))
+        lot_signals(lots).to_csv(os.path.join(out_dir, 'lot_signals.csv'), index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the VAERS analysis with a new data drop.')
+    parser.add_argument('--root', default=REPO_ROOT,
+                        help='folder holding the {YEAR}VAERSData folders (searched recursively)')
+    parser.add_argument('--state', default=DEFAULT_STATE, help='where the processed state is kept')
+    parser.add_argument('--out', default='report', help='output directory for the tables')
+    parser.add_argument('--years', type=int, nargs='*', help='years to load (default: every year found)')
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per core)')
+    args = parser.parse_args(argv)
+
+    _, totals, _ = refresh(args.root, args.state, years=args.years or None, workers=args.workers)
+    write_tables(totals, args.out, lots=IncrementalState(args.state).load_lots())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
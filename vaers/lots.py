@@ -0,0 +1,278 @@
+"""Reports and serious outcomes per vaccine lot and week, and lots that stand out.
+
+In[7] drops VAX_LOT, partly because it is typed by hand: the same lot turns
+up as 'EK5730', 'ek5730', 'EK 5730', 'Lot# EK5730' or 'EKS730', next to
+'unknown' and 'N/A'. Here every lot string is put into a canonical form
+(upper case, letters and digits only, no 'LOT' prefix, the look-alike
+letters O/Q/I/L/S read as digits where a Pfizer-style lot has digits; the
+rules are in ``data/lot_rules.json``). The manufacturer and canonical lot
+are then hashed into a 64 bit ``LOT_KEY``. Only the distinct strings are
+cleaned, so hundreds of thousands of spellings cost one pass each.
+
+:class:`LotCounts` keeps one row per (lot, week) that has any report: the
+number of reports and of DIED, HOSPITAL and L_THREAT among them. Weeks with
+no report for a lot take no space. Like
+:class:`vaers.timeseries.DailyCounts` it can ``add`` a new week's reports
+and ``subtract`` edited or withdrawn ones, so the weekly refresh doesn't
+recount every lot.
+
+VAERS has no doses per lot, so a lot is compared with its manufacturer:
+:func:`lot_signals` takes, for every lot and week, the reports and events of
+the trailing ``window`` weeks, and the same for all other lots of the
+manufacturer. A lot is flagged when it has at least ``min_events`` events,
+at least ``threshold`` times the number expected at the manufacturer's rate,
+and the exact Poisson lower bound of that ratio is above 1.
+"""
+
+import functools
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .cohorts import flag_mask
+from .cube import REPORTS
+from .rates import poisson_interval
+from .timeseries import MISSING, dates, days
+
+RULES_FILE = os.path.join(os.path.dirname(__file__), 'data', 'lot_rules.json')
+
+MEASURES = ('DIED', 'HOSPITAL', 'L_THREAT')
+WINDOW = 4
+THRESHOLD = 2.0
+MIN_EVENTS = 3
+MISSING_KEY = np.uint64(0)
+
+
+@functools.lru_cache(maxsize=None)
+def load_rules(path=RULES_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def canonical(values, rules=RULES_FILE):
+    """Canonical lot strings for ``values`` (object array, None where unknown)."""
+    rules = load_rules(rules)
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    # the str dtype (Arrow-backed when pyarrow is there) runs the string methods in C
+    text = pd.Series(uniques, dtype=object).astype('str').str.upper().str.replace(r'[^0-9A-Z]', '', regex=True)
+    prefixes = sorted(rules['prefixes'], key=len, reverse=True)
+    text = text.str.replace('^(?:{})(?=.)'.format('|'.join(map(re.escape, prefixes))), '', regex=True)
+
+    for rule in rules['digit_tails']:
+        matched = text[text.str.contains(rule['pattern'], regex=True).to_numpy(dtype=bool)]
+        tail = matched.str[rule['start']:]
+        for letter, digit in rules['lookalikes'].items():
+            tail = tail.str.replace(letter, digit, regex=False)
+        text[matched.index] = (matched.str[:rule['start']] + tail).to_numpy()
+
+    cleaned = text.to_numpy(dtype=object)
+    cleaned[text.isin(rules['missing']).to_numpy()] = None
+    out = np.empty(len(codes), dtype=object)
+    out[codes >= 0] = cleaned[codes[codes >= 0]]
+    return out
+
+
+def lot_keys(lots, manufacturers):
+    """64 bit key of each (manufacturer, canonical lot); ``MISSING_KEY`` without a lot."""
+    lot_codes, lot_names = pd.factorize(np.asarray(lots, dtype=object))
+    manu_codes, manu_names = pd.factorize(np.asarray(manufacturers, dtype=object))
+    # both codes are -1 where missing, so shift them to 0.. before packing them into one integer
+    width = len(manu_names) + 1
+    pairs, codes = np.unique((lot_codes.astype('int64') + 1) * width + manu_codes + 1, return_inverse=True)
+    lot_of, manu_of = np.divmod(pairs, width)
+    names = np.array(['{}|{}'.format(manu_names[m - 1] if m else '', lot_names[l - 1] if l else '')
+                      for l, m in zip(lot_of, manu_of)], dtype=object)
+    hashes = pd.util.hash_array(names) if len(names) else np.empty(0, dtype='uint64')
+    hashes[hashes == MISSING_KEY] = 1
+    keys = hashes[codes.ravel()]
+    keys[lot_codes < 0] = MISSING_KEY
+    return keys
+
+
+def _reduce(keys, weeks, counts):
+    """Sum the rows of equal (key, week), sorted by key then week; all-zero rows are dropped."""
+    order = np.lexsort((weeks, keys))
+    keys, weeks, counts = keys[order], weeks[order], counts[order]
+    if not len(keys):
+        return keys, weeks, counts
+    starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (weeks[1:] != weeks[:-1])])
+    counts = np.add.reduceat(counts, starts, axis=0)
+    keys, weeks = keys[starts], weeks[starts]
+    kept = counts.any(axis=1)
+    return keys[kept], weeks[kept], counts[kept]
+
+
+class LotCounts(object):
+    """Reports and outcome counts per (lot, week), only for the pairs with reports.
+
+    ``keys`` and ``weeks`` (weeks since ``EPOCH``, Mondays) are sorted by key
+    then week; ``counts`` has a column per measure, ``REPORTS`` first.
+    ``labels`` gives the manufacturer and canonical lot of every key.
+    """
+
+    def __init__(self, keys, weeks, counts, measures, labels):
+        self.keys = np.asarray(keys, dtype='uint64')
+        self.weeks = np.asarray(weeks, dtype='int32')
+        self.counts = np.asarray(counts, dtype='int64')
+        self.measures = list(measures)
+        self.labels = labels
+
+    @classmethod
+    def empty(cls, measures=MEASURES):
+        labels = pd.DataFrame({'VAX_MANU': pd.Series([], dtype=object), 'VAX_LOT': pd.Series([], dtype=object)},
+                              index=pd.Index(np.empty(0, 'uint64'), name='LOT_KEY'))
+        return cls(np.empty(0, 'uint64'), np.empty(0, 'int32'), np.zeros((0, len(measures) + 1), 'int64'),
+                   [REPORTS] + list(measures), labels)
+
+    @classmethod
+    def from_frame(cls, df, date='RECVDATE', lot='VAX_LOT', manufacturer='VAX_MANU', measures=MEASURES,
+                   rules=RULES_FILE):
+        """Count the reports of ``df`` per lot and week of ``date``."""
+        lots = canonical(df[lot].to_numpy(dtype=object), rules)
+        manufacturers = df[manufacturer].astype(object).to_numpy()
+        keys = lot_keys(lots, manufacturers)
+        offsets = days(df[date])
+        known = (keys != MISSING_KEY) & (offsets != MISSING)
+
+        counts = np.ones((int(known.sum()), len(measures) + 1), dtype='int64')
+        for j, measure in enumerate(measures, 1):
+            counts[:, j] = flag_mask(df[measure])[known]
+        weeks = offsets[known] // 7
+
+        labelled, first = np.unique(keys[known], return_index=True)
+        labels = pd.DataFrame({'VAX_MANU': manufacturers[known][first], 'VAX_LOT': lots[known][first]},
+                              index=pd.Index(labelled, name='LOT_KEY'))
+        keys, weeks, counts = _reduce(keys[known], weeks, counts)
+        return cls(keys, weeks, counts, [REPORTS] + list(measures), labels)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _combine(self, other, sign):
+        if list(other.measures) != self.measures:
+            raise ValueError('measures differ: {} vs {}'.format(self.measures, other.measures))
+        keys, weeks, counts = _reduce(np.concatenate([self.keys, other.keys]),
+                                      np.concatenate([self.weeks, other.weeks]),
+                                      np.concatenate([self.counts, sign * other.counts]))
+        labels = pd.concat([self.labels, other.labels])
+        labels = labels[~labels.index.duplicated()]
+        labels = labels[labels.index.isin(keys)].sort_index()
+        return LotCounts(keys, weeks, counts, self.measures, labels)
+
+    def add(self, other):
+        """Counts with ``other`` added, e.g. this week's new reports."""
+        return self._combine(other, 1)
+
+    def subtract(self, other):
+        """Counts with ``other`` taken out, e.g. reports edited or withdrawn."""
+        return self._combine(other, -1)
+
+    def window(self, weeks=WINDOW):
+        """Trailing ``weeks`` week sums of every (lot, week) row, within the lot."""
+        totals = np.vstack([np.zeros((1, self.counts.shape[1]), 'int64'), np.cumsum(self.counts, axis=0)])
+        new_lot = np.r_[True, self.keys[1:] != self.keys[:-1]] if len(self.keys) else np.zeros(0, bool)
+        lot_start = np.maximum.accumulate(np.where(new_lot, np.arange(len(self.keys)), 0))
+        # weeks are sorted within a lot, so the window starts at the first row of week > week - weeks
+        lot_index = np.cumsum(new_lot).astype('int64')
+        combined = (lot_index << 32) + self.weeks
+        left = np.maximum(np.searchsorted(combined, combined - weeks + 1), lot_start)
+        return totals[np.arange(1, len(self.keys) + 1)] - totals[left]
+
+    def manufacturers(self):
+        return self.labels['VAX_MANU'].reindex(self.keys).to_numpy(dtype=object)
+
+    def totals(self):
+        """All weeks summed per lot, with its manufacturer and canonical lot, most reports first."""
+        frame = pd.DataFrame(self.counts, columns=self.measures)
+        frame = frame.groupby(self.keys).sum()
+        frame['WEEKS'] = np.bincount(np.unique(self.keys, return_inverse=True)[1]) if len(self.keys) else 0
+        frame = self.labels.join(frame.rename_axis('LOT_KEY'), how='inner')
+        return frame.sort_values(REPORTS, ascending=False, kind='stable')
+
+    def to_frame(self):
+        """One row per lot and week (indexed by the Monday)."""
+        frame = pd.DataFrame(self.counts, columns=self.measures)
+        frame.insert(0, 'WEEK', dates(self.weeks.astype('int64') * 7))
+        frame.insert(0, 'LOT_KEY', self.keys)
+        return frame
+
+    def save(self, path):
+        np.savez_compressed(path, keys=self.keys, weeks=self.weeks, counts=self.counts,
+                            label_keys=self.labels.index.to_numpy(dtype='uint64'),
+                            label_manu=self.labels['VAX_MANU'].fillna('').to_numpy(dtype=str),
+                            label_lot=self.labels['VAX_LOT'].to_numpy(dtype=str),
+                            meta=np.array(json.dumps({'measures': self.measures})))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            # a missing manufacturer is stored as ''
+            manufacturers = pd.Series(data['label_manu'], dtype=object).replace('', None).to_numpy()
+            labels = pd.DataFrame({'VAX_MANU': manufacturers,
+                                   'VAX_LOT': data['label_lot'].astype(object)},
+                                  index=pd.Index(data['label_keys'], name='LOT_KEY'))
+            return cls(data['keys'], data['weeks'], data['counts'], meta['measures'], labels)
+
+
+def _manufacturer_windows(counts, codes, n_manufacturers, weeks):
+    """Trailing ``weeks`` sums per manufacturer for the week of every row."""
+    first = int(counts.weeks.min())
+    span = int(counts.weeks.max()) - first + 1
+    dense = np.zeros((n_manufacturers, span + 1, counts.counts.shape[1]), dtype='int64')
+    np.add.at(dense, (codes, counts.weeks - first + 1), counts.counts)
+    totals = np.cumsum(dense, axis=1)
+    here = counts.weeks - first + 1
+    return totals[codes, here] - totals[codes, np.maximum(here - weeks, 0)]
+
+
+def lot_signals(counts, window=WINDOW, threshold=THRESHOLD, min_events=MIN_EVENTS, alpha=0.05, flagged_only=True):
+    """Lots whose trailing ``window``-week outcome rate is high for their manufacturer.
+
+    One row per lot, week and measure with REPORTS and EVENTS over the
+    window, the manufacturer's BASELINE_RATE over the same weeks (its other
+    lots only), EXPECTED = REPORTS * BASELINE_RATE, RATIO = EVENTS /
+    EXPECTED and its exact Poisson lower bound RATIO_LOWER. With
+    ``flagged_only`` only the rows that meet the criteria are returned.
+    """
+    columns = ['LOT_KEY', 'VAX_MANU', 'VAX_LOT', 'WEEK', 'MEASURE', 'REPORTS', 'EVENTS', 'RATE',
+               'BASELINE_RATE', 'EXPECTED', 'RATIO', 'RATIO_LOWER', 'FLAG']
+    if not len(counts):
+        return pd.DataFrame(columns=columns)
+    manufacturers = counts.manufacturers()
+    # reports without a manufacturer are compared among themselves
+    codes, _ = pd.factorize(manufacturers, use_na_sentinel=False)
+    lot = counts.window(window)
+    rest = _manufacturer_windows(counts, codes, codes.max() + 1, window) - lot
+
+    frames = []
+    for j, measure in enumerate(counts.measures[1:], 1):
+        reports, events = lot[:, 0], lot[:, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            baseline = rest[:, j] / rest[:, 0]
+            expected = reports * baseline
+            ratio = events / expected
+            lower = poisson_interval(events, alpha)[0] / expected
+            rate = events / reports
+        flag = (events >= min_events) & (ratio >= threshold) & (lower > 1)
+        rows = np.flatnonzero(flag) if flagged_only else np.arange(len(flag))
+        frames.append(pd.DataFrame({
+            'LOT_KEY': counts.keys[rows],
+            'VAX_MANU': manufacturers[rows],
+            'VAX_LOT': counts.labels['VAX_LOT'].reindex(counts.keys[rows]).to_numpy(dtype=object),
+            'WEEK': dates(counts.weeks[rows].astype('int64') * 7),
+            'MEASURE': measure,
+            'REPORTS': reports[rows],
+            'EVENTS': events[rows],
+            'RATE': rate[rows],
+            'BASELINE_RATE': baseline[rows],
+            'EXPECTED': expected[rows],
+            'RATIO': ratio[rows],
+            'RATIO_LOWER': lower[rows],
+            'FLAG': flag[rows],
+        }))
+    table = pd.concat(frames, ignore_index=True)[columns]
+    return table.sort_values(['RATIO_LOWER', 'EVENTS'], ascending=False, kind='stable', ignore_index=True)
@@ -0,0 +1,210 @@
+"""Clusters of near-identical reports, found with MinHash and LSH.
+
+The same event often reaches VAERS several times: a manufacturer's report
+("contactable", "spontaneous", "bnt162b2") next to the one from the clinic,
+or a follow-up that repeats the first narrative with a line added. Every
+copy counts again in the notebook's word counts and rates. Comparing every
+pair of narratives is quadratic, so instead:
+
+1. each SYMPTOM_TEXT is cut into overlapping word 3-grams (shingles),
+2. every shingle is hashed once and the hashes are spread over ``BINS``
+   bins by their top bits; the minimum in each bin is kept. This MinHash
+   signature (one permutation hashing) costs one pass over the shingles,
+   and the fraction of equal bins in two signatures estimates the Jaccard
+   similarity of the texts,
+3. the signature is split into ``BANDS`` bands. Reports that agree on a
+   whole band land in the same bucket. Each report is compared with the
+   ``LOOKBACK`` reports before it in its bucket, so small buckets are
+   compared in full and the work grows with the number of reports, not its
+   square,
+4. a candidate pair is kept if its estimated similarity is at least
+   ``THRESHOLD`` and AGE_YRS, SEX, STATE and VAX_DATE agree (a value missing
+   on either side does not count against the match),
+5. the kept pairs are joined into clusters (connected components). Since a
+   report is paired with several earlier ones, not only the one next to it,
+   two matching reports are linked even if the report between them in the
+   bucket (say, from another state) matches neither.
+
+``CLUSTER_ID`` is the lowest VAERS_ID in the cluster, so reports without a
+near-duplicate are their own cluster. :func:`collapse` keeps one report per
+cluster for the frequency and rate stages, with an outcome flag set if any
+report in the cluster had it.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from .cohorts import flag_mask
+from .hashing import GOLDEN, mix64
+from .schema import SCHEMA
+from .tokens import word_hashes
+
+SHINGLE = 3
+BINS = 128
+BANDS = 32
+THRESHOLD = 0.7
+LOOKBACK = 16
+CHUNK = 50000
+PAIR_CHUNK = 100000
+MATCH_COLUMNS = ('AGE_YRS', 'SEX', 'STATE', 'VAX_DATE')
+FLAG_COLUMNS = [c for c, kind in SCHEMA.items() if kind == 'flag']
+
+EMPTY = np.iinfo('uint32').max
+
+
+def shingles(texts, size=SHINGLE):
+    """64 bit hashes of the word ``size``-grams of each text.
+
+    Returns ``(hashes, starts)``: the shingles of text ``i`` are
+    ``hashes[starts[i]:starts[i + 1]]``. A text shorter than ``size`` words
+    is one shingle; an empty or missing text has none.
+    """
+    hashes, lengths = word_hashes(texts)
+    ends = np.cumsum(lengths)
+    begins = ends - lengths
+    # one shingle per start position, at least one for any non-empty text
+    counts = np.where(lengths > 0, np.maximum(lengths - size + 1, 1), 0)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    positions = np.repeat(begins, counts) + (np.arange(starts[-1]) - np.repeat(starts[:-1], counts))
+    last = np.repeat(ends - 1, counts)
+
+    out = hashes[positions]
+    for offset in range(1, size):
+        out = out * GOLDEN + hashes[np.minimum(positions + offset, last)]
+    return out, starts
+
+
+def densify(signature):
+    """Fill the empty bins of each row from the next filled bin to the right (wrapping).
+
+    The borrowed value is offset by the distance it was borrowed over, so two
+    rows only agree on a filled-in bin when they borrowed the same way.
+    """
+    bins = signature.shape[1]
+    doubled = np.concatenate([signature, signature], axis=1)
+    positions = np.where(doubled != EMPTY, np.arange(2 * bins, dtype='int16'), np.int16(2 * bins))
+    nearest = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1][:, :bins]
+    rows, columns = np.nonzero((signature == EMPTY) & (nearest < 2 * bins))
+    source = nearest[rows, columns]
+    distance = (source - columns).astype('uint32')
+    signature[rows, columns] = np.minimum(doubled[rows, source] + distance * np.uint32(0x9E3779B1), EMPTY - 1)
+    return signature
+
+
+def signatures(texts, bins=BINS, size=SHINGLE, seed=0, chunk=CHUNK):
+    """``(len(texts), bins)`` uint32 MinHash signatures (one permutation hashing).
+
+    Each shingle is hashed once; the top bits of the hash pick a bin and the
+    minimum of the rest is kept per bin. Texts without any shingle get a row
+    of ``EMPTY`` and never match.
+    """
+    if bins & (bins - 1):
+        raise ValueError('bins must be a power of two, got {}'.format(bins))
+    texts = pd.Series(texts, dtype=object).reset_index(drop=True)
+    shift = np.uint64(64 - int(np.log2(bins)))
+    out = np.full((len(texts), bins), EMPTY, dtype='uint32')
+    for first in range(0, len(texts), chunk):
+        hashes, starts = shingles(texts.iloc[first:first + chunk], size)
+        block = out[first:first + len(starts) - 1]
+        h = mix64(hashes, seed)
+        rows = np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+        values = np.minimum((h & np.uint64(0xFFFFFFFF)).astype('uint32'), EMPTY - 1)
+        np.minimum.at(block, (rows, (h >> shift).astype('int64')), values)
+        densify(block)
+    return out
+
+
+def candidate_pairs(signature, bands=BANDS, lookback=LOOKBACK):
+    """Pairs of rows that agree on at least one whole band of their signatures.
+
+    Within a bucket each row is paired with the ``lookback`` rows before it,
+    so buckets of up to ``lookback + 1`` rows give every pair, and a huge
+    bucket (the same boilerplate text thousands of times) still gives a
+    linear number of pairs. Returns ``(left, right)`` with ``left < right``.
+    """
+    n = len(signature)
+    rows = signature.shape[1] // bands
+    valid = np.flatnonzero(signature[:, 0] != EMPTY)
+    pairs = np.empty(0, dtype='int64')
+    for band in range(bands):
+        block = signature[valid, band * rows:(band + 1) * rows].astype('uint64')
+        keys = np.zeros(len(valid), dtype='uint64')
+        for column in range(rows):
+            keys = keys * GOLDEN + block[:, column]
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        found = []
+        for distance in range(1, lookback + 1):
+            same = keys[distance:] == keys[:-distance]
+            if not same.any():
+                # no bucket has distance + 1 rows, so none has more either
+                break
+            # the sort is stable, so the earlier row of a bucket has the lower index
+            found.append(valid[order[:-distance][same]] * n + valid[order[distance:][same]])
+        if found:
+            # sorting and dropping repeats is much faster than np.union1d's hash table here
+            pairs = np.sort(np.concatenate([pairs] + found))
+            pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+    return np.divmod(pairs, n)
+
+
+def similarities(signature, left, right, chunk=PAIR_CHUNK):
+    """Fraction of equal bins of each pair of signatures (estimated Jaccard similarity)."""
+    out = np.empty(len(left), dtype='float64')
+    for first in range(0, len(left), chunk):
+        a, b = left[first:first + chunk], right[first:first + chunk]
+        out[first:first + chunk] = (signature[a] == signature[b]).mean(axis=1)
+    return out
+
+
+def _compatible(df, left, right, columns):
+    ok = np.ones(len(left), dtype=bool)
+    for column in columns:
+        if column not in df.columns:
+            continue
+        codes, _ = pd.factorize(df[column])
+        a, b = codes[left], codes[right]
+        ok &= (a == b) | (a < 0) | (b < 0)
+    return ok
+
+
+def clusters(df, text='SYMPTOM_TEXT', match=MATCH_COLUMNS, threshold=THRESHOLD,
+             bins=BINS, bands=BANDS, lookback=LOOKBACK, key='VAERS_ID', seed=0):
+    """CLUSTER_ID for every row of ``df``: the lowest ``key`` among its near-duplicates."""
+    signature = signatures(df[text].to_numpy(), bins, seed=seed)
+    left, right = candidate_pairs(signature, bands, lookback)
+    similarity = similarities(signature, left, right)
+    kept = (similarity >= threshold) & _compatible(df, left, right, match)
+
+    n = len(df)
+    graph = sparse.coo_matrix((np.ones(kept.sum(), dtype='int8'), (left[kept], right[kept])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    ids = df[key].to_numpy()
+    lowest = pd.Series(ids).groupby(labels).transform('min').to_numpy()
+    return pd.Series(lowest, index=df.index, name='CLUSTER_ID')
+
+
+def assign(df, out='CLUSTER_ID', **kwargs):
+    """Add the ``out`` cluster column to ``df`` in place and return ``df``."""
+    df[out] = clusters(df, **kwargs).to_numpy()
+    return df
+
+
+def summary(df, column='CLUSTER_ID', key='VAERS_ID'):
+    """The reports that have near-duplicates, cluster by cluster."""
+    sizes = df.groupby(column)[key].transform('size')
+    table = df.loc[sizes.to_numpy() > 1, [column, key]]
+    return table.assign(CLUSTER_SIZE=sizes[sizes > 1].to_numpy()).sort_values([column, key])
+
+
+def collapse(df, column='CLUSTER_ID', flags=FLAG_COLUMNS):
+    """One row per cluster; an outcome flag is set if any report of the cluster has it."""
+    codes, _ = pd.factorize(df[column], sort=False)
+    first = np.flatnonzero(~pd.Series(codes).duplicated().to_numpy())
+    out = df.iloc[first].reset_index(drop=True)
+    for flag in flags:
+        if flag in df.columns:
+            out[flag] = np.bincount(codes, weights=flag_mask(df[flag]), minlength=len(first)) > 0
+    return out
@@ -0,0 +1,105 @@
+"""Table-driven cleanup of the free-text columns (OTHER_MEDS, HISTORY, ...).
+
+The rules live in ``data/normalize_rules.json``, one entry per column:
+
+- ``lower``: lower-case the value first.
+- ``strip``: strip surrounding whitespace.
+- ``replace``: ``{canonical: [values...]}``, whole-value synonyms matched
+  after lower-casing (``'htn'`` -> ``'hypertension'``).
+- ``substitute``: ``[[pattern, replacement], ...]`` regex substitutions
+  applied inside the value, in order.
+- ``fillna``: value used for missing entries (left missing if absent).
+
+Adding a synonym is an edit to the JSON file. The rules for a column are
+compiled into one function and only run on the column's distinct values,
+which are then mapped back onto the rows.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES = os.path.join(os.path.dirname(__file__), 'data', 'normalize_rules.json')
+
+
+def _resolve(mapping):
+    """Follow chains like a -> b, b -> c so one lookup gives the final value."""
+    resolved = {}
+    for value in mapping:
+        seen = {value}
+        target = mapping[value]
+        while target in mapping and target not in seen:
+            seen.add(target)
+            target = mapping[target]
+        resolved[value] = target
+    return resolved
+
+
+class ColumnRule(object):
+    """The compiled cleanup for one column."""
+
+    def __init__(self, lower=False, strip=False, replace=None, substitute=None, fillna=None):
+        self.lower = lower
+        self.strip = strip
+        self.fillna = fillna
+        mapping = {}
+        for canonical, values in (replace or {}).items():
+            for value in values:
+                mapping[value] = canonical
+        self.mapping = _resolve(mapping)
+        self.substitutions = [(re.compile(pattern), repl) for pattern, repl in (substitute or [])]
+
+    def clean(self, value):
+        """Clean a single non-missing value."""
+        value = str(value)
+        if self.lower:
+            value = value.lower()
+        if self.strip:
+            value = value.strip()
+        value = self.mapping.get(value, value)
+        for pattern, repl in self.substitutions:
+            value = pattern.sub(repl, value)
+        return value
+
+    def __call__(self, series):
+        codes, uniques = pd.factorize(series)
+        cleaned = np.empty(len(uniques) + 1, dtype=object)
+        cleaned[:-1] = [self.clean(v) for v in uniques]
+        cleaned[-1] = np.nan if self.fillna is None else self.fillna
+        # code -1 (missing) picks up the trailing fill value
+        return pd.Series(cleaned[codes], index=series.index, name=series.name)
+
+
+class Normalizer(object):
+    """A set of :class:`ColumnRule` keyed by column name."""
+
+    def __init__(self, rules):
+        self.rules = {column: ColumnRule(**spec) for column, spec in rules.items()}
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def normalize_column(self, series, column=None):
+        return self.rules[column or series.name](series)
+
+    def apply(self, df, columns=None):
+        """Return a copy of ``df`` with every ruled column cleaned."""
+        df = df.copy()
+        for column in columns or self.rules:
+            if column in df.columns:
+                df[column] = self.rules[column](df[column])
+        return df
+
+
+def normalize(df, columns=None, rules=DEFAULT_RULES):
+    """Clean ``df`` with the rules in ``rules`` (a path or a loaded dict)."""
+    if isinstance(rules, dict):
+        normalizer = Normalizer(rules)
+    else:
+        normalizer = Normalizer.from_file(rules)
+    return normalizer.apply(df, columns)
@@ -0,0 +1,328 @@
+"""Frequent multi-word phrases in SYMPTOM_TEXT, counted in fixed memory.
+
+The word counts of In[12]/In[14] split "shortness of breath", "chest pain"
+or "heart rate" into single words, several of which are stopwords. This
+module counts the word bigrams and trigrams instead, without keeping a
+table of every phrase seen: a corpus of many years has far more distinct
+trigrams than a small worker can hold.
+
+Each cohort (all, hospitalized, died) gets a :class:`PhraseSketch`:
+
+- a count-min sketch, ``DEPTH`` rows of ``width`` uint32 counters. A phrase
+  adds its count to one counter per row (picked by a hash), and its
+  estimate is the smallest of those counters. Updates are conservative:
+  only the counters below the new estimate are raised. An estimate never
+  undercounts, and with probability ``1 - exp(-DEPTH)`` it overcounts by at
+  most ``e / width`` times the phrases added so far (``ERROR``),
+- the heavy hitters: the ``capacity`` phrases with the largest estimates,
+  kept with their text. After each chunk the tracked phrases and the
+  chunk's phrases are re-ranked on their sketch estimates, so a phrase that
+  only becomes frequent late is still picked up.
+
+Memory is ``DEPTH * width * 4`` bytes per cohort plus the tracked phrases,
+whatever the number of reports. Phrases that start or end with a function
+word ("of the", "pain in the") or a number are skipped; words inside a
+phrase are kept, so "shortness of breath" is counted.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .cohorts import COHORTS, cohort_mask, flag_mask
+from .hashing import mix64
+from .registry import discover
+from .shared import SharedTable, map_cohorts, unpack
+from .stream import isin_sorted, iter_chunks
+from .tokens import ascii_words
+from .wordclouds import STOPWORDS_FILE
+
+SIZES = (2, 3)
+DEPTH = 4
+MEMORY_MB = 64
+CAPACITY = 1000
+TOP = 100
+CHUNK = 20000
+TEXT_COLUMN = 'SYMPTOM_TEXT'
+
+_LIMIT = np.iinfo('uint32').max
+
+
+def edge_words(path=STOPWORDS_FILE):
+    """Words a phrase may not start or end with (``phrase_edges`` in stopwords.json)."""
+    with open(path) as f:
+        return frozenset(json.load(f)['phrase_edges'])
+
+
+def width_for(memory_mb=MEMORY_MB, depth=DEPTH, sketches=len(COHORTS)):
+    """Largest power of two width that fits ``sketches`` sketches in ``memory_mb``."""
+    counters = memory_mb * 2 ** 20 // (4 * depth * sketches)
+    if counters < 1:
+        raise ValueError('{} MB is too little for {} sketches'.format(memory_mb, sketches))
+    return 2 ** int(math.log2(counters))
+
+
+def ngrams(texts, sizes=SIZES, edges=None):
+    """Hashes and positions of the word n-grams of ``texts``.
+
+    Returns ``(hashes, rows, starts, sizes, vocabulary, codes)``: n-gram
+    ``j`` is ``vocabulary[codes[starts[j]:starts[j] + sizes[j]]]``, found in
+    text ``rows[j]``. N-grams never run over the end of a text.
+    """
+    vocabulary, codes, lengths = ascii_words(texts)
+    edges = edge_words() if edges is None else edges
+    allowed = ~np.isin(vocabulary, list(edges)) & ~pd.Series(vocabulary, dtype=object).str.isdigit().to_numpy(bool)
+    word_hash = pd.util.hash_array(vocabulary)[codes] if len(vocabulary) else np.empty(0, 'uint64')
+    ends = np.cumsum(lengths)
+    begins = ends - lengths
+
+    parts = []
+    for size in sizes:
+        counts = np.maximum(lengths - size + 1, 0)
+        total = int(counts.sum())
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        rows = np.repeat(np.arange(len(lengths)), counts)
+        starts = begins[rows] + (np.arange(total) - offsets[rows])
+        keep = allowed[codes[starts]] & allowed[codes[starts + size - 1]] if total else np.zeros(0, bool)
+        starts, rows = starts[keep], rows[keep]
+        hashes = np.full(len(starts), np.uint64(size))
+        for offset in range(size):
+            hashes = mix64(hashes ^ word_hash[starts + offset], 0)
+        parts.append((hashes, rows, starts, np.full(len(starts), size, dtype='int8')))
+    hashes, rows, starts, size_of = (np.concatenate(p) for p in zip(*parts))
+    return hashes, rows, starts, size_of, vocabulary, codes
+
+
+class PhraseSketch(object):
+    """Count-min sketch of phrase counts plus the ``capacity`` heaviest phrases."""
+
+    def __init__(self, width, depth=DEPTH, capacity=CAPACITY, seed=0):
+        if width & (width - 1):
+            raise ValueError('width must be a power of two, got {}'.format(width))
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.seed = seed
+        self.table = np.zeros((depth, width), dtype='uint32')
+        self.total = 0
+        self.keys = np.empty(0, dtype='uint64')
+        self.phrases = np.empty(0, dtype=object)
+        self.words = np.empty(0, dtype='int8')
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    @property
+    def error(self):
+        """Overcount bound of any estimate (holds with probability ``1 - exp(-depth)``)."""
+        return int(math.ceil(math.e / self.width * self.total))
+
+    def _cells(self, keys):
+        mask = np.uint64(self.width - 1)
+        return [(mix64(keys, self.seed * self.depth + row + 1) & mask).astype('int64')
+                for row in range(self.depth)]
+
+    def estimate(self, keys):
+        keys = np.asarray(keys, dtype='uint64')
+        out = np.full(len(keys), _LIMIT, dtype='uint32')
+        for row, cells in enumerate(self._cells(keys)):
+            np.minimum(out, self.table[row, cells], out=out)
+        return out
+
+    def add(self, keys, counts, phrases, words):
+        """Add ``counts`` for the distinct phrase hashes ``keys``.
+
+        ``phrases`` is a function from positions in ``keys`` to phrase text;
+        it is only called for phrases that make it into the heavy hitters.
+        """
+        keys = np.asarray(keys, dtype='uint64')
+        cells = self._cells(keys)
+        current = np.full(len(keys), _LIMIT, dtype='uint32')
+        for row in range(self.depth):
+            np.minimum(current, self.table[row, cells[row]], out=current)
+        target = np.minimum(current.astype('int64') + counts, _LIMIT).astype('uint32')
+        for row in range(self.depth):
+            np.maximum.at(self.table[row], cells[row], target)
+        self.total += int(np.sum(counts))
+        self._rank(keys, target, phrases, words)
+
+    def _rank(self, keys, estimates, phrases, words):
+        new = ~isin_sorted(keys, np.sort(self.keys))
+        keys, estimates, words = keys[new], estimates[new], np.asarray(words)[new]
+        positions = np.flatnonzero(new)
+        scores = np.concatenate([self.estimate(self.keys), estimates])
+        order = np.arange(len(scores))
+        if len(scores) > self.capacity:
+            order = np.sort(np.argpartition(-scores.astype('int64'), self.capacity - 1)[:self.capacity])
+        tracked = len(self.keys)
+        old, fresh = order[order < tracked], order[order >= tracked] - tracked
+        self.keys = np.concatenate([self.keys[old], keys[fresh]])
+        self.phrases = np.concatenate([self.phrases[old], np.asarray(phrases(positions[fresh]), dtype=object)])
+        self.words = np.concatenate([self.words[old], words[fresh]])
+
+    def merge(self, other):
+        """Counts of both sketches (e.g. two workers' years); they must share width, depth and seed."""
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError('sketches differ in width, depth or seed')
+        self.table = np.minimum(self.table.astype('int64') + other.table, _LIMIT).astype('uint32')
+        self.total += other.total
+        order = np.argsort(other.keys, kind='stable')
+        keys = other.keys[order]
+        self._rank(keys, self.estimate(keys), lambda positions: other.phrases[order][positions],
+                   other.words[order])
+        return self
+
+    def top(self, n=TOP):
+        """The ``n`` heaviest phrases with COUNT (estimate) and LOWER (COUNT - ERROR, at least 0)."""
+        counts = self.estimate(self.keys).astype('int64')
+        table = pd.DataFrame({'PHRASE': self.phrases, 'WORDS': self.words.astype('int64'), 'COUNT': counts})
+        table = table.sort_values(['COUNT', 'PHRASE'], ascending=[False, True], kind='stable').head(n)
+        table['LOWER'] = np.maximum(table['COUNT'] - self.error, 0)
+        return table.reset_index(drop=True)
+
+
+class PhraseMiner(object):
+    """One :class:`PhraseSketch` per cohort, fed chunk by chunk."""
+
+    def __init__(self, cohorts=COHORTS, memory_mb=MEMORY_MB, depth=DEPTH, capacity=CAPACITY,
+                 sizes=SIZES, seed=0):
+        width = width_for(memory_mb, depth, len(cohorts))
+        self.cohorts = dict(cohorts)
+        self.sizes = tuple(sizes)
+        self.sketches = {name: PhraseSketch(width, depth, capacity, seed) for name in cohorts}
+        self.reports = 0
+        self._edges = edge_words()
+
+    def update(self, texts, masks):
+        """Count the phrases of ``texts``; ``masks`` gives the rows of each cohort."""
+        hashes, rows, starts, sizes, vocabulary, codes = ngrams(texts, self.sizes, self._edges)
+        self.reports += len(texts)
+
+        def phrase(index):
+            return lambda positions: [' '.join(vocabulary[codes[starts[j]:starts[j] + sizes[j]]])
+                                      for j in index[positions]]
+
+        # one sort for the whole chunk; each cohort only counts its rows
+        keys, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        for name, sketch in self.sketches.items():
+            mask = masks.get(name)
+            selected = inverse if mask is None else inverse[np.asarray(mask)[rows]]
+            counts = np.bincount(selected, minlength=len(keys))
+            seen = np.flatnonzero(counts)
+            sketch.add(keys[seen], counts[seen], phrase(first[seen]), sizes[first[seen]])
+        return self
+
+    def update_frame(self, df, text=TEXT_COLUMN, chunk=CHUNK):
+        """Feed ``df`` ``chunk`` rows at a time (its cohort flags decide the masks)."""
+        for first in range(0, len(df), chunk):
+            part = df.iloc[first:first + chunk]
+            masks = {name: cohort_mask(part, name, self.cohorts) for name in self.cohorts}
+            self.update(part[text].to_numpy(), masks)
+        return self
+
+    def merge(self, other):
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        self.reports += other.reports
+        return self
+
+    @property
+    def nbytes(self):
+        return sum(sketch.nbytes for sketch in self.sketches.values())
+
+    def table(self, n=TOP):
+        """Top ``n`` phrases per cohort, one row per cohort and phrase, with the cohort's ERROR."""
+        frames = []
+        for name, sketch in self.sketches.items():
+            frame = sketch.top(n)
+            frame.insert(0, 'COHORT', name)
+            frame['ERROR'] = sketch.error
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+
+def _mine_cohort(shared, name, bits, text=TEXT_COLUMN, cohorts=COHORTS, memory_mb=MEMORY_MB, chunk=CHUNK,
+                 seed=0):
+    # the same budget per cohort as one PhraseMiner for all of them
+    miner = PhraseMiner({name: cohorts[name]}, memory_mb / len(cohorts), seed=seed)
+    for start, part in shared.slices([text], chunk):
+        rows = unpack(bits, shared.rows, start, start + chunk)
+        texts = part[text].filter(rows) if shared.path is not None else part[text].to_numpy()[rows]
+        miner.update(texts, {name: None})
+    return miner.sketches[name]
+
+
+def mine_frame(df, text=TEXT_COLUMN, cohorts=COHORTS, memory_mb=MEMORY_MB, chunk=CHUNK, seed=0, workers=1):
+    """A :class:`PhraseMiner` over a frame already in memory (e.g. master_df).
+
+    With more than one worker each cohort is mined in its own process from
+    the text column published once in shared memory (:mod:`vaers.shared`);
+    the result is the same as in-process.
+    """
+    miner = PhraseMiner(cohorts, memory_mb, seed=seed)
+    if workers == 1 or len(cohorts) <= 1:
+        return miner.update_frame(df, text, chunk)
+    masks = {name: cohort_mask(df, name, cohorts) for name in cohorts}
+    with SharedTable.publish(df, [text]) as shared:
+        miner.sketches = map_cohorts(_mine_cohort, shared, masks, workers, text=text, cohorts=cohorts,
+                                     memory_mb=memory_mb, chunk=chunk, seed=seed)
+    miner.reports = len(df)
+    return miner
+
+
+def _vax_ids(path, vax_type, chunk, cache_dir):
+    ids = [np.empty(0, dtype='int64')]
+    for part in iter_chunks(path, ['VAERS_ID', 'VAX_TYPE'], chunk, cache_dir):
+        ids.append(part['VAERS_ID'].to_numpy(dtype='int64')[(part['VAX_TYPE'] == vax_type).to_numpy(bool)])
+    return np.unique(np.concatenate(ids))
+
+
+def mine_files(root, years=None, vax_type='COVID19', cohorts=COHORTS, memory_mb=MEMORY_MB,
+               chunk=CHUNK, seed=0, cache_dir=None, log=None):
+    """Stream the DATA files under ``root`` through a :class:`PhraseMiner`.
+
+    Only the reports with a ``vax_type`` vaccine are counted (all reports if
+    None). Nothing but the current chunk, the VAERS_IDs of that vaccine type
+    and the sketches is held in memory.
+    """
+    miner = PhraseMiner(cohorts, memory_mb, seed=seed)
+    flags = [flag for flag in cohorts.values() if flag is not None]
+    for year, entry in discover(root, years).items():
+        ids = None if vax_type is None else _vax_ids(entry.paths['VAX'], vax_type, chunk, cache_dir)
+        for part in iter_chunks(entry.paths['DATA'], ['VAERS_ID', TEXT_COLUMN] + flags, chunk, cache_dir):
+            if ids is not None:
+                part = part[isin_sorted(part['VAERS_ID'].to_numpy(dtype='int64'), ids)]
+            masks = {name: (flag_mask(part[flag]) if flag is not None else None)
+                     for name, flag in cohorts.items()}
+            miner.update(part[TEXT_COLUMN].to_numpy(), masks)
+        if log is not None:
+            log('{}: {:,} reports so far'.format(year, miner.reports))
+    return miner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Most frequent SYMPTOM_TEXT phrases per cohort, in fixed memory.')
+    parser.add_argument('--root', default=os.getcwd(), help='folder with the VAERS drops (default: here)')
+    parser.add_argument('--years', type=int, nargs='+')
+    parser.add_argument('--vax-type', default='COVID19', help="vaccine type to keep, 'all' for every report")
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_MB,
+                        help='size of all the sketches together (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=TOP)
+    parser.add_argument('--out', default='phrase_frequency.csv')
+    args = parser.parse_args(argv)
+
+    vax_type = None if args.vax_type.lower() == 'all' else args.vax_type
+    miner = mine_files(args.root, args.years, vax_type, memory_mb=args.memory_mb, log=print)
+    miner.table(args.top).to_csv(args.out, index=False)
+    print('{:,} reports, {:.0f} MB of sketches -> {}'.format(miner.reports, miner.nbytes / 2 ** 20, args.out))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""The notebook's charts, drawn straight to image files.
+
+These use matplotlib's object API (``Figure``) rather than pyplot, so they
+never open a window and work the same on a headless box as in Jupyter.
+"""
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.ticker import ScalarFormatter
+
+COHORT_TITLES = {
+    'all': 'Total Population',
+    'hospitalized': 'Hospitalization response',
+    'died': 'Death response',
+}
+
+
+def _save(fig, path, dpi=100):
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def age_bracket_figure(counts, path):
+    """Countplots per age bracket, one panel per cohort (In[21]).
+
+    ``counts`` has the brackets as its index (in plotting order) and one
+    column per cohort.
+    """
+    fig = Figure(figsize=(25, 5))
+    axes = fig.subplots(1, len(counts.columns), sharey=False, squeeze=False)[0]
+    fig.suptitle('Frequency based on condition')
+    for ax, cohort in zip(axes, counts.columns):
+        ax.bar([str(i) for i in counts.index], counts[cohort].to_numpy())
+        ax.set_title(COHORT_TITLES.get(cohort, cohort))
+        ax.set_xlabel('AGE_BRACKET')
+        ax.set_ylabel('count')
+    return _save(fig, path)
+
+
+def death_rates_figure(table, path, x='AGE_GROUP_CDC', columns=(('DIED', 'Vaccine deaths per 100k vaccinated'),
+                                                                    ('COVID_DEATHS', 'COVID deaths per 100k cases'))):
+    """Vaccine vs COVID death rates by age group on a log axis, with 95% intervals (In[32])."""
+    fig = Figure(figsize=(7, 5))
+    ax = fig.subplots()
+    groups = table[x].astype(str).to_numpy()
+    for measure, label in columns:
+        ax.plot(groups, table[measure + '_RATE'].to_numpy(), label=label)
+        ax.fill_between(groups, table[measure + '_LOWER'].to_numpy(),
+                        table[measure + '_UPPER'].to_numpy(), alpha=0.2)
+    ax.set_yscale('log')
+    ax.get_yaxis().set_major_formatter(ScalarFormatter())
+    ax.set_xlabel(x)
+    ax.set_ylabel('per 100,000')
+    ax.legend()
+    return _save(fig, path)
+
+
+def manufacturer_figure(table, path, x='VAX_MANU', measures=('DIED', 'HOSPITAL')):
+    """Death and hospitalization rates per 100k vaccinated per manufacturer, with 95% intervals (In[34])."""
+    fig = Figure(figsize=(7, 5))
+    ax = fig.subplots()
+    measures = list(measures)
+    width = 0.8 / len(measures)
+    positions = np.arange(len(table))
+    for i, measure in enumerate(measures):
+        rate = table[measure + '_RATE'].to_numpy()
+        errors = [rate - table[measure + '_LOWER'].to_numpy(), table[measure + '_UPPER'].to_numpy() - rate]
+        ax.bar(positions + i * width, rate, width=width, yerr=errors, capsize=3, label=measure)
+    ax.set_xticks(positions + width * (len(measures) - 1) / 2)
+    ax.set_xticklabels(table[x].astype(str).to_numpy(), rotation=90)
+    ax.set_ylabel('per 100,000 vaccinated')
+    ax.legend()
+    return _save(fig, path)
+
+
+def daily_reports_figure(daily, path, windows=(7, 28)):
+    """Reports received per day with their rolling averages.
+
+    ``daily`` is a :meth:`vaers.timeseries.DailyCounts.to_frame` table.
+    """
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    ax.bar(daily.index, daily['REPORTS'].to_numpy(), width=1, color='lightgray', label='per day')
+    for window in windows:
+        ax.plot(daily.index, daily['REPORTS_{}D'.format(window)].to_numpy() / window,
+                label='{} day average'.format(window))
+    ax.set_xlabel('RECVDATE')
+    ax.set_ylabel('reports')
+    ax.legend()
+    return _save(fig, path)
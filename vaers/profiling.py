@@ -0,0 +1,104 @@
+"""Wall time and peak memory for each stage of a pipeline run.
+
+On Linux the kernel's resident-set high-water mark is reset at the start of
+every stage (``/proc/self/clear_refs``), so the recorded peak belongs to
+that stage alone. Elsewhere the process-lifetime peak from ``getrusage`` is
+recorded instead.
+
+Worker processes are tracked apart. The kernel only keeps one high-water
+mark for all finished children over the life of the process, and it can't
+be reset, so ``worker_peak_rss_mb`` is only filled in for a stage whose
+workers pushed that mark up: the largest worker it started, unless an
+earlier stage already had a bigger one. Stages without workers leave it
+empty.
+"""
+
+import collections
+import contextlib
+import sys
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+StageResult = collections.namedtuple('StageResult', ['stage', 'seconds', 'peak_rss_mb', 'worker_peak_rss_mb'])
+
+
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _proc_peak_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def _rusage_mb(who):
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    scale = 1.0 if sys.platform == 'darwin' else 1024.0
+    return resource.getrusage(who).ru_maxrss * scale / 2 ** 20
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (since the last reset on Linux)."""
+    peak = _proc_peak_mb()
+    if peak is not None:
+        return peak
+    if resource is None:
+        return float('nan')
+    return _rusage_mb(resource.RUSAGE_SELF)
+
+
+def children_peak_mb():
+    """Largest resident set size of any finished child process so far, in MB."""
+    if resource is None:
+        return float('nan')
+    return _rusage_mb(resource.RUSAGE_CHILDREN)
+
+
+class StageTimer(object):
+    """Collects a :class:`StageResult` for every ``with timer.stage(name):`` block."""
+
+    def __init__(self, log=None):
+        self.results = []
+        self.log = log
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        _reset_peak()
+        children = children_peak_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            workers = children_peak_mb()
+            result = StageResult(name, seconds, peak_rss_mb(), workers if workers > children else float('nan'))
+            self.results.append(result)
+            if self.log is not None:
+                line = '{:<12} {:8.2f}s {:10.1f} MB'.format(*result[:3])
+                if result.worker_peak_rss_mb == result.worker_peak_rss_mb:
+                    line += '  (workers {:.1f} MB)'.format(result.worker_peak_rss_mb)
+                self.log(line)
+
+    def to_frame(self):
+        return pd.DataFrame(self.results, columns=StageResult._fields)
+
+    def write(self, path):
+        self.to_frame().to_csv(path, index=False)
+        return path
@@ -0,0 +1,152 @@
+"""Rates per 100,000 with exact Poisson confidence intervals.
+
+The notebook lines vaccine deaths up with the CDC dose counts by reversing
+one table, patching labels ('75-84' -> '75+') and copying values over row
+by row (In[28]-In[31]). Doses per manufacturer are a hardcoded list whose
+order has to match the groupby (In[33]). Here a denominator is a table
+with declared key columns, and numerators are joined onto it by key:
+
+    rate_table(cube.rollup('VAX_MANU'), manufacturer_denominators(),
+               on='VAX_MANU', measures=['DIED', 'HOSPITAL'])
+
+The strata come from the denominator. A stratum nobody in VAERS falls into
+gets a count of 0, with a rate of 0 and a proper upper bound. Numerator
+strata without a denominator ('not known' ages, unknown manufacturers) are
+left out. The intervals are the exact (Garwood) Poisson ones, computed for
+every stratum at once.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from . import brackets
+
+PER = 100000
+
+DEFAULT_DENOMINATORS = os.path.join(os.path.dirname(__file__), 'data', 'denominators.json')
+
+# CDC data tracker exports (In[27])
+CDC_FILES = {
+    'cases': 'cases_by_age_group.csv',
+    'deaths': 'deaths_by_age_group.csv',
+    'doses': 'age_groups_of_people_with_at_least_one_dose_administered.csv',
+}
+
+# CDC case/death age groups -> the groups in the CDC dose table
+CDC_TO_DOSE_GROUP = {
+    '0-4 Years': '<18', '5-17 Years': '<18', '18-29 Years': '18-29',
+    '30-39 Years': '30-39', '40-49 Years': '40-49', '50-64 Years': '50-64',
+    '65-74 Years': '65-74', '75-84 Years': '75+', '85+ Years': '75+',
+}
+
+
+def poisson_interval(counts, alpha=0.05):
+    """Exact two-sided ``1 - alpha`` confidence limits for Poisson counts."""
+    counts = np.asarray(counts, dtype='float64')
+    lower = np.where(counts > 0, stats.chi2.ppf(alpha / 2, 2 * counts) / 2, 0.0)
+    upper = stats.chi2.ppf(1 - alpha / 2, 2 * counts + 2) / 2
+    return lower, upper
+
+
+def _keyed(table, on):
+    """``table`` as a frame with the key columns as ordinary columns."""
+    if isinstance(table, pd.Series):
+        table = table.to_frame()
+    if not all(k in table.columns for k in on):
+        table = table.reset_index()
+    return table
+
+
+def join(numerators, denominators, on, measures):
+    """Numerator counts summed per stratum and joined onto the denominator rows."""
+    on = [on] if isinstance(on, str) else list(on)
+    measures = list(measures)
+    counts = _keyed(numerators, on).groupby(on, observed=True, sort=False)[measures].sum()
+    # one_to_one fails loudly if the denominator repeats a stratum
+    joined = _keyed(denominators, on).merge(counts.reset_index(), on=on, how='left',
+                                            validate='one_to_one')
+    joined[measures] = joined[measures].fillna(0).astype('int64')
+    return joined
+
+
+def rates(table, measures, population, per=PER, alpha=0.05):
+    """Add ``<measure>_RATE``, ``_LOWER`` and ``_UPPER`` columns per ``per`` people."""
+    table = table.copy()
+    scale = per / table[population].to_numpy(dtype='float64')
+    for measure in measures:
+        counts = table[measure].to_numpy(dtype='float64')
+        lower, upper = poisson_interval(counts, alpha)
+        table[measure + '_RATE'] = counts * scale
+        table[measure + '_LOWER'] = lower * scale
+        table[measure + '_UPPER'] = upper * scale
+    return table
+
+
+def rate_table(numerators, denominators, on, measures, population='POPULATION',
+               per=PER, alpha=0.05):
+    """Join ``numerators`` onto ``denominators`` by ``on`` and compute the rates."""
+    return rates(join(numerators, denominators, on, measures), measures, population, per, alpha)
+
+
+# denominators
+
+def manufacturer_denominators(path=DEFAULT_DENOMINATORS):
+    """People vaccinated per manufacturer; two-dose vaccines count half their doses."""
+    with open(path) as f:
+        spec = json.load(f)['doses_by_manufacturer']
+    table = pd.DataFrame(spec['rows'])
+    table['POPULATION'] = table['DOSES'] / table['DOSES_PER_PERSON']
+    return table
+
+
+def read_cdc_table(path):
+    """Read one of the CDC data tracker exports (two title lines, then a header)."""
+    return pd.read_csv(path, header=2, encoding='utf-8-sig')
+
+
+def cdc_age_denominators(cdc_dir):
+    """People with at least one dose, COVID cases and COVID deaths per CDC dose age group.
+
+    The case and death tables use finer groups (0-4, 5-17, 75-84, 85+) which
+    are added up into the groups of the dose table.
+    """
+    cases = read_cdc_table(os.path.join(cdc_dir, CDC_FILES['cases']))
+    deaths = read_cdc_table(os.path.join(cdc_dir, CDC_FILES['deaths']))
+    doses = read_cdc_table(os.path.join(cdc_dir, CDC_FILES['doses']))
+
+    covid = pd.concat([
+        cases.set_index('Age Group')['Count of cases'].rename('COVID_CASES'),
+        deaths.set_index('Age Group')['Count of deaths'].rename('COVID_DEATHS'),
+    ], axis=1)
+    covid = covid.groupby(covid.index.map(CDC_TO_DOSE_GROUP)).sum()
+
+    table = doses.set_index('Age Group')[['# Persons at least One Dose']].rename(
+        columns={'# Persons at least One Dose': 'POPULATION'})
+    table = table.join(covid, validate='one_to_one')
+    order = [label for label in brackets.labels('cdc') if label in table.index]
+    return table.reindex(order).rename_axis('AGE_GROUP_CDC').reset_index()
+
+
+# the notebook's two comparisons
+
+def age_group_death_rates(died_counts, denominators, per=PER, alpha=0.05):
+    """Vaccine deaths per 100k vaccinated next to COVID deaths per 100k cases (In[30]-In[31]).
+
+    ``died_counts`` holds vaccine deaths (DIED) per AGE_GROUP_CDC, e.g.
+    ``OutcomeCube.from_frame(master, ['AGE_GROUP_CDC']).rollup('AGE_GROUP_CDC')``.
+    """
+    table = rate_table(died_counts, denominators, 'AGE_GROUP_CDC', ['DIED'],
+                       population='POPULATION', per=per, alpha=alpha)
+    return rates(table, ['COVID_DEATHS'], population='COVID_CASES', per=per, alpha=alpha)
+
+
+def manufacturer_rates(counts, denominators=None, per=PER, alpha=0.05):
+    """Deaths and hospitalizations per 100k vaccinated for each manufacturer (In[33])."""
+    if denominators is None:
+        denominators = manufacturer_denominators()
+    return rate_table(counts, denominators, 'VAX_MANU', ['DIED', 'HOSPITAL'],
+                      population='POPULATION', per=per, alpha=alpha)
@@ -0,0 +1,231 @@
+"""Local snapshots of the reference data the notebook pulls from the web.
+
+The notebook downloads the whole OWID COVID file on every run, scrapes the
+NSC odds-of-dying table and reads the CDC provisional death counts. Here
+each source is saved as a versioned snapshot under a local directory:
+
+    <snapshot dir>/<source>/<timestamp>.<ext>    raw download
+    <snapshot dir>/<source>/<timestamp>.parquet  parsed copy
+    <snapshot dir>/<source>/manifest.json        versions, ETag, Last-Modified
+
+A snapshot younger than ``max_age`` is used as is. An older one is
+revalidated with a conditional GET (If-None-Match / If-Modified-Since), so
+an unchanged upstream costs one 304. With ``offline=True`` the network is
+never touched. A source URL can also be a local path or ``file://`` URL,
+which is how tests point a source at a stand-in fixture.
+"""
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.environ.get('VAERS_REFERENCE_DIR',
+                             os.path.join(REPO_ROOT, '.vaers_cache', 'reference'))
+
+# injuryfacts.nsc.org refuses requests without a browser user agent (In[25])
+BROWSER_HEADERS = {
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36',
+    'referer': 'https://www.google.com/',
+}
+
+SOURCES = {
+    'owid': {
+        'url': 'https://covid.ourworldindata.org/data/owid-covid-data.csv',
+        'format': 'csv',
+    },
+    'nsc_odds': {
+        'url': 'https://injuryfacts.nsc.org/all-injuries/preventable-death-overview/odds-of-dying/',
+        'format': 'html',
+        'headers': BROWSER_HEADERS,
+    },
+    'cdc_deaths': {
+        'url': 'https://data.cdc.gov/api/views/9bhg-hcku/rows.csv?accessType=DOWNLOAD',
+        'format': 'csv',
+    },
+}
+
+DAY = 24 * 60 * 60
+
+
+class SnapshotMissing(LookupError):
+    """Raised in offline mode when a source has never been downloaded."""
+
+
+def _local_path(url):
+    if url.startswith('file://'):
+        return url[len('file://'):]
+    if '://' not in url:
+        return url
+    return None
+
+
+def _parse(raw_path, spec):
+    if spec['format'] == 'html':
+        with open(raw_path, 'rb') as f:
+            df = pd.read_html(io.BytesIO(f.read()))[spec.get('table', 0)]
+    else:
+        df = pd.read_csv(raw_path, low_memory=False)
+    # parquet wants string column names
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+class ReferenceStore(object):
+    """Versioned snapshots for the sources in ``sources``."""
+
+    def __init__(self, directory=DEFAULT_DIR, sources=None, offline=False, max_age=DAY, keep=5):
+        self.directory = directory
+        self.sources = dict(SOURCES if sources is None else sources)
+        self.offline = offline
+        self.max_age = max_age
+        self.keep = keep
+        self._frames = {}
+
+    # manifest handling
+
+    def _source_dir(self, name):
+        return os.path.join(self.directory, name)
+
+    def manifest(self, name):
+        try:
+            with open(os.path.join(self._source_dir(name), 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'versions': []}
+
+    def _write_manifest(self, name, manifest):
+        path = os.path.join(self._source_dir(name), 'manifest.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def versions(self, name):
+        """Snapshot versions of ``name``, oldest first."""
+        return [v['version'] for v in self.manifest(name)['versions']]
+
+    # fetching
+
+    def _download(self, spec, latest):
+        """Return ``(content, etag, last_modified)``, or None if unchanged."""
+        local = _local_path(spec['url'])
+        if local is not None:
+            stat = os.stat(local)
+            etag = '{}-{}'.format(stat.st_size, stat.st_mtime_ns)
+            if latest is not None and latest.get('etag') == etag:
+                return None
+            with open(local, 'rb') as f:
+                return f.read(), etag, None
+
+        import requests
+
+        headers = dict(spec.get('headers', {}))
+        if latest is not None:
+            if latest.get('etag'):
+                headers['If-None-Match'] = latest['etag']
+            if latest.get('last_modified'):
+                headers['If-Modified-Since'] = latest['last_modified']
+        response = requests.get(spec['url'], headers=headers, timeout=60)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response.content, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def refresh(self, name, force=False):
+        """Make sure ``name`` has a current snapshot; returns its manifest entry."""
+        spec = self.sources[name]
+        manifest = self.manifest(name)
+        latest = manifest['versions'][-1] if manifest['versions'] else None
+
+        if self.offline:
+            if latest is None:
+                raise SnapshotMissing('No snapshot of {!r} in {} (offline mode)'.format(name, self.directory))
+            return latest
+        if latest is not None and not force and time.time() - latest['checked_at'] < self.max_age:
+            return latest
+
+        result = self._download(spec, None if force else latest)
+        if result is None:
+            latest['checked_at'] = time.time()
+            self._write_manifest(name, manifest)
+            return latest
+
+        content, etag, last_modified = result
+        digest = hashlib.sha256(content).hexdigest()
+        if latest is not None and latest['sha256'] == digest:
+            latest.update(checked_at=time.time(), etag=etag, last_modified=last_modified)
+            self._write_manifest(name, manifest)
+            return latest
+
+        source_dir = self._source_dir(name)
+        os.makedirs(source_dir, exist_ok=True)
+        version = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        raw_path = os.path.join(source_dir, '{}.{}'.format(version, spec['format']))
+        with open(raw_path, 'wb') as f:
+            f.write(content)
+        _parse(raw_path, spec).to_parquet(os.path.join(source_dir, version + '.parquet'), index=False)
+
+        entry = {'version': version, 'url': spec['url'], 'sha256': digest, 'etag': etag,
+                 'last_modified': last_modified, 'fetched_at': time.time(),
+                 'checked_at': time.time(), 'format': spec['format']}
+        manifest['versions'].append(entry)
+        self._prune(name, manifest)
+        self._write_manifest(name, manifest)
+        return entry
+
+    def _prune(self, name, manifest):
+        while len(manifest['versions']) > self.keep:
+            old = manifest['versions'].pop(0)
+            for ext in (old['format'], 'parquet'):
+                path = os.path.join(self._source_dir(name), '{}.{}'.format(old['version'], ext))
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def load(self, name, version=None):
+        """The parsed snapshot of ``name`` (latest unless ``version`` is given)."""
+        if version is None:
+            version = self.refresh(name)['version']
+        key = (name, version)
+        if key not in self._frames:
+            self._frames[key] = pd.read_parquet(os.path.join(self._source_dir(name), version + '.parquet'))
+        return self._frames[key]
+
+    def clear(self, name):
+        """Delete every snapshot of ``name``."""
+        shutil.rmtree(self._source_dir(name), ignore_errors=True)
+        self._frames = {k: v for k, v in self._frames.items() if k[0] != name}
+
+    # lookups
+
+    def owid_index(self):
+        """OWID rows indexed by (location, date), sorted for fast lookups."""
+        version = self.refresh('owid')['version']
+        key = ('owid', version, 'index')
+        if key not in self._frames:
+            df = self.load('owid', version)
+            df = df.assign(date=pd.to_datetime(df['date']))
+            self._frames[key] = df.set_index(['location', 'date']).sort_index()
+        return self._frames[key]
+
+    def owid_row(self, country, date=None):
+        """OWID figures for ``country`` (location name or ISO code) on ``date``.
+
+        Without a date the latest row for the country is returned. Replaces
+        picking ``owid.iloc[72034]``, which broke whenever the file grew.
+        """
+        index = self.owid_index()
+        if country not in index.index.get_level_values(0):
+            matches = index.loc[index['iso_code'] == country]
+            if matches.empty:
+                raise KeyError('Unknown OWID location {!r}'.format(country))
+            country = matches.index[0][0]
+        rows = index.loc[country]
+        if date is None:
+            return rows.iloc[-1]
+        return rows.loc[pd.Timestamp(date)]
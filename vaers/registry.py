@@ -0,0 +1,116 @@
+"""Find the VAERS drops under a directory and load them year by year.
+
+VAERS ships one ``{YEAR}VAERS{DATA,SYMPTOMS,VAX}.csv`` triple per year, each
+usually sitting in its own ``{YEAR}VAERSData`` folder (see the bundled
+``2020VAERSData/``). :func:`discover` finds every complete triple under a
+root, and the loaders parse the years in parallel on a process pool before
+combining them into one frame per table with the same dtypes across years.
+"""
+
+import collections
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .cache import ANALYSIS_COLUMNS, TABLES, load_table
+from .schema import harmonize
+from .stream import CHUNKSIZE, load_covid_year
+
+FILE_PATTERN = re.compile(r'^(\d{4})VAERS(DATA|SYMPTOMS|VAX)\.csv$', re.IGNORECASE)
+
+YearFiles = collections.namedtuple('YearFiles', ['year', 'paths'])
+
+
+def discover(root, years=None, tables=TABLES):
+    """Return ``{year: YearFiles}`` for every year with all of ``tables`` present.
+
+    Incomplete years are left out. If the same file turns up twice (an old
+    extract lying next to a new one) the first path in sorted order wins.
+    """
+    found = collections.defaultdict(dict)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            match = FILE_PATTERN.match(filename)
+            if match is None:
+                continue
+            year, table = int(match.group(1)), match.group(2).upper()
+            found[year].setdefault(table, os.path.join(dirpath, filename))
+
+    if years is not None:
+        years = {int(y) for y in years}
+    registry = {}
+    for year in sorted(found):
+        if years is not None and year not in years:
+            continue
+        paths = found[year]
+        if all(table in paths for table in tables):
+            registry[year] = YearFiles(year, {t: paths[t] for t in tables})
+    if years is not None and set(registry) != years:
+        missing = sorted(years - set(registry))
+        raise FileNotFoundError('Incomplete or missing VAERS files for {} under {}'.format(missing, root))
+    return registry
+
+
+def combine(frames):
+    """Concatenate per-year frames once their dtypes have been harmonized."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(harmonize(frames), ignore_index=True)
+
+
+def run_pool(func, jobs, workers):
+    """``[func(*job) for job in jobs]`` on a pool of ``workers`` processes, in job order.
+
+    With ``workers=1`` or a single job everything runs in this process.
+    """
+    if workers == 1 or len(jobs) <= 1:
+        return [func(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, *job) for job in jobs]
+        return [f.result() for f in futures]
+
+
+def _load_year(paths, tables, columns, cache_dir):
+    return {table: load_table(paths[table],
+                              columns=columns.get(table) if columns else None,
+                              cache_dir=cache_dir)
+            for table in tables}
+
+
+def load_years(root, years=None, tables=TABLES, columns=ANALYSIS_COLUMNS,
+               workers=None, cache_dir=None):
+    """Load whole tables for every discovered year, one process per year.
+
+    Returns a dict of combined frames keyed by table name. ``workers``
+    defaults to the number of cores; pass 1 to load in-process.
+    """
+    registry = discover(root, years, tables)
+    jobs = [(entry.paths, tables, columns, cache_dir) for entry in registry.values()]
+    results = run_pool(_load_year, jobs, workers)
+    return {table: combine([r[table] for r in results]) for table in tables}
+
+
+def load_covid(root, years=None, vax_type='COVID19', columns=ANALYSIS_COLUMNS,
+               workers=None, chunksize=CHUNKSIZE, cache_dir=None):
+    """Streaming COVID19 load (see :mod:`vaers.stream`) spread over the years.
+
+    Each year is filtered in its own process and the results are combined
+    into one VAX, DATA and SYMPTOMS frame. Categories that only occurred
+    in the filtered-out rows (the other manufacturers, ...) are dropped.
+    """
+    registry = discover(root, years)
+    jobs = [(entry.paths, vax_type, columns, chunksize, cache_dir)
+            for entry in registry.values()]
+    results = run_pool(load_covid_year, jobs, workers)
+    return {table: _drop_unused_categories(combine([r[table] for r in results])) for table in TABLES}
+
+
+def _drop_unused_categories(df):
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.remove_unused_categories()
+    return df
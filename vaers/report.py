@@ -0,0 +1,338 @@
+"""Run the whole analysis headless and write every figure and table to disk.
+
+    python -m vaers.report --root /path/to/vaers --out report/
+
+The steps follow the notebook: load the COVID19 reports, merge VAX onto
+DATA, dedupe, count reports and outcomes per vaccine lot and week and flag
+lots that stand out, clean the free text, find near-duplicate narratives,
+count words, phrases and coded symptoms, flag pre-existing conditions, draw
+the word clouds, bracket ages, count outcomes in the cube, count reports per
+day and the days from vaccination to onset, compute death and
+hospitalization rates per 100k against the CDC and per-manufacturer
+denominators with bootstrap bands, and compute PRR/ROR signals per COVID19
+manufacturer (against the other COVID19 manufacturers) and per vaccine type
+(against every other vaccine in VAERS). Wall time and peak RSS for each
+stage go to ``stages.csv`` so a nightly job can track them.
+
+The steps are stages of a :class:`vaers.dag.Pipeline`, cached on disk, so a
+rerun only repeats the stages whose inputs, parameters or code changed.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from . import (bootstrap, brackets, cache, cohorts, conditions, dedup, lots, neardup, phrases, registry,
+               schema, shared, signals, stream, symptoms, timeseries)
+from . import cube as cube_module
+from . import normalize as normalize_module
+from . import rates as rates_module
+from . import tokens as tokens_module
+from .bootstrap import RESAMPLES, age_group_risk_bands, manufacturer_risk_bands
+from .cohorts import COHORTS, cohort_masks
+from .conditions import DEFAULT_GROUPS, flag_conditions
+from .cube import OutcomeCube
+from .dag import MAX_BYTES, ArtifactStore, Pipeline, csv_bytes, figure_bytes
+from .dedup import dedupe
+from .normalize import DEFAULT_RULES, normalize
+from .profiling import StageTimer
+from .rates import (CDC_FILES, DEFAULT_DENOMINATORS, age_group_death_rates, cdc_age_denominators,
+                    manufacturer_rates)
+from .registry import discover, load_covid, load_years
+from .signals import disproportionality
+from .symptoms import SymptomIndex, melt
+from .timeseries import DailyCounts, day_offsets, histogram_quantiles, latency_histogram
+from .tokens import TokenMatrix
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STAGE_CACHE = os.path.join(REPO_ROOT, '.vaers_cache', 'stages')
+
+FREQUENCY_TOP = 500
+
+
+def build_master(tables):
+    """Merge VAX onto DATA and dedupe to one row per VAERS_ID (In[4]-In[7])."""
+    master = tables['VAX'].merge(tables['DATA'], on='VAERS_ID')
+    master, dedupe_report = dedupe(master, policy='first')
+    return master.drop(columns=['VAX_TYPE', 'VAX_NAME']), dedupe_report
+
+
+def frequency_table(tokens, masks, top=FREQUENCY_TOP):
+    """Top words per cohort side by side (In[12], In[14], In[16])."""
+    columns = {}
+    for name, mask in masks.items():
+        counts = tokens.counts(mask).head(top)
+        columns[name + '_word'] = counts.index.to_numpy()
+        columns[name + '_count'] = counts.to_numpy()
+    return pd.DataFrame({k: pd.Series(v) for k, v in columns.items()})
+
+
+def symptom_term_table(index, master, masks, top=FREQUENCY_TOP):
+    """Reports per coded (MedDRA) symptom for each cohort."""
+    ids = master['VAERS_ID'].to_numpy()
+    counts = {name: index.counts(within=ids[mask]) for name, mask in masks.items()}
+    table = pd.DataFrame(counts).fillna(0).astype('int64')
+    return table.sort_values(list(masks)[0], ascending=False).head(top).rename_axis('SYMPTOM')
+
+
+def condition_table(master, masks, columns=('HISTORY',)):
+    """Percentage of each cohort with each pre-existing condition (In[19])."""
+    flags = flag_conditions(master, columns)
+    table = pd.DataFrame({name: flags[mask].mean() * 100 for name, mask in masks.items()})
+    return table.rename_axis('CONDITION')
+
+
+def latency_table(master, offsets, start='VAX_DATE', end='ONSET_DATE', by=('VAX_MANU', 'VAX_DOSE_SERIES')):
+    """Quantiles and histogram of the days from ``start`` to ``end`` per group."""
+    histogram = latency_histogram(master, by, start, end, offsets=offsets)
+    return histogram_quantiles(histogram).join(histogram)
+
+
+def _load(root=None, years=None, workers=None):
+    return load_covid(root, years, workers=workers)
+
+
+def _master(tables, log=None):
+    master, dedupe_report = build_master(tables)
+    if log is not None:
+        log('dedupe: {} rows in, {} out, {} collapsed'.format(*dedupe_report[1:]))
+    return master
+
+
+def _symptoms(tables):
+    symptoms_long = melt(tables['SYMPTOMS'])
+    return symptoms_long, SymptomIndex.from_long(symptoms_long), tables['VAX'][['VAERS_ID', 'VAX_MANU']]
+
+
+def _near_duplicates(master, one_per_cluster=False, log=None):
+    master = neardup.assign(master.copy(deep=False))
+    near_duplicates = neardup.summary(master)
+    if log is not None:
+        log('near duplicates: {} reports in {} clusters'.format(
+            len(near_duplicates), near_duplicates['CLUSTER_ID'].nunique()))
+    if one_per_cluster:
+        master = neardup.collapse(master)
+    return master, near_duplicates
+
+
+def _tokens(deduped):
+    return TokenMatrix.from_series(deduped[0]['SYMPTOM_TEXT'])
+
+
+def _word_tables(deduped, tokens, symptoms):
+    master, near_duplicates = deduped
+    masks = cohort_masks(master, COHORTS)
+    return {
+        'near_duplicates.csv': csv_bytes(near_duplicates, index=False),
+        'symptom_frequency.csv': csv_bytes(frequency_table(tokens, masks), index=False),
+        'symptom_terms.csv': csv_bytes(symptom_term_table(symptoms[1], master, masks)),
+    }
+
+
+def _lots(master):
+    counts = lots.LotCounts.from_frame(master)
+    return {
+        'lots.csv': csv_bytes(counts.totals()),
+        'lot_signals.csv': csv_bytes(lots.lot_signals(counts), index=False),
+    }
+
+
+def _phrases(deduped, seed=0, workers=None):
+    table = phrases.mine_frame(deduped[0], seed=seed, workers=workers).table()
+    return {'phrase_frequency.csv': csv_bytes(table, index=False)}
+
+
+def _conditions(deduped):
+    master = deduped[0]
+    return {'conditions.csv': csv_bytes(condition_table(master, cohort_masks(master, COHORTS)))}
+
+
+def _wordclouds(deduped, tokens, workers=None):
+    from .wordclouds import render_clouds
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = render_clouds(deduped[0], tmp, matrices={'SYMPTOM_TEXT': tokens}, workers=workers)
+        files = {}
+        for path in paths.values():
+            with open(path, 'rb') as f:
+                files[os.path.basename(path)] = f.read()
+    return files
+
+
+def _brackets(deduped):
+    master = deduped[0].copy(deep=False)
+    brackets.assign(master, 'notebook')
+    return brackets.assign(master, 'cdc', out='AGE_GROUP_CDC')
+
+
+def _cubes(master):
+    return OutcomeCube.from_frame(master), OutcomeCube.from_frame(master, ['AGE_GROUP_CDC'])
+
+
+def _timeseries(master):
+    offsets = day_offsets(master)
+    return {
+        'daily': DailyCounts.from_frame(master, 'RECVDATE', offsets=offsets['RECVDATE']).to_frame(),
+        'onset_latency': latency_table(master, offsets),
+        'reporting_lag': latency_table(master, offsets, 'ONSET_DATE', 'RECVDATE', by='VAX_MANU'),
+    }
+
+
+def _rates(cubes, cdc_dir=REPO_ROOT):
+    cube, cdc_cube = cubes
+    return {
+        'age_brackets': cube.cohort_counts('AGE_BRACKET'),
+        'age_group_death_rates': age_group_death_rates(cdc_cube.rollup('AGE_GROUP_CDC'),
+                                                       cdc_age_denominators(cdc_dir)),
+        'manufacturers': manufacturer_rates(cube.rollup('VAX_MANU')),
+    }
+
+
+def _tables(cubes, series, rates):
+    return {
+        'outcome_cube.csv': csv_bytes(cubes[0].to_frame()),
+        'daily_reports.csv': csv_bytes(series['daily']),
+        'onset_latency.csv': csv_bytes(series['onset_latency']),
+        'reporting_lag.csv': csv_bytes(series['reporting_lag']),
+        'age_brackets.csv': csv_bytes(rates['age_brackets']),
+        'age_group_death_rates.csv': csv_bytes(rates['age_group_death_rates'], index=False),
+        'manufacturers.csv': csv_bytes(rates['manufacturers'], index=False),
+    }
+
+
+def _bootstrap(cubes, resamples=RESAMPLES, seed=0, cdc_dir=REPO_ROOT, workers=None):
+    cube, cdc_cube = cubes
+    ages = age_group_risk_bands(cdc_cube, cdc_age_denominators(cdc_dir), n=resamples, seed=seed, workers=workers)
+    manufacturers = manufacturer_risk_bands(cube, n=resamples, seed=seed, workers=workers)
+    return {
+        'age_group_risk_bands.csv': csv_bytes(ages, index=False),
+        'manufacturer_risk_bands.csv': csv_bytes(manufacturers, index=False),
+    }
+
+
+def _signals(symptoms):
+    symptoms_long, _, vax = symptoms
+    return {'manufacturer_signals.csv': csv_bytes(disproportionality(vax, symptoms_long, by='VAX_MANU'),
+                                                  index=False)}
+
+
+def _vaccine_signals(root=None, years=None, workers=None):
+    # every vaccine type, not only the COVID19 reports the other stages load
+    columns = {'VAX': ['VAERS_ID', 'VAX_TYPE'], 'SYMPTOMS': cache.ANALYSIS_COLUMNS['SYMPTOMS']}
+    tables = load_years(root, years, tables=('VAX', 'SYMPTOMS'), columns=columns, workers=workers)
+    return {'vaccine_type_signals.csv': csv_bytes(disproportionality(tables['VAX'], tables['SYMPTOMS']),
+                                                  index=False)}
+
+
+def _figures(series, rates):
+    from . import plots
+
+    return {
+        'daily_reports.png': figure_bytes(plots.daily_reports_figure, series['daily']),
+        'age_brackets.png': figure_bytes(plots.age_bracket_figure, rates['age_brackets']),
+        'covid_vs_vaccine_deaths.png': figure_bytes(plots.death_rates_figure, rates['age_group_death_rates']),
+        'manufacturers.png': figure_bytes(plots.manufacturer_figure, rates['manufacturers']),
+    }
+
+
+def pipeline(root, years=None, cdc_dir=REPO_ROOT, workers=None, resamples=RESAMPLES, seed=0,
+             one_per_cluster=False, store=None, log=print):
+    """The report as a :class:`vaers.dag.Pipeline`; ``store`` caches the stages."""
+    from . import plots, wordclouds
+
+    found = discover(root, years).values()
+    sources = [path for entry in found for path in sorted(entry.paths.values())]
+    vax_sources = [entry.paths[table] for entry in found for table in ('SYMPTOMS', 'VAX')]
+    cdc_files = [os.path.join(cdc_dir, name) for name in sorted(CDC_FILES.values())]
+    stopwords = [wordclouds.STOPWORDS_FILE]
+    years = sorted(years) if years else None
+
+    graph = Pipeline(store)
+    graph.add('load', _load, params={'years': years}, options={'root': root, 'workers': workers},
+              code=(registry, stream, cache, schema), files=sources)
+    graph.add('master', _master, ['load'], options={'log': log}, code=(build_master, dedup))
+    graph.add('symptoms', _symptoms, ['load'], code=(symptoms,))
+    graph.add('lots', _lots, ['master'], code=(lots,), files=[lots.RULES_FILE], outputs=True)
+    graph.add('clean', normalize, ['master'], code=(normalize_module,), files=[DEFAULT_RULES])
+    graph.add('neardup', _near_duplicates, ['clean'], params={'one_per_cluster': one_per_cluster},
+              options={'log': log}, code=(neardup, tokens_module))
+    graph.add('tokenize', _tokens, ['neardup'], code=(tokens_module,))
+    graph.add('word_tables', _word_tables, ['neardup', 'tokenize', 'symptoms'],
+              code=(frequency_table, symptom_term_table, cohorts), outputs=True)
+    graph.add('phrases', _phrases, ['neardup'], params={'seed': seed}, options={'workers': workers},
+              code=(phrases, tokens_module, shared),
+              files=stopwords, outputs=True)
+    graph.add('conditions', _conditions, ['neardup'], code=(condition_table, conditions),
+              files=[DEFAULT_GROUPS], outputs=True)
+    graph.add('wordclouds', _wordclouds, ['neardup', 'tokenize'], options={'workers': workers},
+              code=(wordclouds,), files=stopwords, outputs=True)
+    graph.add('bracket', _brackets, ['neardup'], code=(brackets,))
+    graph.add('cube', _cubes, ['bracket'], code=(cube_module,))
+    graph.add('timeseries', _timeseries, ['bracket'], code=(timeseries, latency_table))
+    graph.add('rates', _rates, ['cube'], options={'cdc_dir': cdc_dir}, code=(rates_module,),
+              files=cdc_files + [DEFAULT_DENOMINATORS])
+    graph.add('tables', _tables, ['cube', 'timeseries', 'rates'], outputs=True)
+    graph.add('bootstrap', _bootstrap, ['cube'], params={'resamples': resamples, 'seed': seed},
+              options={'cdc_dir': cdc_dir, 'workers': workers}, code=(bootstrap, rates_module),
+              files=cdc_files + [DEFAULT_DENOMINATORS], outputs=True)
+    graph.add('signals', _signals, ['symptoms'], code=(signals,), outputs=True)
+    graph.add('vaccine_signals', _vaccine_signals, params={'years': years}, options={'root': root, 'workers': workers},
+              code=(registry, cache, schema, signals), files=vax_sources, outputs=True)
+    graph.add('figures', _figures, ['timeseries', 'rates'], code=(plots,), outputs=True)
+    return graph
+
+
+def run(root, out_dir, years=None, cdc_dir=REPO_ROOT, workers=None, resamples=RESAMPLES, seed=0,
+        one_per_cluster=False, cache_dir=DEFAULT_STAGE_CACHE, cache_bytes=MAX_BYTES, force=(), log=print):
+    """Run every stage and write the outputs to ``out_dir``; returns the timer.
+
+    With ``one_per_cluster`` every cluster of near-duplicate reports is
+    counted once in the tables and rates (see :mod:`vaers.neardup`). Stage
+    results are cached in ``cache_dir`` (None to always run everything) and
+    reused while their inputs, parameters and code are unchanged; stages in
+    ``force`` run anyway.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    timer = StageTimer(log=log)
+    store = ArtifactStore(cache_dir, cache_bytes) if cache_dir is not None else None
+    graph = pipeline(root, years, cdc_dir, workers, resamples, seed, one_per_cluster, store, log)
+    graph.run(out_dir=out_dir, force=force, timer=timer, log=log)
+    timer.write(os.path.join(out_dir, 'stages.csv'))
+    return timer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the COVID vaccine VAERS analysis headless.')
+    parser.add_argument('--root', default=REPO_ROOT,
+                        help='folder holding the {YEAR}VAERSData folders (searched recursively)')
+    parser.add_argument('--out', default='report', help='output directory for figures and tables')
+    parser.add_argument('--years', type=int, nargs='*', help='years to load (default: every year found)')
+    parser.add_argument('--cdc-dir', default=REPO_ROOT, help='folder holding the CDC age group CSVs')
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per core)')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES,
+                        help='bootstrap resamples for the risk bands (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the bootstrap (default: %(default)s)')
+    parser.add_argument('--one-per-cluster', action='store_true',
+                        help='count each cluster of near-duplicate reports once')
+    parser.add_argument('--cache-dir', default=DEFAULT_STAGE_CACHE,
+                        help='where stage results are cached (default: %(default)s)')
+    parser.add_argument('--cache-size-gb', type=float, default=MAX_BYTES / 2 ** 30,
+                        help='least recently used results are removed past this size (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='run every stage and cache nothing')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE',
+                        help='stages to run even if their cached result is up to date')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    run(args.root, args.out, years=args.years or None, cdc_dir=args.cdc_dir,
+        workers=args.workers, resamples=args.resamples, seed=args.seed,
+        one_per_cluster=args.one_per_cluster, cache_dir=None if args.no_cache else args.cache_dir,
+        cache_bytes=int(args.cache_size_gb * 2 ** 30), force=args.force)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
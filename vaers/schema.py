@@ -0,0 +1,154 @@
+"""Compact dtypes for the VAERS columns, applied when a file is loaded.
+
+Straight out of read_csv every VAERS column is either float64 or Python
+string objects: the outcome flags are 'Y'/NaN strings, a handful of codes
+(SEX, STATE, VAX_MANU, ...) repeat the same few strings millions of times
+and the dates are unparsed 'MM/DD/YYYY' text. ``SCHEMA`` declares a
+compact type for each of them:
+
+- ``'flag'``: 'Y'/blank outcome flags become bool,
+- ``'category'``: low-cardinality codes become categoricals,
+- ``'date'``: dates are parsed with their fixed format,
+- anything else is a dtype name, e.g. nullable Float32 for the ages.
+
+Free text (SYMPTOM_TEXT, HISTORY, ...) is left alone. :func:`memory_report`
+shows what the schema saves on a frame.
+
+    python -m vaers.schema /path/to/2021VAERSDATA.csv
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .cohorts import flag_mask
+
+# bump when SCHEMA changes so Parquet caches built with the old one are redone
+SCHEMA_VERSION = 2
+
+DATE_FORMAT = '%m/%d/%Y'
+DATE_DTYPE = 'datetime64[ms]'
+
+SCHEMA = {
+    # outcome flags
+    'DIED': 'flag', 'L_THREAT': 'flag', 'ER_VISIT': 'flag', 'HOSPITAL': 'flag',
+    'X_STAY': 'flag', 'DISABLE': 'flag', 'BIRTH_DEFECT': 'flag',
+    'OFC_VISIT': 'flag', 'ER_ED_VISIT': 'flag',
+    # codes
+    'STATE': 'category', 'SEX': 'category', 'RECOVD': 'category',
+    'V_ADMINBY': 'category', 'V_FUNDBY': 'category', 'VAX_TYPE': 'category',
+    'VAX_MANU': 'category', 'VAX_DOSE_SERIES': 'category', 'VAX_ROUTE': 'category',
+    'VAX_SITE': 'category', 'VAX_NAME': 'category',
+    # dates
+    'RECVDATE': 'date', 'RPT_DATE': 'date', 'DATEDIED': 'date', 'VAX_DATE': 'date',
+    'ONSET_DATE': 'date', 'TODAYS_DATE': 'date',
+    # numbers
+    'AGE_YRS': 'Float32', 'CAGE_YR': 'Float32', 'CAGE_MO': 'Float32',
+    'HOSPDAYS': 'Float32', 'NUMDAYS': 'Float32', 'FORM_VERS': 'Int8',
+    'SYMPTOMVERSION1': 'float32', 'SYMPTOMVERSION2': 'float32',
+    'SYMPTOMVERSION3': 'float32', 'SYMPTOMVERSION4': 'float32',
+    'SYMPTOMVERSION5': 'float32',
+}
+
+
+def convert(series, kind):
+    """Convert one column to its ``SCHEMA`` kind."""
+    if kind == 'flag':
+        return pd.Series(flag_mask(series), index=series.index, name=series.name)
+    if kind == 'category':
+        return series.astype('category')
+    if kind == 'date':
+        if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+            series = pd.to_datetime(series, format=DATE_FORMAT, errors='coerce')
+        # pandas picks the resolution per file; pin it (to one Parquet can store) so years concatenate
+        return series.astype(DATE_DTYPE)
+    return series.astype(kind)
+
+
+def apply(df, schema=SCHEMA):
+    """Convert the columns of ``df`` listed in ``schema`` in place; returns ``df``."""
+    for column in df.columns:
+        if column in schema:
+            df[column] = convert(df[column], schema[column])
+    return df
+
+
+def memory_report(df, schema=SCHEMA):
+    """Per column dtype and MB before and after applying ``schema`` to ``df``.
+
+    ``df`` itself is not modified. The last row holds the totals.
+    """
+    after = apply(df.copy(deep=False), schema)
+    before_mb = df.memory_usage(index=False, deep=True) / 2 ** 20
+    after_mb = after.memory_usage(index=False, deep=True) / 2 ** 20
+    report = pd.DataFrame({
+        'dtype_before': df.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'mb_before': before_mb,
+        'mb_after': after_mb,
+    })
+    report.loc['TOTAL'] = ['', '', before_mb.sum(), after_mb.sum()]
+    report['ratio'] = report['mb_after'] / report['mb_before']
+    return report.rename_axis('column')
+
+
+def _common_dtype(series, missing):
+    """Pick one dtype for a column that may differ from year to year."""
+    dtypes = [s.dtype for s in series]
+    if all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+        categories = pd.Index([])
+        for d in dtypes:
+            categories = categories.union(d.categories)
+        return pd.CategoricalDtype(categories)
+    if all(d == dtypes[0] for d in dtypes):
+        dtype = dtypes[0]
+        if missing and pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, np.dtype):
+            return 'float64'
+        return dtype
+    if all(isinstance(d, np.dtype) and d.kind == 'M' for d in dtypes):
+        return np.result_type(*dtypes)
+    if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return 'float64'
+    return 'object'
+
+
+def harmonize(frames):
+    """Give every frame the same columns (in first-seen order) and dtypes.
+
+    A bool column (an outcome flag) that a year does not have is False for
+    that year's rows, so it stays bool instead of falling back to object.
+    """
+    columns = []
+    for frame in frames:
+        columns.extend(c for c in frame.columns if c not in columns)
+
+    dtypes = {}
+    for column in columns:
+        present = [f[column] for f in frames if column in f.columns]
+        missing = len(present) < len(frames)
+        dtypes[column] = _common_dtype(present, missing)
+    flags = [c for c in columns if pd.api.types.is_bool_dtype(dtypes[c])]
+
+    out = []
+    for frame in frames:
+        absent = [c for c in flags if c not in frame.columns]
+        frame = frame.reindex(columns=columns)
+        if absent:
+            frame[absent] = False
+        out.append(frame.astype(dtypes))
+    return out
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    from .cache import read_source
+
+    for path in argv:
+        print(path)
+        print(memory_report(read_source(path, apply_schema=False)).to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
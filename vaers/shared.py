@@ -0,0 +1,175 @@
+"""master_df published once for every worker process, as memory-mapped Arrow.
+
+Sending master_df to a process pool pickles the whole frame into every
+worker, so sixteen workers hold sixteen copies. Instead the frame is
+written once as an uncompressed Arrow IPC file under ``/dev/shm`` (shared
+memory on Linux; the temp folder elsewhere). Workers memory-map the file:
+numeric columns, the codes and dictionaries of categorical columns and the
+offsets and bytes of string columns are read in place from pages all
+processes share. What travels to a worker is the file path.
+
+Cohort masks (hospitalized, died, a manufacturer, ...) travel as bitmaps,
+one bit per report, in Arrow's bit order, so a worker can filter with them
+without unpacking a boolean array first.
+
+    with SharedTable.publish(master_df, ['SYMPTOM_TEXT', 'VAX_MANU']) as shared:
+        results = map_cohorts(count_words, shared, cohort_masks(master_df))
+
+Without pyarrow the frame itself is pickled to the workers as before.
+"""
+
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .registry import run_pool
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover - the frame is pickled to the workers instead
+    pa = None
+
+SHM_DIR = '/dev/shm'
+
+# memory maps this process has opened, by path, so a worker maps each file once
+_MAPPED = {}
+
+
+def shared_dir():
+    """``/dev/shm`` when it is there and writable, otherwise the temp folder."""
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+def pack(mask):
+    """A boolean mask as a bitmap, one bit per row (least significant bit first, like Arrow)."""
+    return np.packbits(np.asarray(mask, dtype=bool), bitorder='little').tobytes()
+
+
+def unpack(bits, length, start=0, stop=None):
+    """Rows ``start:stop`` of a :func:`pack` bitmap as a boolean array."""
+    stop = length if stop is None else min(stop, length)
+    first, last = start // 8, (stop + 7) // 8
+    block = np.unpackbits(np.frombuffer(bits, dtype='uint8', count=last - first, offset=first),
+                          bitorder='little')
+    return block[start - first * 8:stop - first * 8].astype(bool)
+
+
+def as_arrow(bits, length):
+    """A :func:`pack` bitmap as an Arrow boolean array, without copying it."""
+    return pa.BooleanArray.from_buffers(pa.bool_(), length, [None, pa.py_buffer(bits)])
+
+
+def _to_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # plain object columns of text are written as large strings so offsets never overflow
+    fields = [pa.field(f.name, pa.large_string()) if pa.types.is_string(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _map(path):
+    if path not in _MAPPED:
+        source = pa.memory_map(path, 'r')
+        _MAPPED[path] = pa.ipc.open_file(source).read_all()
+    return _MAPPED[path]
+
+
+class SharedTable(object):
+    """Handle to a published frame; cheap to pickle, attached lazily in each process."""
+
+    def __init__(self, path, rows, columns, frame=None):
+        self.path = path
+        self.rows = rows
+        self.columns = list(columns)
+        self._frame = frame
+        self._owner = False
+
+    @classmethod
+    def publish(cls, df, columns=None, directory=None):
+        """Write ``df`` (or ``columns`` of it) for the workers; the caller owns the file."""
+        if columns is not None:
+            df = df[list(columns)]
+        if pa is None:
+            return cls(None, len(df), df.columns, frame=df)
+        directory = directory or shared_dir()
+        path = os.path.join(directory, 'vaers-{}-{}.arrow'.format(os.getpid(), uuid.uuid4().hex))
+        table = _to_arrow(df)
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        shared = cls(path, len(df), df.columns)
+        shared._owner = True
+        return shared
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_owner'] = False
+        return state
+
+    def table(self, columns=None):
+        """The published columns as an Arrow table backed by the shared pages."""
+        table = _map(self.path)
+        return table if columns is None else table.select(list(columns))
+
+    def frame(self, columns=None, mask=None):
+        """A pandas view of the published columns, optionally only the rows of a bitmap.
+
+        Columns stay Arrow-backed (``pd.ArrowDtype``), so nothing is copied
+        unless ``mask`` picks rows out.
+        """
+        if self.path is None:
+            frame = self._frame if columns is None else self._frame[list(columns)]
+            return frame if mask is None else frame[unpack(mask, self.rows)]
+        table = self.table(columns)
+        if mask is not None:
+            table = table.filter(as_arrow(mask, self.rows))
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def slices(self, columns=None, chunk=100000):
+        """``(start, table)`` pieces of ``chunk`` rows; zero-copy slices of the shared table.
+
+        Without pyarrow the pieces are slices of the pickled frame.
+        """
+        table = self.table(columns) if self.path is not None else self._frame[list(columns or self.columns)]
+        for start in range(0, self.rows, chunk):
+            yield start, (table.slice(start, chunk) if self.path is not None else table.iloc[start:start + chunk])
+
+    @property
+    def nbytes(self):
+        if self.path is None:
+            return int(self._frame.memory_usage(deep=True).sum())
+        return os.path.getsize(self.path)
+
+    def close(self):
+        """Delete the file if this process published it (mapped pages stay valid until unmapped)."""
+        _MAPPED.pop(self.path, None)
+        if self._owner and self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _call(func, shared, name, bits, kwargs):
+    return func(shared, name, bits, **kwargs)
+
+
+def map_cohorts(func, shared, masks, workers=None, **kwargs):
+    """``{name: func(shared, name, bitmap, **kwargs)}`` for each mask, on a process pool.
+
+    Each worker gets the :class:`SharedTable` handle and the cohort's bitmap
+    (``len(mask) / 8`` bytes), never the rows themselves.
+    """
+    names = list(masks)
+    jobs = [(func, shared, name, pack(masks[name]), kwargs) for name in names]
+    return dict(zip(names, run_pool(_call, jobs, workers)))
@@ -0,0 +1,86 @@
+"""Chunked loader that only keeps the COVID19 reports.
+
+Only a fraction of VAERS is about COVID vaccines, so there's no point in
+materializing every table for every year before filtering. The VAX files are
+read in chunks and filtered on VAX_TYPE as they stream past; the surviving
+VAERS_IDs then decide which DATA and SYMPTOMS rows are kept. Peak memory
+follows the number of COVID rows rather than the size of the archive.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .cache import ANALYSIS_COLUMNS, cache_paths, is_fresh, pq, read_source
+from .schema import harmonize
+
+CHUNKSIZE = 100000
+
+
+def iter_chunks(path, columns=None, chunksize=CHUNKSIZE, cache_dir=None):
+    """Yield ``path`` as a series of frames.
+
+    When the Parquet cache for the file is fresh the chunks come from its
+    record batches, otherwise the CSV is parsed ``chunksize`` rows at a time.
+    """
+    if pq is not None and is_fresh(path, cache_dir):
+        parquet_file = pq.ParquetFile(cache_paths(path, cache_dir)[0])
+        if columns is not None:
+            columns = [c for c in parquet_file.schema_arrow.names if c in columns]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in read_source(path, columns=columns, chunksize=chunksize):
+            yield chunk
+
+
+def isin_sorted(values, sorted_ids):
+    """Vectorized membership test against a sorted, unique id array."""
+    values = np.asarray(values)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_ids, values)
+    pos[pos == len(sorted_ids)] = 0
+    return sorted_ids[pos] == values
+
+
+def _concat(frames, columns):
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    # chunks can end up with different categories for the same column
+    return pd.concat(harmonize(frames), ignore_index=True)
+
+
+def filter_vax(path, vax_type='COVID19', columns=None, chunksize=CHUNKSIZE, cache_dir=None):
+    """Stream a VAX file and keep the rows for one vaccine type."""
+    frames = []
+    for chunk in iter_chunks(path, columns, chunksize, cache_dir):
+        frames.append(chunk[chunk['VAX_TYPE'] == vax_type])
+    return _concat(frames, columns)
+
+
+def filter_by_ids(path, ids, columns=None, chunksize=CHUNKSIZE, cache_dir=None):
+    """Stream a DATA or SYMPTOMS file and keep the rows whose VAERS_ID is in ``ids``."""
+    ids = np.unique(np.asarray(ids, dtype='int64'))
+    frames = []
+    for chunk in iter_chunks(path, columns, chunksize, cache_dir):
+        frames.append(chunk[isin_sorted(chunk['VAERS_ID'].to_numpy(), ids)])
+    return _concat(frames, columns)
+
+
+def load_covid_year(paths, vax_type='COVID19', columns=ANALYSIS_COLUMNS,
+                    chunksize=CHUNKSIZE, cache_dir=None):
+    """Load the VAX, DATA and SYMPTOMS rows for ``vax_type`` from one year.
+
+    ``paths`` maps table name to CSV path, as found by
+    :func:`vaers.registry.discover`. Returns a dict of frames keyed by table.
+    """
+    columns = columns or {}
+    vax = filter_vax(paths['VAX'], vax_type, columns.get('VAX'), chunksize, cache_dir)
+    ids = vax['VAERS_ID'].to_numpy()
+    return {
+        'VAX': vax,
+        'DATA': filter_by_ids(paths['DATA'], ids, columns.get('DATA'),
+                              chunksize, cache_dir),
+        'SYMPTOMS': filter_by_ids(paths['SYMPTOMS'], ids, columns.get('SYMPTOMS'),
+                                  chunksize, cache_dir),
+    }
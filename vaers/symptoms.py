@@ -0,0 +1,111 @@
+"""Coded (MedDRA) symptoms as a long table with an inverted index.
+
+VAERSSYMPTOMS is wide, with SYMPTOM1..SYMPTOM5 and a version column for
+each. A report with more than five symptoms continues on extra rows, which
+is why joining it onto master_df created thousands of duplicates. Here the
+file is melted into one ``(VAERS_ID, SYMPTOM, VERSION)`` row per coded
+symptom, with the terms stored as a categorical. From that table
+:class:`SymptomIndex` keeps, for every term, the sorted array of VAERS_IDs
+reporting it. Queries like "Myocarditis and hospitalized" become sorted
+array intersections instead of merges.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .stream import isin_sorted
+
+SLOTS = 5
+
+
+def melt(symptoms):
+    """Turn the wide VAERSSYMPTOMS layout into one row per (report, term)."""
+    ids, terms, versions = [], [], []
+    for slot in range(1, SLOTS + 1):
+        term_column = 'SYMPTOM{}'.format(slot)
+        if term_column not in symptoms.columns:
+            continue
+        present = symptoms[term_column].notna().to_numpy()
+        ids.append(symptoms['VAERS_ID'].to_numpy()[present])
+        terms.append(symptoms[term_column].to_numpy()[present])
+        version_column = 'SYMPTOMVERSION{}'.format(slot)
+        if version_column in symptoms.columns:
+            versions.append(symptoms[version_column].to_numpy(dtype='float32')[present])
+        else:
+            versions.append(np.full(present.sum(), np.nan, dtype='float32'))
+
+    if not ids:
+        ids, terms, versions = [np.empty(0, 'int64')], [np.empty(0, object)], [np.empty(0, 'float32')]
+    long = pd.DataFrame({
+        'VAERS_ID': np.concatenate(ids).astype('int64'),
+        'SYMPTOM': pd.Categorical(np.concatenate(terms)),
+        'VERSION': np.concatenate(versions),
+    })
+    return long.drop_duplicates(['VAERS_ID', 'SYMPTOM'], ignore_index=True)
+
+
+class SymptomIndex(object):
+    """For each symptom term, the sorted VAERS_IDs that report it.
+
+    The index is stored CSR-style: ``ids`` holds every posting list back to
+    back, and ``offsets[i]:offsets[i + 1]`` is the slice for ``terms[i]``.
+    """
+
+    def __init__(self, terms, offsets, ids):
+        self.terms = pd.Index(terms)
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def from_long(cls, long):
+        codes = long['SYMPTOM'].cat.codes.to_numpy()
+        ids = long['VAERS_ID'].to_numpy()
+        order = np.lexsort((ids, codes))
+        terms = long['SYMPTOM'].cat.categories
+        offsets = np.searchsorted(codes[order], np.arange(len(terms) + 1))
+        return cls(terms, offsets, ids[order])
+
+    @classmethod
+    def from_wide(cls, symptoms):
+        return cls.from_long(melt(symptoms))
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def reports(self, term):
+        """Sorted VAERS_IDs reporting ``term``."""
+        i = self.terms.get_loc(term)
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def all_of(self, terms, within=None):
+        """VAERS_IDs reporting every term in ``terms`` (optionally limited to ``within``)."""
+        result = None if within is None else np.unique(np.asarray(within, dtype='int64'))
+        for term in sorted(terms, key=lambda t: len(self.reports(t))):
+            ids = self.reports(term)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return np.empty(0, dtype='int64') if result is None else result
+
+    def any_of(self, terms, within=None):
+        """VAERS_IDs reporting at least one term in ``terms``."""
+        result = np.unique(np.concatenate([self.reports(t) for t in terms] or [np.empty(0, 'int64')]))
+        if within is not None:
+            result = result[isin_sorted(result, np.unique(np.asarray(within, dtype='int64')))]
+        return result
+
+    def mask(self, vaers_ids, terms, how='any'):
+        """Boolean mask over ``vaers_ids`` (e.g. master_df['VAERS_ID'])."""
+        matches = self.all_of(terms) if how == 'all' else self.any_of(terms)
+        return isin_sorted(np.asarray(vaers_ids), matches)
+
+    def counts(self, within=None):
+        """Reports per term, most common first, optionally within a set of VAERS_IDs."""
+        if within is None:
+            totals = np.diff(self.offsets)
+        else:
+            hits = isin_sorted(self.ids, np.unique(np.asarray(within, dtype='int64')))
+            cumulative = np.concatenate([[0], np.cumsum(hits)])
+            totals = cumulative[self.offsets[1:]] - cumulative[self.offsets[:-1]]
+        return pd.Series(totals, index=self.terms).sort_values(ascending=False, kind='stable')
@@ -0,0 +1,394 @@
+"""Synthetic VAERS drops at any size, for benchmarks.
+
+The bundled ``2020VAERSData/`` files cover two weeks of COVID reports, far
+from the tens of millions of rows of the later years. :func:`write` produces
+a ``{YEAR}VAERSData`` folder with DATA, VAX and SYMPTOMS files of any size
+that look like the real ones to the pipeline. The files have:
+
+- the real column set and order, with the flags as 'Y' or blank,
+- flags drawn as whole patterns (DIED+HOSPITAL, ER_ED_VISIT, ...), so their
+  combinations occur as often as in the real reports,
+- free text with the real length distribution, made of VAERS vocabulary,
+- one to several VAX rows and SYMPTOMS rows per report, as in the real files.
+
+All of this comes from a profile (``vaers/data/synthetic_profile.json``).
+:func:`fit` measures one from a real drop:
+
+    python -m vaers.synthetic --fit /path/to/2021VAERSData --profile my_profile.json
+    python -m vaers.synthetic --out /tmp/synthetic --reports 1000000 --profile my_profile.json
+
+Reports are generated and appended in chunks, so memory stays flat at any
+size.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .cache import read_source
+from .registry import discover
+from .schema import DATE_FORMAT
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pragma: no cover - falls back to pandas' (much slower) writer
+    pa = pacsv = None
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(__file__), 'data', 'synthetic_profile.json')
+
+SIZES = (100000, 1000000, 5000000, 20000000)
+CHUNK = 200000
+FIRST_ID = 900000
+
+# every 5%, then finer in the long tail of the text lengths
+QUANTILES = np.concatenate([np.linspace(0, 0.95, 20), [0.99, 0.999, 1]])
+FLAG_COLUMNS = ['DIED', 'L_THREAT', 'ER_VISIT', 'HOSPITAL', 'X_STAY', 'DISABLE',
+                'BIRTH_DEFECT', 'OFC_VISIT', 'ER_ED_VISIT']
+CATEGORY_COLUMNS = ['STATE', 'SEX', 'RECOVD', 'V_ADMINBY', 'V_FUNDBY', 'SPLTTYPE', 'FORM_VERS']
+TEXT_COLUMNS = ['SYMPTOM_TEXT', 'LAB_DATA', 'OTHER_MEDS', 'CUR_ILL', 'HISTORY', 'PRIOR_VAX', 'ALLERGIES']
+VAX_PRODUCT = ['VAX_TYPE', 'VAX_MANU', 'VAX_NAME']
+VAX_CATEGORIES = ['VAX_DOSE_SERIES', 'VAX_ROUTE', 'VAX_SITE', 'VAX_LOT']
+TERMS_PER_ROW = 5
+MAX_TEXT = 32000
+
+
+# fitting
+
+def _value(value):
+    if isinstance(value, tuple):
+        return [_value(v) for v in value]
+    return None if pd.isna(value) else value
+
+
+def _distribution(values, top=None):
+    """``{'values': [...], 'weights': [...]}``, blanks as None, most common first."""
+    counts = pd.Series(values).value_counts(dropna=False)
+    if top is not None:
+        counts = counts.head(top)
+    return {'values': [_value(v) for v in counts.index.tolist()],
+            'weights': (counts / counts.sum()).round(8).tolist()}
+
+
+def _quantiles(values):
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return [0.0] * len(QUANTILES)
+    return np.quantile(values, QUANTILES).round(3).tolist()
+
+
+def _numeric(series):
+    return {'missing': float(series.isna().mean()), 'quantiles': _quantiles(series)}
+
+
+def _words(texts, top):
+    words = texts.dropna().str.lower().str.findall(r'[a-z]+').explode().dropna()
+    return _distribution(words, top)
+
+
+def _days(series):
+    return pd.to_datetime(series, format=DATE_FORMAT, errors='coerce')
+
+
+def fit(paths, top_terms=3000, top_words=3000, top_lots=500):
+    """Measure a profile from the DATA, VAX and SYMPTOMS files in ``paths``.
+
+    ``paths`` maps table name to CSV path (``discover(root)[year].paths``);
+    tables that are left out keep the bundled profile's section.
+    """
+    profile = load_profile()
+    profile['source'] = {table: os.path.basename(path) for table, path in paths.items()}
+
+    if 'VAX' in paths:
+        vax = read_source(paths['VAX'], apply_schema=False)
+        profile['columns']['VAX'] = list(vax.columns)
+        covid = (vax['VAX_TYPE'] == 'COVID19').groupby(vax['VAERS_ID']).any()
+        groups = {}
+        for name, ids in (('COVID19', covid.index[covid]), ('OTHER', covid.index[~covid])):
+            rows = vax[vax['VAERS_ID'].isin(ids)]
+            groups[name] = {
+                'rows': _distribution(rows.groupby('VAERS_ID').size()),
+                'products': _distribution(list(rows[VAX_PRODUCT].itertuples(index=False, name=None))),
+                'columns': {c: _distribution(rows[c], top_lots if c == 'VAX_LOT' else None)
+                            for c in VAX_CATEGORIES},
+            }
+        profile['vax'] = {'covid_share': float(covid.mean()), 'groups': groups}
+
+    if 'SYMPTOMS' in paths:
+        symptoms = read_source(paths['SYMPTOMS'], apply_schema=False)
+        profile['columns']['SYMPTOMS'] = list(symptoms.columns)
+        term_columns = [c for c in symptoms.columns if c.startswith('SYMPTOM') and 'VERSION' not in c]
+        per_report = symptoms[term_columns].notna().sum(axis=1).groupby(symptoms['VAERS_ID']).sum()
+        profile['symptoms'] = {
+            'terms_per_report': _distribution(per_report),
+            'terms': _distribution(symptoms[term_columns].stack().dropna(), top_terms),
+            'version': _distribution(symptoms['SYMPTOMVERSION1'].map('{:.2f}'.format)),
+        }
+
+    if 'DATA' in paths:
+        data = read_source(paths['DATA'], apply_schema=False)
+        profile['columns']['DATA'] = list(data.columns)
+        flags = np.zeros(len(data), dtype='int64')
+        for bit, column in enumerate(FLAG_COLUMNS):
+            if column in data.columns:
+                flags |= (data[column] == 'Y').to_numpy().astype('int64') << bit
+        recv, vax_date, onset, died = (_days(data[c]) for c in ('RECVDATE', 'VAX_DATE', 'ONSET_DATE', 'DATEDIED'))
+        hospital = data['HOSPITAL'] == 'Y'
+        profile['data'] = {
+            'flags': _distribution(flags),
+            'categories': {c: _distribution(data[c].astype('Int64' if c == 'FORM_VERS' else object))
+                           for c in CATEGORY_COLUMNS if c in data.columns},
+            'numbers': {'AGE_YRS': _numeric(data['AGE_YRS']), 'CAGE_MO': _numeric(data['CAGE_MO']),
+                        'HOSPDAYS': _numeric(data.loc[hospital, 'HOSPDAYS'])},
+            'text': {c: {'missing': float(data[c].isna().mean()),
+                         'quantiles': _quantiles(data[c].str.len())}
+                     for c in TEXT_COLUMNS if c in data.columns},
+            'words': _words(data['SYMPTOM_TEXT'], top_words),
+            'dates': {
+                'latency': _quantiles((onset - vax_date).dt.days.clip(lower=0)),
+                'lag': _quantiles((recv - onset).dt.days.clip(lower=0)),
+                'died': _quantiles((died - onset).dt.days.clip(lower=0)),
+                'missing': {c: float(data[c].isna().mean()) for c in
+                            ('VAX_DATE', 'ONSET_DATE', 'RPT_DATE', 'TODAYS_DATE')},
+                'died_missing': float(died[data['DIED'] == 'Y'].isna().mean()),
+            },
+        }
+    return profile
+
+
+def load_profile(path=DEFAULT_PROFILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_profile(profile, path):
+    with open(path, 'w') as f:
+        # compact: with indentation the fitted distributions run to some 15k lines
+        json.dump(profile, f, separators=(',', ':'))
+        f.write('\n')
+    return path
+
+
+# generation
+
+def _sample(rng, distribution, size):
+    values = np.empty(len(distribution['values']), dtype=object)
+    for i, value in enumerate(distribution['values']):
+        values[i] = tuple(value) if isinstance(value, list) else value
+    weights = np.asarray(distribution['weights'], dtype='float64')
+    return values[rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+
+def _from_quantiles(rng, quantiles, size):
+    """Draws from the piecewise linear distribution through ``quantiles``."""
+    return np.interp(rng.random(size), QUANTILES, quantiles)
+
+
+def _blank(rng, values, missing):
+    values = values.astype(object)
+    values[rng.random(len(values)) < missing] = None
+    return values
+
+
+def _text(rng, words, lengths):
+    """Strings of about ``lengths`` characters made of ``words``."""
+    vocabulary = np.array([str(w) for w in words['values']], dtype=object)
+    sizes = np.array([len(w) + 1 for w in vocabulary])
+    weights = np.asarray(words['weights'], dtype='float64')
+    weights = weights / weights.sum()
+    counts = np.maximum(np.rint(lengths / np.dot(sizes, weights)).astype('int64'), 1)
+    drawn = rng.choice(len(vocabulary), size=int(counts.sum()), p=weights)
+
+    # join everything once, then cut it at the word boundaries of each row
+    text = ' '.join(vocabulary[drawn]) + ' '
+    stops = np.cumsum(sizes[drawn])[np.cumsum(counts) - 1]
+    starts = np.concatenate([[0], stops[:-1]])
+    return np.array([text[a:b - 1] for a, b in zip(starts.tolist(), stops.tolist())], dtype=object)
+
+
+def _format_dates(days):
+    """Day numbers (since 1970) as MM/DD/YYYY strings, NaN as None."""
+    out = np.full(len(days), None, dtype=object)
+    known = ~np.isnan(days)
+    if known.any():
+        values = days[known].astype('int64')
+        lo = values.min()
+        # only a few thousand distinct days: format each once
+        table = pd.to_datetime(np.arange(lo, values.max() + 1), unit='D').strftime(DATE_FORMAT).to_numpy()
+        out[known] = table[values - lo]
+    return out
+
+
+def _data(rng, profile, ids, year):
+    spec = profile['data']
+    n = len(ids)
+    columns = {'VAERS_ID': ids}
+
+    flags = _sample(rng, spec['flags'], n).astype('int64')
+    for bit, column in enumerate(FLAG_COLUMNS):
+        columns[column] = np.where((flags >> bit) & 1, 'Y', None)
+    died = columns['DIED'] == 'Y'
+    hospital = columns['HOSPITAL'] == 'Y'
+
+    dates = spec['dates']
+    first = (np.datetime64('{}-01-01'.format(year)) - np.datetime64('1970-01-01')).astype('int64')
+    recv = first + rng.integers(0, 365, n).astype('float64')
+    onset = recv - np.floor(_from_quantiles(rng, dates['lag'], n))
+    vax_date = onset - np.floor(_from_quantiles(rng, dates['latency'], n))
+    died_on = onset + np.floor(_from_quantiles(rng, dates['died'], n))
+    died_on[~died | (rng.random(n) < dates['died_missing'])] = np.nan
+    numdays = onset - vax_date
+    for column, values in (('VAX_DATE', vax_date), ('ONSET_DATE', onset)):
+        values[rng.random(n) < dates['missing'][column]] = np.nan
+    numdays[np.isnan(vax_date) | np.isnan(onset)] = np.nan
+    today = recv.copy()
+    today[rng.random(n) < dates['missing']['TODAYS_DATE']] = np.nan
+    report = recv.copy()
+    report[rng.random(n) < dates['missing']['RPT_DATE']] = np.nan
+    columns.update(RECVDATE=_format_dates(recv), VAX_DATE=_format_dates(vax_date),
+                   ONSET_DATE=_format_dates(onset), DATEDIED=_format_dates(died_on),
+                   TODAYS_DATE=_format_dates(today), RPT_DATE=_format_dates(report), NUMDAYS=numdays)
+
+    for column, distribution in spec['categories'].items():
+        columns[column] = _sample(rng, distribution, n)
+
+    numbers = spec['numbers']
+    age = np.round(_from_quantiles(rng, numbers['AGE_YRS']['quantiles'], n), 1)
+    age[rng.random(n) < numbers['AGE_YRS']['missing']] = np.nan
+    columns['AGE_YRS'] = age
+    columns['CAGE_YR'] = np.floor(age)
+    months = np.round(_from_quantiles(rng, numbers['CAGE_MO']['quantiles'], n), 1)
+    months[rng.random(n) < numbers['CAGE_MO']['missing']] = np.nan
+    columns['CAGE_MO'] = months
+    hospdays = np.round(_from_quantiles(rng, numbers['HOSPDAYS']['quantiles'], n))
+    hospdays[~hospital | (rng.random(n) < numbers['HOSPDAYS']['missing'])] = np.nan
+    columns['HOSPDAYS'] = hospdays
+
+    for column, text in spec['text'].items():
+        lengths = np.clip(_from_quantiles(rng, text['quantiles'], n), 1, MAX_TEXT)
+        present = rng.random(n) >= text['missing']
+        values = np.full(n, None, dtype=object)
+        values[present] = _text(rng, spec['words'], lengths[present])
+        columns[column] = values
+
+    return pd.DataFrame(columns).reindex(columns=profile['columns']['DATA'])
+
+
+def _vax(rng, profile, ids):
+    spec = profile['vax']
+    covid = rng.random(len(ids)) < spec['covid_share']
+    frames = []
+    for name, members in (('COVID19', ids[covid]), ('OTHER', ids[~covid])):
+        group = spec['groups'][name]
+        rows = np.repeat(members, _sample(rng, group['rows'], len(members)).astype('int64'))
+        products = np.array(list(_sample(rng, group['products'], len(rows))), dtype=object).reshape(-1, 3)
+        frame = pd.DataFrame({'VAERS_ID': rows})
+        for j, column in enumerate(VAX_PRODUCT):
+            frame[column] = products[:, j]
+        for column, distribution in group['columns'].items():
+            frame[column] = _sample(rng, distribution, len(rows))
+        frames.append(frame)
+    vax = pd.concat(frames, ignore_index=True).sort_values('VAERS_ID', kind='stable')
+    return vax.reindex(columns=profile['columns']['VAX'])
+
+
+def _symptoms(rng, profile, ids):
+    spec = profile['symptoms']
+    per_report = _sample(rng, spec['terms_per_report'], len(ids)).astype('int64')
+    rows = np.maximum(-(-per_report // TERMS_PER_ROW), 1)
+    row_ids = np.repeat(ids, rows)
+    # terms left for each row: 5 for every row but a report's last one
+    first_row = np.repeat(np.cumsum(rows) - rows, rows)
+    position = np.arange(len(row_ids)) - first_row
+    filled = np.clip(np.repeat(per_report, rows) - position * TERMS_PER_ROW, 0, TERMS_PER_ROW)
+
+    frame = pd.DataFrame({'VAERS_ID': row_ids})
+    versions = np.repeat(_sample(rng, spec['version'], len(ids)), rows)
+    terms = _sample(rng, spec['terms'], len(row_ids) * TERMS_PER_ROW).reshape(-1, TERMS_PER_ROW)
+    for j in range(TERMS_PER_ROW):
+        present = filled > j
+        frame['SYMPTOM{}'.format(j + 1)] = np.where(present, terms[:, j], None)
+        frame['SYMPTOMVERSION{}'.format(j + 1)] = np.where(present, versions, None)
+    return frame.reindex(columns=profile['columns']['SYMPTOMS'])
+
+
+def generate(n, year=2021, profile=None, seed=0, first_id=FIRST_ID, chunk=CHUNK):
+    """Yield ``{'DATA': ..., 'VAX': ..., 'SYMPTOMS': ...}`` frames for ``n`` reports, a chunk at a time."""
+    profile = load_profile() if profile is None else profile
+    starts = range(0, n, chunk)
+    for start, child in zip(starts, np.random.SeedSequence(seed).spawn(len(starts))):
+        rng = np.random.default_rng(child)
+        ids = np.arange(first_id + start, first_id + min(start + chunk, n), dtype='int64')
+        yield {'DATA': _data(rng, profile, ids, year), 'VAX': _vax(rng, profile, ids),
+               'SYMPTOMS': _symptoms(rng, profile, ids)}
+
+
+def _write_csv(frame, path, append):
+    if pacsv is None:
+        frame.to_csv(path, mode='a' if append else 'w', header=not append, index=False, encoding='latin1')
+        return
+    buffer = io.BytesIO()
+    if not append:
+        buffer.write((','.join(frame.columns) + '\n').encode())
+    pacsv.write_csv(pa.Table.from_pandas(frame, preserve_index=False), buffer,
+                    pacsv.WriteOptions(include_header=False, quoting_style='needed'))
+    # arrow writes UTF-8, the VAERS files are latin1
+    with open(path, 'ab' if append else 'wb') as f:
+        f.write(buffer.getvalue().decode('utf-8').encode('latin1', errors='replace'))
+
+
+def write(out_dir, n, year=2021, profile=None, seed=0, first_id=FIRST_ID, chunk=CHUNK, log=None):
+    """Write ``n`` synthetic reports to ``out_dir/{year}VAERSData``; returns the paths.
+
+    The reports get VAERS_IDs ``first_id`` to ``first_id + n - 1``; when
+    writing several years, start each one after the last ID of the year
+    before (as :func:`main` does) or the dedupe step merges them.
+    """
+    folder = os.path.join(out_dir, '{}VAERSData'.format(year))
+    os.makedirs(folder, exist_ok=True)
+    paths = {table: os.path.join(folder, '{}VAERS{}.csv'.format(year, table))
+             for table in ('DATA', 'SYMPTOMS', 'VAX')}
+    written = 0
+    for i, tables in enumerate(generate(n, year, profile, seed, first_id, chunk)):
+        for table, frame in tables.items():
+            _write_csv(frame, paths[table], append=i > 0)
+        written += len(tables['DATA'])
+        if log is not None:
+            log('{:,} / {:,} reports'.format(written, n))
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic VAERS drop, or fit a profile.')
+    parser.add_argument('--out', help='folder to write {YEAR}VAERSData into')
+    parser.add_argument('--reports', type=int, default=SIZES[0], help='reports to write (default: %(default)s)')
+    parser.add_argument('--years', type=int, nargs='+', default=[2021],
+                        help='one folder of --reports reports per year (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--first-id', type=int, default=FIRST_ID,
+                        help='VAERS_ID of the first report; later years carry on from the last one')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, help='profile to read, or to write with --fit')
+    parser.add_argument('--fit', metavar='ROOT', help='fit --profile from the real VAERS files under ROOT')
+    args = parser.parse_args(argv)
+
+    if args.fit:
+        year = max(discover(args.fit))
+        save_profile(fit(discover(args.fit, [year])[year].paths), args.profile)
+        print('wrote', args.profile)
+    if args.out:
+        profile = load_profile(args.profile)
+        for i, year in enumerate(args.years):
+            # years get their own IDs and draws, like the real drops
+            write(args.out, args.reports, year, profile, args.seed + i,
+                  args.first_id + i * args.reports, log=print)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""Daily report series, rolling windows and onset latency.
+
+The reports carry RECVDATE, VAX_DATE, ONSET_DATE and DATEDIED (In[8]), but
+the notebook never uses them. Resampling a frame of dates per chart is slow
+on millions of rows. Here every date is turned once into an int32 day offset
+from ``EPOCH``. After that:
+
+- a daily series is one ``np.bincount`` over the offsets,
+- a 7 or 28 day rolling sum is a difference of two cumulative sums,
+- a latency (ONSET_DATE - VAX_DATE) is a subtraction, and its distribution
+  per manufacturer and dose is one more bincount.
+
+:class:`DailyCounts` only stores one row of counts per day, so it can be
+extended as new weeks of reports arrive (:meth:`DailyCounts.add`).
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from .cohorts import COHORTS, flag_mask
+from .cube import REPORTS, _codes
+from .schema import convert
+
+# VAERS started in 1990; 1990-01-01 is a Monday, so day // 7 gives Monday weeks
+EPOCH = np.datetime64('1990-01-01', 'D')
+MISSING = np.iinfo('int32').min
+
+DATE_COLUMNS = ('RECVDATE', 'VAX_DATE', 'ONSET_DATE', 'DATEDIED')
+MEASURES = tuple(flag for flag in COHORTS.values() if flag is not None)
+WINDOWS = (7, 28)
+LATENCY_DAYS = 120
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def days(series):
+    """Days since ``EPOCH`` as int32, ``MISSING`` for blank or unparsable dates.
+
+    Text is parsed with the fixed VAERS format; columns the schema already
+    parsed are only converted.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = convert(series, 'date')
+    values = series.to_numpy(dtype='datetime64[D]')
+    offsets = np.full(len(values), MISSING, dtype='int32')
+    known = ~np.isnat(values)
+    offsets[known] = (values[known] - EPOCH).astype('int32')
+    return offsets
+
+
+def day_offsets(df, columns=DATE_COLUMNS):
+    """:func:`days` for each date column of ``df`` present, as one int32 frame."""
+    return pd.DataFrame({c: days(df[c]) for c in columns if c in df.columns}, index=df.index)
+
+
+def dates(offsets):
+    """Day offsets back to a DatetimeIndex."""
+    return pd.DatetimeIndex(EPOCH + np.asarray(offsets, dtype='int64'), name='DATE')
+
+
+def interval(start, end):
+    """``end - start`` in days, ``MISSING`` where either date is missing."""
+    start, end = np.asarray(start, dtype='int32'), np.asarray(end, dtype='int32')
+    out = end - start
+    out[(start == MISSING) | (end == MISSING)] = MISSING
+    return out
+
+
+class DailyCounts(object):
+    """Reports and outcome counts per day, from day ``start`` on.
+
+    ``counts`` has one row per day and one column per measure, the first of
+    which is always ``REPORTS``. Days without reports are rows of zeros.
+    """
+
+    def __init__(self, start, counts, measures):
+        self.start = int(start)
+        self.counts = counts
+        self.measures = list(measures)
+
+    @classmethod
+    def empty(cls, measures=MEASURES):
+        return cls(0, np.zeros((0, len(measures) + 1), dtype='int64'), [REPORTS] + list(measures))
+
+    @classmethod
+    def from_frame(cls, df, date='RECVDATE', measures=MEASURES, offsets=None):
+        """Count the reports of ``df`` per ``date``; pass ``offsets`` if already computed."""
+        offsets = days(df[date]) if offsets is None else np.asarray(offsets)
+        known = offsets != MISSING
+        if not known.any():
+            return cls.empty(measures)
+        start = int(offsets[known].min())
+        cells = offsets[known] - start
+        length = int(cells.max()) + 1
+
+        counts = np.empty((length, len(measures) + 1), dtype='int64')
+        counts[:, 0] = np.bincount(cells, minlength=length)
+        for j, measure in enumerate(measures, 1):
+            counts[:, j] = np.bincount(cells[flag_mask(df[measure])[known]], minlength=length)
+        return cls(start, counts, [REPORTS] + list(measures))
+
+    @classmethod
+    def from_table(cls, table):
+        """From a frame indexed by date (or ISO date strings) with one column per measure."""
+        if not len(table):
+            return cls.empty(table.columns[1:])
+        offsets = days(pd.Series(pd.to_datetime(table.index, format='%Y-%m-%d')))
+        start = int(offsets.min())
+        counts = np.zeros((int(offsets.max()) - start + 1, len(table.columns)), dtype='int64')
+        counts[offsets - start] = table.to_numpy(dtype='int64')
+        return cls(start, counts, table.columns)
+
+    @property
+    def stop(self):
+        return self.start + len(self.counts)
+
+    def _combine(self, other, sign):
+        if list(other.measures) != self.measures:
+            raise ValueError('measures differ: {} vs {}'.format(self.measures, other.measures))
+        if not len(other.counts):
+            return self
+        if not len(self.counts):
+            return DailyCounts(other.start, sign * other.counts, self.measures)
+        start, stop = min(self.start, other.start), max(self.stop, other.stop)
+        counts = np.zeros((stop - start, len(self.measures)), dtype='int64')
+        counts[self.start - start:self.stop - start] = self.counts
+        counts[other.start - start:other.stop - start] += sign * other.counts
+        return DailyCounts(start, counts, self.measures)
+
+    def add(self, other):
+        """Counts with ``other`` added, e.g. this week's new reports."""
+        return self._combine(other, 1)
+
+    def subtract(self, other):
+        """Counts with ``other`` taken out, e.g. reports edited or withdrawn."""
+        return self._combine(other, -1)
+
+    def rolling(self, window):
+        """Trailing ``window`` day sums for every day (days before ``start`` count as 0)."""
+        totals = np.cumsum(self.counts, axis=0)
+        rolled = totals.copy()
+        rolled[window:] -= totals[:-window]
+        return rolled
+
+    def weekly(self):
+        """Counts per Monday-to-Sunday week, indexed by the Monday."""
+        weeks = np.arange(self.start, self.stop) // 7
+        first = weeks[0] if len(weeks) else 0
+        # reduceat sums the rows between the first day of consecutive weeks
+        starts = np.flatnonzero(np.diff(weeks, prepend=first - 1))
+        counts = np.add.reduceat(self.counts, starts, axis=0) if len(starts) else self.counts
+        return pd.DataFrame(counts, index=dates(np.unique(weeks) * 7), columns=self.measures)
+
+    def to_frame(self, windows=WINDOWS):
+        """One row per day with the counts and their ``<measure>_<n>D`` rolling sums."""
+        frame = pd.DataFrame(self.counts, index=dates(np.arange(self.start, self.stop)),
+                             columns=self.measures)
+        for window in windows:
+            rolled = self.rolling(window)
+            for j, measure in enumerate(self.measures):
+                frame['{}_{}D'.format(measure, window)] = rolled[:, j]
+        return frame
+
+    def save(self, path):
+        meta = {'start': self.start, 'measures': self.measures}
+        np.savez_compressed(path, counts=self.counts, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            counts = data['counts']
+        return cls(meta['start'], counts, meta['measures'])
+
+
+def latency_histogram(df, by=('VAX_MANU', 'VAX_DOSE_SERIES'), start='VAX_DATE', end='ONSET_DATE',
+                      max_days=LATENCY_DAYS, offsets=None):
+    """Reports per number of days from ``start`` to ``end`` for each group of ``by``.
+
+    Columns are 0 to ``max_days``; the last one holds ``max_days`` or more.
+    Negative or missing intervals (onset before vaccination, blank dates)
+    are left out. Only groups with at least one report are returned.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    if offsets is None:
+        offsets = day_offsets(df, [start, end])
+    gaps = interval(offsets[start].to_numpy(), offsets[end].to_numpy())
+    kept = (gaps != MISSING) & (gaps >= 0)
+
+    codes, labels = zip(*[_codes(df[c]) for c in by])
+    shape = tuple(len(l) for l in labels)
+    groups = np.ravel_multi_index([c[kept] for c in codes], shape)
+    bins = max_days + 1
+    cells = groups * bins + np.minimum(gaps[kept], max_days)
+    counts = np.bincount(cells, minlength=int(np.prod(shape)) * bins).reshape(-1, bins)
+
+    if len(by) == 1:
+        index = labels[0]
+    else:
+        index = pd.MultiIndex.from_product(labels)
+    table = pd.DataFrame(counts, index=index, columns=pd.RangeIndex(bins, name='DAYS'))
+    return table[counts.sum(axis=1) > 0]
+
+
+def histogram_quantiles(histogram, quantiles=QUANTILES):
+    """Count and day quantiles per row of a :func:`latency_histogram`.
+
+    A quantile ``q`` is the first day by which at least ``q`` of the group's
+    reports are counted.
+    """
+    counts = histogram.to_numpy()
+    totals = np.cumsum(counts, axis=1)
+    n = totals[:, -1]
+    table = pd.DataFrame({'N': n}, index=histogram.index)
+    for q in quantiles:
+        table['P{:g}'.format(q * 100)] = (totals < (q * n)[:, None]).sum(axis=1)
+    return table
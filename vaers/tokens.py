@@ -0,0 +1,162 @@
+"""Word counts over SYMPTOM_TEXT (or any text column) for any subset of reports.
+
+The text is tokenized once into a sparse document-term matrix: one row per
+report, one column per distinct word. Word counts for a cohort (hospitalized,
+died, an age bracket, a manufacturer, ...) are then the column sums over that
+cohort's rows, without tokenizing anything again. Only the vocabulary is kept
+as Python strings; the per-report counts live in flat integer arrays.
+
+:func:`ascii_words` is a faster, vectorized tokenizer for the stages that
+only need the words in order (near-duplicates, phrases): ASCII letters and
+digits only, lower-cased, without building a matrix.
+"""
+
+import collections
+import re
+from array import array
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - the slower pandas tokenizer is used
+    pa = pc = None
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# ASCII word characters, the same for the arrow and the pandas tokenizer
+SEPARATOR = r'[^0-9a-z_]+'
+
+
+class TokenMatrix(object):
+    """Sparse report x word count matrix plus its vocabulary."""
+
+    def __init__(self, matrix, vocabulary):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+
+    @classmethod
+    def from_texts(cls, texts, pattern=TOKEN_PATTERN):
+        """Tokenize an iterable of strings; missing values become empty rows."""
+        vocabulary = {}
+        indptr = array('q', [0])
+        indices = array('i')
+        data = array('i')
+        for text in texts:
+            if isinstance(text, str):
+                for token, count in collections.Counter(pattern.findall(text)).items():
+                    indices.append(vocabulary.setdefault(token, len(vocabulary)))
+                    data.append(count)
+            indptr.append(len(indices))
+
+        shape = (len(indptr) - 1, len(vocabulary))
+        matrix = sparse.csr_matrix((np.frombuffer(data, dtype=np.int32),
+                                    np.frombuffer(indices, dtype=np.int32),
+                                    np.frombuffer(indptr, dtype=np.int64)), shape=shape)
+        words = np.empty(len(vocabulary), dtype=object)
+        for token, index in vocabulary.items():
+            words[index] = token
+        return cls(matrix, words)
+
+    @classmethod
+    def from_series(cls, series, pattern=TOKEN_PATTERN):
+        return cls.from_texts(series, pattern)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def rows(self, mask=None):
+        """Rows selected by a boolean mask (or positions); all rows if None."""
+        if mask is None:
+            return self.matrix
+        mask = np.asarray(mask)
+        if mask.dtype == bool:
+            mask = np.flatnonzero(mask)
+        return self.matrix[mask]
+
+    def counts(self, mask=None, exclude=None, min_count=1):
+        """Word frequencies for the selected rows, most frequent first.
+
+        ``exclude`` is an optional collection of words (e.g. stopwords) to
+        leave out of the result.
+        """
+        totals = np.asarray(self.rows(mask).sum(axis=0)).ravel()
+        keep = totals >= min_count
+        if exclude:
+            keep &= ~np.isin(self.vocabulary, list(exclude))
+        series = pd.Series(totals[keep], index=self.vocabulary[keep])
+        return series.sort_values(ascending=False, kind='stable')
+
+    def document_counts(self, mask=None):
+        """Number of selected reports each word appears in."""
+        rows = self.rows(mask)
+        totals = np.bincount(rows.indices, minlength=rows.shape[1])
+        return pd.Series(totals, index=self.vocabulary)
+
+
+def word_counts(series, mask=None, exclude=None):
+    """One-off word frequencies for a text column."""
+    return TokenMatrix.from_series(series).counts(mask, exclude)
+
+
+def _byte_table():
+    """Byte -> byte map: ASCII letters lower-cased, digits and '_' kept, anything else a space."""
+    table = np.full(256, ord(' '), dtype='uint8')
+    for c in '0123456789_abcdefghijklmnopqrstuvwxyz':
+        table[ord(c)] = ord(c)
+    for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+        table[ord(c)] = ord(c.lower())
+    return table
+
+
+_BYTES = _byte_table()
+
+
+def ascii_words(texts):
+    """The lower-cased ASCII words of all texts, in order.
+
+    Returns ``(vocabulary, codes, lengths)``: the words of all texts one
+    after the other are ``vocabulary[codes]``, and text ``i`` has
+    ``lengths[i]`` of them. Missing texts have none.
+    """
+    if pa is None:
+        words = pd.Series(texts, dtype=object).str.lower().str.replace(SEPARATOR, ' ', regex=True).str.split()
+        lengths = words.str.len().fillna(0).to_numpy(dtype='int64')
+        codes, vocabulary = pd.factorize(words[lengths > 0].explode().to_numpy(dtype=object))
+        return np.asarray(vocabulary, dtype=object), codes.astype('int64'), lengths
+
+    if isinstance(texts, (pa.Array, pa.ChunkedArray)):
+        array = texts.cast(pa.large_string())
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+    else:
+        array = pa.array(pd.Series(texts, dtype=object), type=pa.large_string(), from_pandas=True)
+    if not len(array):
+        return np.empty(0, dtype=object), np.empty(0, dtype='int64'), np.zeros(0, dtype='int64')
+    _, offsets, data = array.buffers()
+    # only the bytes of this array, which may be a slice of a larger (shared) one
+    offsets = np.frombuffer(offsets, dtype='int64')[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(data, dtype='uint8')[offsets[0]:offsets[-1]] if data is not None else np.empty(0, 'uint8')
+    validity = pc.is_valid(array).buffers()[1] if array.null_count else None
+    # every byte of a multi-byte character maps to a space, so the result is still valid UTF-8
+    array = pa.LargeStringArray.from_buffers(len(array), pa.py_buffer(offsets - offsets[0]),
+                                             pa.py_buffer(_BYTES[data]), validity, array.null_count)
+    words = pc.ascii_split_whitespace(array)
+    flat = pc.list_flatten(words)
+    parents = pc.list_parent_indices(words).to_numpy()
+    kept = pc.greater(pc.binary_length(flat), 0)
+    encoded = pc.dictionary_encode(flat.filter(kept))
+    vocabulary = encoded.dictionary.to_numpy(zero_copy_only=False)
+    codes = encoded.indices.to_numpy(zero_copy_only=False).astype('int64')
+    lengths = np.bincount(parents[kept.to_numpy(zero_copy_only=False)], minlength=len(array)).astype('int64')
+    return vocabulary, codes, lengths
+
+
+def word_hashes(texts):
+    """64 bit hashes of the words of all texts in a row (every distinct word hashed once)."""
+    vocabulary, codes, lengths = ascii_words(texts)
+    if not len(vocabulary):
+        return np.empty(0, dtype='uint64'), lengths
+    return pd.util.hash_array(vocabulary)[codes], lengths
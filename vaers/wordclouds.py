@@ -0,0 +1,100 @@
+"""Word clouds for the report cohorts, rendered straight to PNG files.
+
+The stopwords are read once from ``data/stopwords.json`` (plus wordcloud's
+own English list when it's installed). Instead of joining a whole column
+into one string and letting WordCloud re-tokenize it, the clouds are fed
+word counts from a :class:`vaers.tokens.TokenMatrix`. All the cohort clouds
+are rendered in one batch on a process pool.
+"""
+
+import functools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .cohorts import COHORTS, cohort_mask
+from .tokens import TokenMatrix
+
+try:
+    from wordcloud import STOPWORDS as _WORDCLOUD_STOPWORDS
+except ImportError:  # pragma: no cover
+    _WORDCLOUD_STOPWORDS = frozenset()
+
+STOPWORDS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'stopwords.json')
+
+# (name, text column, cohort) for each cloud the notebook draws
+CLOUDS = [
+    ('all_symptoms', 'SYMPTOM_TEXT', 'all'),
+    ('hospitalized_history', 'HISTORY', 'hospitalized'),
+    ('died_history', 'HISTORY', 'died'),
+]
+
+# WordCloud only draws max_words (200 by default), so there's no need to
+# ship the long tail of the vocabulary to the worker processes.
+MAX_FREQUENCIES = 2000
+
+
+@functools.lru_cache(maxsize=None)
+def stopwords(column=None, cloud=None, path=STOPWORDS_FILE):
+    """The shared stopword set, plus the extras listed for ``column`` and for ``cloud``.
+
+    The notebook drops 'conditions', 'concurrent' and 'disease' from the
+    hospitalized HISTORY cloud only, so those sit under the cloud's name.
+    """
+    with open(path) as f:
+        lists = json.load(f)
+    words = set(_WORDCLOUD_STOPWORDS)
+    words.update(lists['common'])
+    for key in (column, cloud):
+        if key is not None:
+            words.update(lists.get(key, []))
+    return frozenset(words)
+
+
+def render(frequencies, path, width=1200, height=1000, background_color='white'):
+    """Draw one cloud from a ``{word: count}`` dict and save it as a PNG."""
+    from wordcloud import WordCloud
+
+    cloud = WordCloud(background_color=background_color, width=width, height=height)
+    cloud.generate_from_frequencies(frequencies)
+    cloud.to_file(path)
+    return path
+
+
+def cloud_frequencies(df, clouds=CLOUDS, cohorts=COHORTS, matrices=None,
+                      limit=MAX_FREQUENCIES):
+    """Return ``{name: {word: count}}`` for each cloud, tokenizing each column once.
+
+    ``matrices`` can hold already-built ``{column: TokenMatrix}`` to reuse.
+    Stopwords are matched exactly, so ``df`` should already be lower-cased
+    by :func:`vaers.normalize.normalize`.
+    """
+    matrices = dict(matrices or {})
+    frequencies = {}
+    for name, column, cohort in clouds:
+        if column not in matrices:
+            matrices[column] = TokenMatrix.from_series(df[column])
+        counts = matrices[column].counts(cohort_mask(df, cohort, cohorts),
+                                         exclude=stopwords(column, name))
+        frequencies[name] = counts.head(limit).to_dict()
+    return frequencies
+
+
+def render_clouds(df, out_dir, clouds=CLOUDS, cohorts=COHORTS, matrices=None,
+                  workers=None, **kwargs):
+    """Render every cloud in ``clouds`` to ``out_dir/<name>.png``.
+
+    Returns ``{name: path}``. Clouds with no words left after removing the
+    stopwords are skipped.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    frequencies = cloud_frequencies(df, clouds, cohorts, matrices)
+    jobs = {name: (freq, os.path.join(out_dir, name + '.png'))
+            for name, freq in frequencies.items() if freq}
+
+    if workers == 1 or len(jobs) <= 1:
+        return {name: render(freq, path, **kwargs) for name, (freq, path) in jobs.items()}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(render, freq, path, **kwargs)
+                   for name, (freq, path) in jobs.items()}
+        return {name: future.result() for name, future in futures.items()}